@@ -6,10 +6,16 @@ found data. Once this is done, the data, which will contain all the hits from
 all of the found .csv files in a directory, is then written to one .csv file
 thereby merging all of the found data in all of the found .csv files into
 one .csv file.
+
+Each file is loaded once into a Table (see Table.py), so searching its rows
+or columns looks the item up in the table's index instead of splitting and
+lowercasing every line again.
 """
 import csv
 import os
 
+from Table import Table
+
 
 def get_filenames(exclude, directory=".", file_extension=".csv"):
     """Get filenames with file_extension from directory - exclude.
@@ -50,11 +56,39 @@ def get_lines(filenames):
     return lines
 
 
+def get_tables(filenames):
+    """Get a Table of each file in filenames.
+
+    Args:
+        filenames (list): Names of .csv files to load.
+
+    Returns:
+        list: Contains a Table of each file.
+    """
+    return [Table.from_file(filename) for filename in filenames]
+
+
+def get_table(sheet, separator=None):
+    """Get sheet as a Table.
+
+    Args:
+        sheet (Table; list): Table, or lines from a spreadsheet.
+        separator (None; str): Column separator of lines (default: sniffed).
+
+    Returns:
+        Table: The sheet.
+    """
+    if isinstance(sheet, Table):
+        return sheet
+    return Table.from_lines(sheet, separator)
+
+
 def row_column_selector(sheets, item_to_find, rows=False, columns=False):
     """Switch between different parser functions for rows or columns.
 
    Args:
-        sheets (list): Contains sheets to be parsed.
+        sheets (list): Contains sheets (Tables, or lists of lines) to be
+            parsed.
         item_to_find (str): Item to find in sheets.
         rows (bool): If True, sheets are parsed by rows.
         columns (bool): If True, sheets are parsed by columns.
@@ -76,57 +110,46 @@ def row_column_selector(sheets, item_to_find, rows=False, columns=False):
     return parsed_sheets
 
 
-def parse_sheet_rows(sheet, item_to_find, separator=","):
+def parse_sheet_rows(sheet, item_to_find, separator=None):
     """Parse sheet rows to find an item.
 
     Args:
-        sheet (list): Contains rows from a spreadsheet.
+        sheet (Table; list): Table, or rows (lines) from a spreadsheet.
         item_to_find (str): Item to find in sheet.
-        separator (str): Split row by this symbol.
+        separator (None; str): Column separator of lines (default:
+            sniffed).
 
     Returns:
-        list: Contains all item_to_find rows in sheet.
+        list: Contains the cells of all item_to_find rows in sheet.
     """
+    table = get_table(sheet, separator)
     found_items = []
 
-    for row in sheet:
-        # Solves for different column separators
-        separator = separator if separator in row else ";"
-        row = row.split(separator)
-        row = [cell.strip("\n").lower() for cell in row]
-
-        if item_to_find.lower() in row:
-            for cell in row:
-                found_items.append(cell)
+    for row in table.rows_with(item_to_find):
+        found_items.extend(table.row(row))
 
     return found_items
 
 
-def parse_sheet_columns(sheet, item_to_find, separator=","):
+def parse_sheet_columns(sheet, item_to_find, separator=None):
     """Parse sheet columns to find an item.
 
+    The column is the one item_to_find is first found in, row by row; its
+    first cell (the header) is left out.
+
     Args:
-        sheet (list): Contains rows from a spreadsheet.
+        sheet (Table; list): Table, or rows (lines) from a spreadsheet.
         item_to_find (str): Item to find in sheet.
-        separator (str): Split row by this symbol.
+        separator (None; str): Column separator of lines (default:
+            sniffed).
 
     Returns:
-        list: Contains all item_to_find rows in sheet."""
-    found_items = []
-    index = 0
-
-    for row in sheet:
-        # Solves for different column separators
-        separator = separator if separator in row else ";"
-        row = row.split(separator)
-        row = [cell.strip("\n").lower() for cell in row]
-
-        if not index and item_to_find.lower() in row:
-            index = row.index(item_to_find)
-
-        found_items.append(row[index])
+        list: Contains all cells of the item_to_find column in sheet."""
+    table = get_table(sheet, separator)
+    found = table.find(item_to_find)
+    index = found[1] if found else 0
 
-    return found_items[1:]
+    return table.column(index)[1:]
 
 
 def get_unique_cells(parsed_sheets):
@@ -195,9 +218,9 @@ def main():
     output_filename = "parsed_csv_files.csv"
     item_to_find = "t"
 
-    # Get dirty data
+    # Get dirty data (each file is loaded once into a Table)
     filenames = get_filenames(output_filename)
-    sheets = get_lines(filenames)
+    sheets = get_tables(filenames)
 
     # Clean data from either rows or columns (set rows or columns to True)
     parsed_sheets = row_column_selector(sheets, item_to_find, columns=True)
@@ -0,0 +1,208 @@
+# Table - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""Table holds a .csv sheet in memory, column by column, for searching.
+
+The sheet is read once with the csv module, in the dialect (separator,
+quoting) sniffed from its start. Cells are lowercased once and dictionary
+encoded: each distinct value is stored once, and each column is an
+array of value codes (array('L')). A sheet with many repeated values
+(categories, flags, blanks) takes far less memory than a list of strings
+per row; a sheet of mostly unique values takes somewhat more, since every
+value also has an entry in the code dictionary.
+
+While the sheet is read, every value also records the rows it occurs in,
+so finding the rows or the column of a value is a lookup rather than a
+scan of every cell. Most values of a large sheet occur in one row only,
+so only the first row of each value is kept (in one flat array); a value
+gets its own array of rows once it is seen in a second row.
+
+Rows keep their own length; cells past the end of a short row read as ''.
+"""
+from array import array
+import csv
+from itertools import chain
+
+
+class Table:
+    """Class for Table."""
+
+    def __init__(self, rows=()):
+        """Initialize class variables and load rows.
+
+        Args:
+            rows (iterable): Rows as lists of cells.
+        """
+        # Distinct lowercase cell values, and the code of each
+        self.values = [""]
+        self.codes = {"": 0}
+        # Code of each cell, per column; and the length of each row
+        self.columns = []
+        self.lengths = array("L")
+        # Code -> first row the value occurs in; and code -> rows (ascending,
+        # no repeats) of values that occur in more than one row
+        self.first = array("L", [0])
+        self.index = {0: array("L")}
+
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        """Get the number of rows.
+
+        Returns:
+            int: Number of rows.
+        """
+        return len(self.lengths)
+
+    @classmethod
+    def from_file(cls, filename, separator=None):
+        """Load a table from a .csv file.
+
+        Args:
+            filename (str): Name of .csv file to read.
+            separator (None; str): Column separator (default: sniffed).
+
+        Returns:
+            Table: The sheet.
+        """
+        with open(filename, newline="") as f:
+            return cls.from_lines(f, separator)
+
+    @classmethod
+    def from_lines(cls, lines, separator=None, sample_size=65536):
+        """Load a table from the lines of a .csv file.
+
+        Args:
+            lines (iterable): Lines of the sheet (an open file, or a list).
+            separator (None; str): Column separator (default: sniffed).
+            sample_size (int): Characters at the start used for sniffing.
+
+        Returns:
+            Table: The sheet.
+        """
+        lines = iter(lines)
+        sample = []
+        while sum(len(line) for line in sample) < sample_size:
+            line = next(lines, None)
+            if line is None:
+                break
+            sample.append(line)
+
+        dialect = cls.sniff("".join(sample), separator)
+        return cls(csv.reader(chain(sample, lines), dialect))
+
+    @staticmethod
+    def sniff(sample, separator=None):
+        """Get the csv dialect of a sheet from its start.
+
+        Args:
+            sample (str): Start of the sheet.
+            separator (None; str): Column separator, if known.
+
+        Returns:
+            csv.Dialect: Dialect of the sheet.
+        """
+        if separator:
+            class Dialect(csv.excel):
+                delimiter = separator
+            return Dialect
+        try:
+            return csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        except csv.Error:
+            # Too little to go on (e.g. one column); ',' unless only ';'
+            class Dialect(csv.excel):
+                delimiter = "," if "," in sample or ";" not in sample else ";"
+            return Dialect
+
+    def append(self, row):
+        """Add a row at the end of the table.
+
+        Args:
+            row (list): Cells of the row.
+        """
+        number = len(self.lengths)
+        codes, values, columns = self.codes, self.values, self.columns
+        first, index = self.first, self.index
+        while len(columns) < len(row):
+            # A row wider than any before: earlier rows read as ''
+            columns.append(array("L", [0]) * number)
+
+        for column, cell in zip(columns, row):
+            value = cell.lower()
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(values)
+                values.append(value)
+                first.append(number)
+            else:
+                rows = index.get(code)
+                if rows is None:
+                    if first[code] != number:
+                        index[code] = array("L", [first[code], number])
+                elif not rows or rows[-1] != number:
+                    rows.append(number)
+            column.append(code)
+
+        for column in columns[len(row):]:
+            column.append(0)
+        self.lengths.append(len(row))
+
+    def row(self, number):
+        """Get the cells of a row.
+
+        Args:
+            number (int): Row number (from 0).
+
+        Returns:
+            list: Lowercase cells of the row.
+        """
+        return [self.values[self.columns[column][number]]
+                for column in range(self.lengths[number])]
+
+    def column(self, number):
+        """Get the cells of a column.
+
+        Args:
+            number (int): Column number (from 0).
+
+        Returns:
+            list: Lowercase cells of the column ('' for short rows).
+        """
+        if number >= len(self.columns):
+            return [""] * len(self)
+        return [self.values[code] for code in self.columns[number]]
+
+    def rows_with(self, item):
+        """Get the rows that have a cell equal to item.
+
+        Args:
+            item (str): Cell value to find (any case).
+
+        Returns:
+            array: Row numbers, ascending.
+        """
+        code = self.codes.get(item.lower())
+        if code is None:
+            return array("L")
+        rows = self.index.get(code)
+        if rows is None:
+            return array("L", [self.first[code]])
+        return rows
+
+    def find(self, item):
+        """Get the first cell equal to item, row by row.
+
+        Args:
+            item (str): Cell value to find (any case).
+
+        Returns:
+            None; tuple: (row number, column number), or None if no cell
+                is equal to item.
+        """
+        rows = self.rows_with(item)
+        if not rows:
+            return None
+        code = self.codes[item.lower()]
+        number = rows[0]
+        for column in range(self.lengths[number]):
+            if self.columns[column][number] == code:
+                return number, column
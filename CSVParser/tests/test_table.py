@@ -0,0 +1,69 @@
+# test_table - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""Tests for Table: lookups, and memory against plain csv rows."""
+import csv
+import os
+import sys
+import tracemalloc
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from Table import Table
+
+
+def traced(function):
+    """Get the memory held by what function returns.
+
+    Args:
+        function (function): Builds the object to be measured.
+
+    Returns:
+        int: Bytes allocated (and still held) while function ran.
+    """
+    tracemalloc.start()
+    try:
+        # result stays alive until its size is read
+        result = function()
+        return tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+class TestTable(unittest.TestCase):
+    """Class for TestTable."""
+
+    def test_lookups(self):
+        """Rows and first cell of unique, repeated and blank values."""
+        table = Table([["ID", "Name", "Flag"], ["1", "Ann", "yes"],
+                       ["2", "Bob", "yes"], ["3", "yes"], ["4", "", "no"]])
+        self.assertEqual(list(table.rows_with("ann")), [1])
+        self.assertEqual(list(table.rows_with("YES")), [1, 2, 3])
+        self.assertEqual(list(table.rows_with("")), [4])
+        self.assertEqual(list(table.rows_with("missing")), [])
+        self.assertEqual(table.find("Bob"), (2, 1))
+        self.assertEqual(table.find("yes"), (1, 2))
+        self.assertIsNone(table.find("missing"))
+        self.assertEqual(table.row(3), ["3", "yes"])
+        self.assertEqual(table.column(2), ["flag", "yes", "yes", "", "no"])
+
+    def test_unique_values_get_no_array(self):
+        """Only values seen in more than one row get an array of rows."""
+        table = Table([[str(i), "same"] for i in range(1000)])
+        self.assertEqual(sorted(table.values[code] for code in table.index),
+                         ["", "same"])
+        self.assertEqual(list(table.rows_with("999")), [999])
+
+    def test_memory_against_csv_rows(self):
+        """Mostly unique sheets stay near csv rows; repeats are smaller."""
+        unique = ["{},name{},{}@example.com,{}\n".format(i, i, i, i % 7)
+                  for i in range(20000)]
+        repeated = ["{},{},{}\n".format(i % 50, "yes" if i % 3 else "no",
+                                        i % 7) for i in range(20000)]
+        for lines, most in ((unique, 2.0), (repeated, 0.5)):
+            rows = traced(lambda: list(csv.reader(lines)))
+            table = traced(lambda: Table(csv.reader(lines)))
+            self.assertLess(table, rows * most)
+
+
+if __name__ == "__main__":
+    unittest.main()
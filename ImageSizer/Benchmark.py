@@ -0,0 +1,284 @@
+# Benchmark - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""Benchmark downscaling: full decode + LANCZOS against the fast path.
+
+Both paths run over every .jpg / .png image in a directory for each target
+size. The full path decodes the whole image and resizes it with LANCZOS,
+as ImageSizer.run used to; the fast path is ImageSizer.resize (JPEG draft
+decoding, then a box reduction and LANCZOS for the last reducing_gap
+times the size). Results are printed as ms per image for both paths and
+the quality of the fast output against the full one as PSNR (dB; higher
+is closer, above ~40 dB the difference is not visible). Runs whose worst
+PSNR falls below --tolerance are flagged and the exit status is 1.
+
+With --encode, the images are resized once per size and then encoded with
+each policy of ENCODERS instead (see OutputPolicy.py): results are ms per
+image to encode, KB per image written and PSNR against the resized image,
+to pick the trade-off between encode time and bytes served.
+
+Usage:
+    python Benchmark.py corpus [--generate 20] [--sizes 100x50 640x480]
+    python Benchmark.py corpus --encode [--sizes 640x480]
+"""
+import argparse
+from io import BytesIO
+import math
+import os
+import random
+import sys
+import time
+
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageStat
+
+from main import LANCZOS, ImageSizer
+from OutputPolicy import OutputPolicy
+
+# (name, image postfix, policy) of the encoders compared by --encode
+ENCODERS = [
+    ("Pillow default", "jpg", OutputPolicy(jpeg_quality=75, progressive=False,
+                                           optimize=False)),
+    ("q75 optimized", "jpg", OutputPolicy(jpeg_quality=75)),
+    ("q85 optimized", "jpg", OutputPolicy(jpeg_quality=85)),
+    ("q95 optimized", "jpg", OutputPolicy(jpeg_quality=95)),
+    ("level 1", "png", OutputPolicy(png_compress_level=1)),
+    ("level 6", "png", OutputPolicy(png_compress_level=6)),
+    ("level 9", "png", OutputPolicy(png_compress_level=9)),
+    ("optimize", "png", OutputPolicy(png_optimize=True)),
+    ("q80 method 4", "webp", OutputPolicy(webp_quality=80)),
+    ("q80 method 6", "webp", OutputPolicy(webp_quality=80, webp_method=6)),
+    ("lossless", "webp", OutputPolicy(webp_lossless=True)),
+]
+
+
+def generate_corpus(directory, count=20, size=(4000, 3000), seed=0):
+    """Write count synthetic photo-like JPEGs to directory.
+
+    Images are smooth gradients with soft shapes and a little noise, so
+    they scale like photos rather than like pure noise.
+
+    Args:
+        directory (str): Directory to write images to.
+        count (int): Number of images.
+        size (tuple): Size of each image.
+        seed (int): Random seed, so the corpus can be regenerated.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    rng = random.Random(seed)
+    width, height = size
+    for i in range(count):
+        image = Image.linear_gradient("L").resize(size).convert("RGB")
+        draw = ImageDraw.Draw(image)
+        for _ in range(40):
+            x, y = rng.randrange(width), rng.randrange(height)
+            radius = rng.randrange(50, width // 4)
+            color = tuple(rng.randrange(256) for _ in range(3))
+            draw.ellipse([x - radius, y - radius, x + radius, y + radius],
+                         fill=color)
+        image = image.filter(ImageFilter.GaussianBlur(8))
+        noise = Image.effect_noise(size, 12).convert("RGB")
+        image = Image.blend(image, noise, 0.08)
+        name = os.path.join(directory, "{:03d}.jpg".format(i))
+        image.save(name, quality=90)
+    print("Generated {} images in '{}'".format(count, directory))
+
+
+def psnr(image, reference):
+    """Get the peak signal-to-noise ratio of image against reference.
+
+    Args:
+        image (PIL): Image to judge.
+        reference (PIL): Image of the same size and mode to judge against.
+
+    Returns:
+        float: PSNR in dB (inf for identical images).
+    """
+    difference = ImageChops.difference(image.convert("RGB"),
+                                       reference.convert("RGB"))
+    pixels = image.size[0] * image.size[1] * 3
+    mse = sum(ImageStat.Stat(difference).sum2) / pixels
+    if not mse:
+        return float("inf")
+    return 10 * math.log10(255 ** 2 / mse)
+
+
+def full_resize(path, size):
+    """Resize the way ImageSizer.run used to: full decode, then LANCZOS.
+
+    Args:
+        path (str): Path of the image.
+        size (tuple): Size to resize to.
+
+    Returns:
+        PIL: Resized image.
+    """
+    image = Image.open(path)
+    image.load()
+    return image.resize(size, LANCZOS)
+
+
+def fast_resize(path, size, reducing_gap=3.0):
+    """Resize with ImageSizer.resize.
+
+    Args:
+        path (str): Path of the image.
+        size (tuple): Size to resize to.
+        reducing_gap (float): See ImageSizer.resize.
+
+    Returns:
+        PIL: Resized image.
+    """
+    return ImageSizer.resize(Image.open(path), size, reducing_gap)
+
+
+def get_paths(directory):
+    """Get the paths of the .jpg / .png images in directory.
+
+    Args:
+        directory (str): Directory of images.
+
+    Returns:
+        list: Paths, sorted.
+
+    Raises:
+        IOError: If there are none.
+    """
+    paths = [os.path.join(directory, name)
+             for name in sorted(os.listdir(directory))
+             if os.path.splitext(name)[1].lower() in (".jpg", ".png")]
+    if not paths:
+        raise IOError("No .jpg / .png images in '{}'".format(directory))
+    return paths
+
+
+def benchmark(directory, sizes, reducing_gap=3.0):
+    """Time both paths over every image in directory for every size.
+
+    Args:
+        directory (str): Directory of .jpg / .png images.
+        sizes (list): Target sizes as (width, height) tuples.
+        reducing_gap (float): See ImageSizer.resize.
+
+    Returns:
+        list: Rows of (size, full ms per image, fast ms per image, mean
+            PSNR, worst PSNR).
+    """
+    paths = get_paths(directory)
+    rows = []
+    for size in sizes:
+        full_time = fast_time = 0.0
+        scores = []
+        for path in paths:
+            start = time.perf_counter()
+            full = full_resize(path, size)
+            full_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            fast = fast_resize(path, size, reducing_gap)
+            fast_time += time.perf_counter() - start
+            scores.append(psnr(fast, full))
+
+        rows.append((size, full_time * 1000 / len(paths),
+                     fast_time * 1000 / len(paths),
+                     sum(scores) / len(scores), min(scores)))
+    return rows
+
+
+def encode_benchmark(directory, sizes, encoders=ENCODERS):
+    """Time every encoder over every image in directory for every size.
+
+    Args:
+        directory (str): Directory of .jpg / .png images.
+        sizes (list): Target sizes as (width, height) tuples.
+        encoders (list): Contains (name, image postfix, policy) tuples.
+
+    Returns:
+        list: Rows of (size, name, image postfix, ms per image to encode,
+            KB per image, mean PSNR against the resized image).
+    """
+    paths = get_paths(directory)
+    rows = []
+    for size in sizes:
+        images = [ImageSizer.resize(Image.open(path), size)
+                  for path in paths]
+        for name, image_type, policy in encoders:
+            seconds = written = 0.0
+            scores = []
+            for image in images:
+                output = BytesIO()
+                start = time.perf_counter()
+                policy.save(image.copy(), output, image_type)
+                seconds += time.perf_counter() - start
+                written += output.tell()
+                output.seek(0)
+                scores.append(psnr(Image.open(output), image))
+            rows.append((size, name, image_type, seconds * 1000 / len(images),
+                         written / 1024 / len(images),
+                         sum(scores) / len(scores)))
+    return rows
+
+
+def print_encode_benchmark(rows):
+    """Print the rows of encode_benchmark as a table.
+
+    Args:
+        rows (list): Rows returned by encode_benchmark.
+    """
+    print("{:<12}{:<18}{:<6}{:>10}{:>10}{:>10}".format(
+        "Size", "Encoder", "Type", "ms", "KB", "PSNR"))
+    for size, name, image_type, ms, kb, score in rows:
+        print("{:<12}{:<18}{:<6}{:>10.2f}{:>10.1f}{:>10.1f}".format(
+            "{}x{}".format(*size), name, image_type, ms, kb, score))
+
+
+def parse_size(text):
+    """Parse a size such as '100x50'.
+
+    Args:
+        text (str): Width and height separated by 'x'.
+
+    Returns:
+        tuple: (width, height).
+    """
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def main():
+    """Parse arguments and print the benchmark table."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("corpus", help="directory of .jpg / .png images")
+    parser.add_argument("--generate", type=int, metavar="COUNT",
+                        help="first write COUNT synthetic 4000x3000 JPEGs")
+    parser.add_argument("--sizes", type=parse_size, nargs="+",
+                        default=[(100, 50), (250, 250), (640, 480),
+                                 (1600, 1200)])
+    parser.add_argument("--reducing-gap", type=float, default=3.0)
+    parser.add_argument("--tolerance", type=float, default=35.0,
+                        help="lowest acceptable PSNR in dB")
+    parser.add_argument("--encode", action="store_true",
+                        help="compare encoder settings instead")
+    args = parser.parse_args()
+
+    if args.generate:
+        generate_corpus(args.corpus, args.generate)
+
+    if args.encode:
+        print_encode_benchmark(encode_benchmark(args.corpus, args.sizes))
+        return
+
+    rows = benchmark(args.corpus, args.sizes, args.reducing_gap)
+    print("{:<12}{:>12}{:>12}{:>10}{:>12}{:>12}".format(
+        "Size", "Full ms", "Fast ms", "Speedup", "PSNR mean", "PSNR worst"))
+    failed = False
+    for size, full_ms, fast_ms, mean, worst in rows:
+        flag = ""
+        if worst < args.tolerance:
+            flag, failed = "  BELOW TOLERANCE", True
+        print("{:<12}{:>12.1f}{:>12.1f}{:>9.1f}x{:>12.1f}{:>12.1f}{}".format(
+            "{}x{}".format(*size), full_ms, fast_ms, full_ms / fast_ms,
+            mean, worst, flag))
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+# ImageCache - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""ImageCache keeps downloaded and resized images on disk between runs.
+
+Files are stored once under the SHA-256 of their contents (content
+addressed), so identical downloads or outputs share one copy. An index
+maps:
+
+- each URL to the hash of its last download and the validators the server
+  sent with it (ETag, Last-Modified), so the next run can ask for the image
+  only if it changed (If-None-Match / If-Modified-Since, answered by 304),
+- each rendition (source hash, size and requested postfix) to the hash of
+  the resized file and its postfix, so a source that has not changed is
+  never decoded or resized again.
+
+The cache is capped at max_bytes. Files are kept in least-recently-used
+order and the oldest are removed, along with the index entries pointing at
+them, whenever a new file takes the cache over the cap.
+
+Each change to the index is appended to a journal as it is made, and save()
+folds the journal into the index. A run that dies keeps (and can reuse)
+every file it stored, and its half-written temporary files are removed by
+the next run.
+"""
+from collections import OrderedDict
+from functools import partial
+from hashlib import sha256
+from io import BytesIO
+import json
+import os
+import tempfile
+import threading
+
+
+class ImageCache(object):
+    """Class for ImageCache."""
+
+    def __init__(self, directory, max_bytes=2 ** 30):
+        """Initialize class variables and load the index of directory.
+
+        Args:
+            directory (str): Directory of the cache (created if missing).
+            max_bytes (int): Most bytes of files kept.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_filename = os.path.join(directory, "index.json")
+        self.journal_filename = os.path.join(directory, "journal.jsonl")
+        self.journal = None
+        self.lock = threading.RLock()
+
+        # Hash -> bytes of the file, least recently used first
+        self.files = OrderedDict()
+        self.used = 0
+        # URL -> {"hash", "etag", "last_modified"}
+        self.urls = {}
+        # "source hash:widthxheight:postfix:variant" -> {"hash", "postfix"}
+        self.outputs = {}
+        # Hash -> ("urls" or "outputs", key) of every entry using the file
+        self.users = {}
+        self.load()
+
+    def load(self):
+        """Load the index and journal; drop entries whose file has gone."""
+        try:
+            with open(self.index_filename) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        files = OrderedDict(index.get("files", []))
+        urls = index.get("urls", {})
+        outputs = index.get("outputs", {})
+        try:
+            with open(self.journal_filename) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Cut short by a crash
+                        break
+                    if "file" in record:
+                        files[record["file"]] = record["size"]
+                    elif "forget" in record:
+                        files.pop(record["forget"], None)
+                    elif "url" in record:
+                        urls[record["url"]] = record["entry"]
+                    else:
+                        outputs[record["output"]] = record["entry"]
+        except OSError:
+            pass
+
+        for digest, size in files.items():
+            if os.path.isfile(self.path(digest)):
+                self.files[digest] = size
+                self.used += size
+        for table, entries in ("urls", urls), ("outputs", outputs):
+            for key, entry in entries.items():
+                if entry["hash"] in self.files:
+                    self.link(table, key, entry)
+        self.clean()
+
+    def clean(self):
+        """Remove temporary files left behind by a run that died."""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if name.startswith(tempfile.gettempprefix()):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def save(self):
+        """Write the index to disk (atomically) and clear the journal."""
+        with self.lock:
+            index = {"files": list(self.files.items()), "urls": self.urls,
+                     "outputs": self.outputs}
+            os.makedirs(self.directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", dir=self.directory,
+                                             delete=False) as f:
+                json.dump(index, f)
+            os.replace(f.name, self.index_filename)
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+            try:
+                os.remove(self.journal_filename)
+            except OSError:
+                pass
+
+    def log(self, record):
+        """Append a change of the index to the journal.
+
+        Must be called with self.lock held.
+
+        Args:
+            record (dict): The change (see self.load).
+        """
+        if self.journal is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.journal = open(self.journal_filename, "a")
+        self.journal.write(json.dumps(record) + "\n")
+        self.journal.flush()
+
+    def link(self, table, key, entry):
+        """Set an entry of the index and note which file it uses.
+
+        Must be called with self.lock held.
+
+        Args:
+            table (str): "urls" or "outputs".
+            key (str): URL or rendition key.
+            entry (dict): Entry, with the hash of its file.
+        """
+        entries = getattr(self, table)
+        old = entries.get(key)
+        if old:
+            self.users.get(old["hash"], set()).discard((table, key))
+        entries[key] = entry
+        self.users.setdefault(entry["hash"], set()).add((table, key))
+
+    def path(self, digest):
+        """Get the path of the file stored under digest.
+
+        Args:
+            digest (str): SHA-256 of the file (hex).
+
+        Returns:
+            str: Path of the file.
+        """
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def put(self, source, chunk_size=65536):
+        """Store the contents of source and mark them as just used.
+
+        source is copied a chunk at a time while it is hashed, so a large
+        file is never held in memory.
+
+        Args:
+            source (file): File to store, read from its current position.
+            chunk_size (int): Bytes copied at a time.
+
+        Returns:
+            str: SHA-256 of the contents (hex).
+        """
+        # Written under a temporary name first, so a file in the cache is
+        # always complete, even if two threads store it at once
+        os.makedirs(self.directory, exist_ok=True)
+        digest = sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=self.directory,
+                                         delete=False) as f:
+            for chunk in iter(partial(source.read, chunk_size), b""):
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        digest = digest.hexdigest()
+        path = self.path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(f.name, path)
+        with self.lock:
+            if digest in self.files:
+                self.files.move_to_end(digest)
+            else:
+                self.files[digest] = size
+                self.used += size
+                self.log({"file": digest, "size": size})
+            self.evict(digest)
+        return digest
+
+    def get(self, digest):
+        """Get the file stored under digest and mark it as just used.
+
+        Args:
+            digest (str): SHA-256 of the file (hex).
+
+        Returns:
+            None; bytes: Contents of the file (None if not cached).
+        """
+        try:
+            with open(self.path(digest), "rb") as f:
+                data = f.read()
+        except OSError:
+            with self.lock:
+                self.forget(digest)
+            return None
+        with self.lock:
+            if digest in self.files:
+                self.files.move_to_end(digest)
+        return data
+
+    def evict(self, keep=None):
+        """Remove least recently used files until the cache fits.
+
+        Args:
+            keep (None; str): Hash of a file never removed (just stored).
+        """
+        with self.lock:
+            for digest in list(self.files):
+                if self.used <= self.max_bytes:
+                    break
+                if digest != keep:
+                    self.forget(digest)
+
+    def forget(self, digest):
+        """Remove the file stored under digest and every entry using it.
+
+        Args:
+            digest (str): SHA-256 of the file (hex).
+        """
+        with self.lock:
+            if digest in self.files:
+                self.used -= self.files.pop(digest)
+                self.log({"forget": digest})
+            for table, key in self.users.pop(digest, ()):
+                del getattr(self, table)[key]
+        try:
+            os.remove(self.path(digest))
+        except OSError:
+            pass
+
+    def validators(self, url):
+        """Get the headers asking for url only if it changed.
+
+        Args:
+            url (str): URL of the image.
+
+        Returns:
+            dict: If-None-Match / If-Modified-Since headers (empty if url
+                is not cached or the server sent no validators).
+        """
+        with self.lock:
+            entry = self.urls.get(url, {})
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def source(self, url):
+        """Open the cached download of url (after a 304 answer).
+
+        Args:
+            url (str): URL of the image.
+
+        Returns:
+            None; file: The image file, to be closed by the caller (None
+                if not cached).
+        """
+        digest = self.source_hash(url)
+        if digest is None:
+            return None
+        try:
+            source = open(self.path(digest), "rb")
+        except OSError:
+            with self.lock:
+                self.forget(digest)
+            return None
+        with self.lock:
+            if digest in self.files:
+                self.files.move_to_end(digest)
+        return source
+
+    def source_hash(self, url):
+        """Get the hash of the cached download of url.
+
+        Args:
+            url (str): URL of the image.
+
+        Returns:
+            None; str: SHA-256 of the image file (None if not cached).
+        """
+        with self.lock:
+            return self.urls.get(url, {}).get("hash")
+
+    def put_source(self, url, source, headers):
+        """Store the download of url with its validators.
+
+        Args:
+            url (str): URL of the image.
+            source (file): The image file, read from its current position.
+            headers (dict): Response headers.
+        """
+        digest = self.put(source)
+        entry = {"hash": digest, "etag": headers.get("ETag"),
+                 "last_modified": headers.get("Last-Modified")}
+        with self.lock:
+            # Unless another thread's file has evicted it already
+            if digest in self.files:
+                self.link("urls", url, entry)
+                self.log({"url": url, "entry": entry})
+
+    @staticmethod
+    def output_key(digest, size, postfix, variant=""):
+        """Get the index key of a rendition.
+
+        Args:
+            digest (str): SHA-256 of the source image file.
+            size (tuple): Size of the rendition.
+            postfix (None; str): Requested image postfix (type); None for
+                the source's.
+            variant (str): Key of the encoder settings (OutputPolicy.key).
+
+        Returns:
+            str: Key of the rendition.
+        """
+        return "{}:{}x{}:{}:{}".format(digest, size[0], size[1],
+                                       postfix or "", variant)
+
+    def output(self, digest, size, postfix, variant=""):
+        """Get a cached rendition.
+
+        Args:
+            digest (str): SHA-256 of the source image file.
+            size (tuple): Size of the rendition.
+            postfix (None; str): Requested image postfix (type).
+            variant (str): Key of the encoder settings.
+
+        Returns:
+            tuple: [0] = image postfix (type) saved; [1] = contents of the
+                resized file. None if not cached.
+        """
+        with self.lock:
+            entry = self.outputs.get(self.output_key(digest, size, postfix,
+                                                     variant))
+        data = entry and self.get(entry["hash"])
+        if data is None:
+            return None
+        return entry["postfix"], data
+
+    def put_output(self, digest, size, postfix, saved_postfix, data,
+                   variant=""):
+        """Store a rendition.
+
+        Args:
+            digest (str): SHA-256 of the source image file.
+            size (tuple): Size of the rendition.
+            postfix (None; str): Requested image postfix (type).
+            saved_postfix (str): Image postfix (type) it was saved as.
+            data (bytes): Contents of the resized file.
+            variant (str): Key of the encoder settings.
+        """
+        output_hash = self.put(BytesIO(data))
+        key = self.output_key(digest, size, postfix, variant)
+        entry = {"hash": output_hash, "postfix": saved_postfix}
+        with self.lock:
+            if output_hash in self.files:
+                self.link("outputs", key, entry)
+                self.log({"output": key, "entry": entry})
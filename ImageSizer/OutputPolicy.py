@@ -0,0 +1,211 @@
+# OutputPolicy - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""OutputPolicy decides how resized images are encoded.
+
+Image.save() with no options writes JPEGs at quality 75 without Huffman
+optimization and PNGs at zlib level 6, and copies EXIF and other metadata
+from the source. A policy sets per format:
+
+- JPEG: quality, optimized Huffman tables, progressive scans,
+- PNG: zlib compression level, and Pillow's optimize pass,
+- WebP: quality, encoder effort (method) and lossless mode, and whether
+  every output is written as WebP rather than its source's postfix,
+
+and whether metadata (EXIF, XMP, comments, text chunks) is stripped. ICC
+profiles are always kept, as colors would shift without them. An image that
+is saved as downloaded, not re-encoded (see ImageSizer.pass_through), must
+hold no metadata the policy strips.
+
+Benchmark.py --encode reports encode time against output bytes for a set
+of policies, to choose between them.
+"""
+from hashlib import sha1
+
+# Pillow format of each image postfix (type)
+FORMATS = {"jpg": "JPEG", "png": "PNG", "webp": "WEBP"}
+
+# Modes each format can store as they are
+MODES = {"jpg": ("1", "L", "RGB", "CMYK"), "webp": ("RGB", "RGBA")}
+
+# Keys of Image.info, and PNG chunks, holding metadata that is stripped
+METADATA = ("exif", "xmp", "comment", "photoshop")
+PNG_METADATA = (b"tEXt", b"zTXt", b"iTXt", b"eXIf")
+
+
+def has_metadata(source, header):
+    """Get whether an image file holds metadata that a policy may strip.
+
+    A JPEG header lists all of it, as it comes before the image data. The
+    chunks of a PNG and the flags of an extended WebP are read from the
+    file instead, since their metadata may follow the image data.
+
+    Args:
+        source (file): The image file (left at its start).
+        header (PIL): Image header of source.
+
+    Returns:
+        bool: True if source holds EXIF, XMP, comments or text chunks.
+    """
+    if any(key in header.info for key in METADATA):
+        return True
+    try:
+        source.seek(0)
+        if header.format == "PNG":
+            source.seek(8)
+            while True:
+                chunk = source.read(8)
+                if len(chunk) < 8 or chunk[4:] == b"IEND":
+                    return False
+                if chunk[4:] in PNG_METADATA:
+                    return True
+                # Skip the chunk's data and CRC
+                source.seek(int.from_bytes(chunk[:4], "big") + 4, 1)
+        if header.format == "WEBP":
+            head = source.read(21)
+            return head[12:16] == b"VP8X" and bool(head[20] & 0x0C)
+        return False
+    finally:
+        source.seek(0)
+
+
+class OutputPolicy(object):
+    """Class for OutputPolicy."""
+
+    def __init__(self, jpeg_quality=85, progressive=True, optimize=True,
+                 png_compress_level=6, png_optimize=False, webp=False,
+                 webp_quality=80, webp_method=4, webp_lossless=False,
+                 strip_metadata=True):
+        """Initialize class variables.
+
+        Args:
+            jpeg_quality (int): JPEG quality (1-95).
+            progressive (bool): If True, JPEGs are written progressive
+                (smaller, and shown in passes as they load).
+            optimize (bool): If True, JPEGs get optimized Huffman tables
+                (smaller, a little slower).
+            png_compress_level (int): zlib level of PNGs (0-9; higher is
+                smaller and slower).
+            png_optimize (bool): If True, Pillow searches for the smallest
+                PNG encoding (much slower; overrides png_compress_level).
+            webp (bool): If True, renditions without a postfix of their own
+                are written as WebP.
+            webp_quality (int): WebP quality (0-100), or effort if lossless.
+            webp_method (int): WebP encoder effort (0-6; higher is smaller
+                and slower).
+            webp_lossless (bool): If True, WebPs are lossless.
+            strip_metadata (bool): If True, EXIF, XMP, comments and text
+                chunks are not written, and images holding any are always
+                re-encoded rather than saved as downloaded.
+        """
+        self.jpeg_quality = jpeg_quality
+        self.progressive = progressive
+        self.optimize = optimize
+        self.png_compress_level = png_compress_level
+        self.png_optimize = png_optimize
+        self.webp = webp
+        self.webp_quality = webp_quality
+        self.webp_method = webp_method
+        self.webp_lossless = webp_lossless
+        self.strip_metadata = strip_metadata
+
+    def key(self):
+        """Get a short key of the settings, for caching outputs.
+
+        Returns:
+            str: Key that changes whenever a setting does.
+        """
+        settings = repr(sorted(vars(self).items())).encode()
+        return sha1(settings).hexdigest()[:12]
+
+    def keeps(self, source, header):
+        """Get whether an image file may be saved as it is.
+
+        Args:
+            source (file): The image file.
+            header (PIL): Image header of source.
+
+        Returns:
+            bool: False if re-encoding would strip its metadata.
+        """
+        return not (self.strip_metadata and has_metadata(source, header))
+
+    def output_type(self, image_type, postfix=None):
+        """Get the postfix (type) a rendition is saved as.
+
+        Args:
+            image_type (str): Image postfix (type) of the source image.
+            postfix (None; str): Postfix asked for by the rendition.
+
+        Returns:
+            str: Image postfix (type) to save as.
+        """
+        if postfix:
+            return postfix
+        if self.webp:
+            return "webp"
+        return image_type
+
+    def options(self, image, image_type):
+        """Get the Image.save() options for image.
+
+        Args:
+            image (PIL): Image to save.
+            image_type (str): Image postfix (type) to save as.
+
+        Returns:
+            dict: Keyword arguments of Image.save().
+        """
+        if image_type == "jpg":
+            options = {"quality": self.jpeg_quality,
+                       "optimize": self.optimize,
+                       "progressive": self.progressive}
+        elif image_type == "png":
+            options = {"compress_level": self.png_compress_level,
+                       "optimize": self.png_optimize}
+        elif image_type == "webp":
+            options = {"quality": self.webp_quality,
+                       "method": self.webp_method,
+                       "lossless": self.webp_lossless}
+        else:
+            options = {}
+
+        if image.info.get("icc_profile"):
+            options["icc_profile"] = image.info["icc_profile"]
+        if not self.strip_metadata and image.info.get("exif"):
+            options["exif"] = image.info["exif"]
+        return options
+
+    def prepare(self, image, image_type):
+        """Get image in a mode image_type can store, without metadata.
+
+        Args:
+            image (PIL): Image to save; its metadata is stripped in place
+                if self.strip_metadata.
+            image_type (str): Image postfix (type) to save as.
+
+        Returns:
+            PIL: Image to save.
+        """
+        if self.strip_metadata:
+            # PNG writes the text chunks and profile of image.info itself
+            image.info = {key: value for key, value in image.info.items()
+                          if key in ("icc_profile", "transparency")}
+        modes = MODES.get(image_type)
+        if modes and image.mode not in modes:
+            alpha = "A" in image.mode or "transparency" in image.info
+            if image_type == "webp" and alpha:
+                image = image.convert("RGBA")
+            else:
+                image = image.convert("RGB")
+        return image
+
+    def save(self, image, filename, image_type):
+        """Encode image as image_type and write it.
+
+        Args:
+            image (PIL): Image to save.
+            filename (str; file): Path or file object to write to.
+            image_type (str): Image postfix (type) to save as.
+        """
+        image = self.prepare(image, image_type)
+        image.save(filename, FORMATS.get(image_type, image_type.upper()),
+                   **self.options(image, image_type))
@@ -1,8 +1,77 @@
 # ImageSizer - Johnathon Kwisses (Kwistech)
-from io import BytesIO
-from os import listdir
-from PIL import Image
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from multiprocessing import get_all_start_methods, get_context
+from os import cpu_count, remove, scandir, sep
+from os.path import relpath, splitext
+from PIL import Image, ImageFile
 from requests import get as request
+from shutil import copyfileobj
+from tempfile import NamedTemporaryFile, SpooledTemporaryFile
+import threading
+
+from ImageCache import ImageCache
+from OutputPolicy import OutputPolicy
+
+# High-quality downscaling filter; named ANTIALIAS before Pillow 2.7 and
+# only LANCZOS since Pillow 10
+LANCZOS = getattr(Image, "LANCZOS", None) or Image.ANTIALIAS
+
+# Image postfix (type) by file extension, by the file's first bytes, and
+# by Pillow format
+EXTENSIONS = {".png": "png", ".jpg": "jpg", ".jpeg": "jpg", ".webp": "webp"}
+MAGIC = [(b"\x89PNG\r\n\x1a\n", "png"), (b"\xff\xd8\xff", "jpg")]
+IMAGE_TYPES = {"PNG": "png", "JPEG": "jpg", "MPO": "jpg", "WEBP": "webp"}
+
+
+class ResponseTooLarge(Exception):
+    """Raised when a download goes over its byte or pixel limit."""
+
+
+class MemoryBudget(object):
+    """Cap the bytes held by downloads in flight, across threads.
+
+    Each download reserves its whole size up front (its Content-Length, or
+    the per-response limit if unknown) and waits while the budget is used
+    up, so downloads can never deadlock holding part of the budget each.
+    """
+
+    def __init__(self, limit):
+        """Initialize class variables.
+
+        Args:
+            limit (int): Most bytes held by downloads at once.
+        """
+        self.limit = limit
+        self.used = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, size):
+        """Wait until size bytes fit in the budget, then reserve them.
+
+        Args:
+            size (int): Bytes to reserve.
+
+        Raises:
+            ResponseTooLarge: If size is over the whole budget.
+        """
+        if size > self.limit:
+            raise ResponseTooLarge("{} bytes is over the memory budget of "
+                                   "{} bytes".format(size, self.limit))
+        with self.condition:
+            while self.used + size > self.limit:
+                self.condition.wait()
+            self.used += size
+
+    def release(self, size):
+        """Give back size bytes reserved by self.acquire().
+
+        Args:
+            size (int): Bytes to give back.
+        """
+        with self.condition:
+            self.used -= size
+            self.condition.notify_all()
 
 
 class DataRetriever(object):
@@ -28,84 +97,385 @@ class DataRetriever(object):
     def parse_local_data(data):
         """Parse local data (used in .csv file reading).
 
+        A line is either 'url;width;height' or a URL followed by one or
+        more renditions, separated by ';' or ',', each a size with an
+        optional output postfix (type): 'url;100x50,640x480:png'.
+
         Args:
             data (list): Data to be parsed.
 
         Returns:
-            list: Parsed data.
+            list: Parsed data; [url, renditions, image_name] lines, where
+                renditions is a list of (size, image postfix or None).
+
+        Raises:
+            ValueError: If a line cannot be parsed.
         """
         parsed_data = []
         for line in data:
-            url, width, height = line.split(";")
+            line = line.strip()
+            if not line:
+                continue
+            url, _, fields = line.partition(";")
+            fields = fields.replace(",", ";").split(";")
             image_name = url.split('/')[-1]
-            size = int(width), int(height)
-            parsed_data.append([url, size, image_name])
+            if len(fields) == 2 and all(x.strip().isdigit() for x in fields):
+                renditions = [((int(fields[0]), int(fields[1])), None)]
+            else:
+                renditions = [DataRetriever.parse_rendition(x)
+                              for x in fields if x.strip()]
+            if not renditions:
+                raise ValueError("No size given for {}".format(url))
+            parsed_data.append([url, renditions, image_name])
         return parsed_data
 
+    @staticmethod
+    def parse_rendition(text):
+        """Parse a rendition such as '100x50' or '100x50:png'.
+
+        Args:
+            text (str): Width and height separated by 'x', then optionally
+                ':' and the image postfix (type) to save as.
+
+        Returns:
+            tuple: [0] = size; [1] = image postfix (None to keep the
+                source's).
+
+        Raises:
+            ValueError: If text is not a rendition.
+        """
+        size, _, image_type = text.strip().lower().partition(":")
+        width, height = size.split("x")
+        image_type = EXTENSIONS.get("." + image_type, image_type) or None
+        if image_type and image_type not in EXTENSIONS.values():
+            raise ValueError("Unknown image type: {}".format(image_type))
+        return (int(width), int(height)), image_type
+
 
 class ImageRetriever(object):
     """House local and global image retrieving methods."""
 
-    def __init__(self):
-        """Initialize class variables."""
-        self.image_types = ["png", "jpg"]
+    def __init__(self, max_bytes=50 * 2 ** 20, max_pixels=50 * 10 ** 6,
+                 budget=None, timeout=30, cache=None,
+                 spool_bytes=8 * 2 ** 20):
+        """Initialize class variables.
+
+        Args:
+            max_bytes (int): Most bytes downloaded per image (after any
+                Content-Encoding is decoded).
+            max_pixels (int): Most pixels (width * height) decoded per
+                image; guards against decompression bombs.
+            budget (None; MemoryBudget): Shared cap on bytes held by all
+                downloads in flight (default 256 MB).
+            timeout (int; float): Seconds to wait for the server.
+            cache (None; ImageCache): Keeps downloads between runs; cached
+                images are downloaded again only if they changed.
+            spool_bytes (int): Bytes of a download kept in memory; the rest
+                of a larger one goes to a temporary file.
+        """
+        self.image_types = sorted(set(IMAGE_TYPES.values()))
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.budget = budget or MemoryBudget(256 * 2 ** 20)
+        self.timeout = timeout
+        self.cache = cache
+        self.spool_bytes = spool_bytes
 
     def local_images(self, directory):
-        """Get images from a local directory.
+        """Get images from a local directory and its subdirectories.
+
+        Images are opened one at a time as they are asked for (not
+        decoded until resized), so memory and open files stay constant
+        however many images there are.
 
         Args:
             directory (str): Directory to search.
 
+        Yields:
+            list: [0] = image; [1] = image name; [2] = image postfix (type).
+        """
+        for path, image_name, image_type in self.scan(directory):
+            yield [Image.open(path), image_name, image_type]
+
+    def scan(self, directory, top=None):
+        """Walk directory recursively and yield its images' paths.
+
+        A file is an image if its extension says so or, failing that, if
+        it starts with PNG or JPEG magic bytes. Subdirectories are walked
+        after the files of directory, once its listing is closed; links to
+        directories are not followed, so the walk cannot loop.
+
+        Args:
+            directory (str): Directory to search.
+            top (None; str): Directory the walk started from.
+
+        Yields:
+            tuple: [0] = path; [1] = image name (path below top without
+                extension, separators replaced by '_'); [2] = image
+                postfix (type).
+        """
+        top = top or directory
+        subdirectories = []
+        for entry in scandir(directory):
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.is_file():
+                image_type = self.file_image_type(entry.path)
+                if image_type:
+                    name = splitext(relpath(entry.path, top))[0]
+                    yield entry.path, name.replace(sep, "_"), image_type
+        for subdirectory in subdirectories:
+            yield from self.scan(subdirectory, top)
+
+    @staticmethod
+    def file_image_type(path):
+        """Get the postfix (type) of the image at path, if it is one.
+
+        Args:
+            path (str): Path of the file.
+
         Returns:
-            list: Contains images and their filenames.
+            None; str: Image postfix (type), or None if not an image.
         """
-        images = []
-        files = listdir(directory)
-        for file in files:
-            for image_type in self.image_types:
-                if image_type in file:
-                    directory = "{}/{}".format(directory, file)
-                    image = Image.open(directory)
-                    images.append([image, file])
-        return images
+        image_type = EXTENSIONS.get(splitext(path)[1].lower())
+        if image_type:
+            return image_type
+        try:
+            with open(path, "rb") as f:
+                head = f.read(8)
+        except OSError:
+            return None
+        for magic, image_type in MAGIC:
+            if head.startswith(magic):
+                return image_type
+        return None
 
-    def url_image(self, url):
+    def url_image(self, url, size=None):
         """Get image from a URL.
 
+        The image is streamed in and the download is aborted as soon as it
+        goes over self.max_bytes. Its pixel size is checked before it is
+        decoded.
+
         Args:
             url (str): URL to get image from.
+            size (None; tuple): Size the image will be resized to; JPEGs
+                are then decoded at the smallest scale that covers it.
 
         Returns:
             tuple: [0] = image; [1] = image's postfix.
+
+        Raises:
+            ResponseTooLarge: If the image is over self.max_bytes or
+                self.max_pixels.
         """
-        response = request(url)
-        image = Image.open(BytesIO(response.content))
+        data, _ = self.url_data(url)
+        with data:
+            image = self.open_image(data, self.max_pixels, size)
         image_type = self.url_image_type(image)
         return image, image_type
 
-    def url_image_type(self, image):
+    def url_data(self, url):
+        """Download the (still encoded) image at url.
+
+        The body is streamed into a spooled file (see self.read_body) and
+        its header is read as soon as it is in. With self.cache, an image
+        downloaded before is only asked for if it changed; a 304 answer is
+        served from the cache.
+
+        Args:
+            url (str): URL to get image from.
+
+        Returns:
+            tuple: [0] = the image file, at its start (to be closed by the
+                caller); [1] = image header (not decoded; None if not
+                recognized).
+
+        Raises:
+            ResponseTooLarge: If the image is over self.max_bytes, or its
+                header shows it is over self.max_pixels.
+            requests.HTTPError: If the server answered with an error.
+        """
+        headers = self.cache.validators(url) if self.cache else {}
+        response = request(url, stream=True, timeout=self.timeout,
+                           headers=headers)
+        if response.status_code == 304:
+            response.close()
+            data = self.cache.source(url)
+            if data:
+                return data, self.read_header(data)
+            # Evicted since it was asked for
+            response = request(url, stream=True, timeout=self.timeout)
+        try:
+            response.raise_for_status()
+            # Content-Length is the encoded size; decoded size is unknown
+            length = response.headers.get("Content-Length", "")
+            if length.isdigit() and \
+                    not response.headers.get("Content-Encoding"):
+                size = int(length)
+            else:
+                size = self.max_bytes
+            if size > self.max_bytes:
+                raise ResponseTooLarge("{} bytes is over the limit of {} "
+                                       "bytes".format(size, self.max_bytes))
+
+            # Only the spooled part of the body is held in memory
+            size_in_memory = min(size, self.spool_bytes)
+            self.budget.acquire(size_in_memory)
+            try:
+                data, header = self.read_body(response, size)
+            finally:
+                self.budget.release(size_in_memory)
+            if self.cache:
+                self.cache.put_source(url, data, response.headers)
+                data.seek(0)
+            return data, header
+        finally:
+            response.close()
+
+    @staticmethod
+    def open_image(source, max_pixels, size=None):
+        """Open and decode an image, checking its pixel size first.
+
+        Args:
+            source (str; file): Path or file object of the image.
+            max_pixels (int): Most pixels (width * height) decoded.
+            size (None; tuple): Size the image will be resized to; see
+                ImageSizer.draft.
+
+        Returns:
+            PIL: Decoded image.
+
+        Raises:
+            ResponseTooLarge: If the image is over max_pixels.
+        """
+        try:
+            image = Image.open(source)
+        except Image.DecompressionBombError as e:
+            raise ResponseTooLarge(str(e))
+        if size:
+            ImageSizer.draft(image, size)
+        width, height = image.size
+        if width * height > max_pixels:
+            raise ResponseTooLarge(
+                "{}x{} pixels is over the limit of {} pixels".format(
+                    width, height, max_pixels))
+        image.load()
+        return image
+
+    def read_body(self, response, size, chunk_size=65536,
+                  header_bytes=2 ** 20):
+        """Stream the body of a response into a file, at most size bytes.
+
+        Chunks are written as they arrive to a file kept in memory up to
+        self.spool_bytes and moved to a temporary file beyond, so the body
+        is held once at most. The first chunks are also fed to an image
+        parser until the image header is in, so an image with too many
+        pixels is dropped before the rest of it is downloaded.
+
+        Args:
+            response (requests.Response): Response opened with stream=True.
+            size (int): Most bytes to read.
+            chunk_size (int): Bytes read at a time.
+            header_bytes (int): Most bytes searched for the image header.
+
+        Returns:
+            tuple: [0] = the body, at its start; [1] = image header (not
+                decoded; None if not recognized).
+
+        Raises:
+            ResponseTooLarge: If the body is longer than size, or its
+                header shows it is over self.max_pixels.
+        """
+        data = SpooledTemporaryFile(self.spool_bytes)
+        parser, header = ImageFile.Parser(), None
+        try:
+            for chunk in response.iter_content(chunk_size):
+                if data.tell() + len(chunk) > size:
+                    raise ResponseTooLarge("body is over the limit of {} "
+                                           "bytes".format(size))
+                data.write(chunk)
+                if parser:
+                    try:
+                        parser.feed(chunk)
+                    except Image.DecompressionBombError as e:
+                        raise ResponseTooLarge(str(e))
+                    except (OSError, SyntaxError, ValueError):
+                        parser = None
+                        continue
+                    header = parser.image
+                    if header is not None:
+                        self.check_header(header)
+                    if header is not None or data.tell() > header_bytes:
+                        parser = None
+        except BaseException:
+            data.close()
+            raise
+        data.seek(0)
+        return data, header
+
+    @staticmethod
+    def read_header(source):
+        """Read the header of an image file, without decoding it.
+
+        Args:
+            source (file): The image file, at its start.
+
+        Returns:
+            None; PIL: Image header (None if not recognized).
+        """
+        try:
+            header = Image.open(source)
+        except (OSError, SyntaxError, ValueError,
+                Image.DecompressionBombError):
+            header = None
+        source.seek(0)
+        return header
+
+    def check_header(self, header):
+        """Check the pixel size of an image from its header.
+
+        JPEGs may be decoded at down to 1/8 scale (see ImageSizer.draft),
+        so they are only refused here if too large even then;
+        self.open_image checks the size they are decoded at.
+
+        Args:
+            header (PIL): Image header.
+
+        Raises:
+            ResponseTooLarge: If the image is over self.max_pixels.
+        """
+        width, height = header.size
+        pixels = width * height
+        if header.format == "JPEG":
+            pixels //= 64
+        if pixels > self.max_pixels:
+            raise ResponseTooLarge(
+                "{}x{} pixels is over the limit of {} pixels".format(
+                    width, height, self.max_pixels))
+
+    @staticmethod
+    def url_image_type(image):
         """Get image's postfix (type).
 
+        Images of formats that are not written (GIF, BMP, TIFF...) get
+        'png', which stores any image without loss.
+
         Args:
             image (PIL): Image object.
 
         Returns:
             str: Image postfix (type).
         """
-        image = str(image).lower()
-        for image_type in self.image_types:
-            if image_type == "jpg":
-                if "jpeg" in image:
-                    return image_type
-            elif image_type in image:
-                return image_type
+        return IMAGE_TYPES.get(image.format, "png")
 
 
 class ImageSizer(object):
     """ImageSizer object."""
 
     @staticmethod
-    def run(image, image_name, image_type, size, save_directory):
+    def run(image, image_name, image_type, size, save_directory,
+            policy=None):
         """Resize image to size and save it to save_directory.
 
         Args:
@@ -114,25 +484,550 @@ class ImageSizer(object):
             image_type (str): Image postfix (type).
             size (tuple): Size to resize image to.
             save_directory (str): Directory to save image to.
+            policy (None; OutputPolicy): How the image is encoded.
+        """
+        ImageSizer.renditions(image, image_name, image_type, [(size, None)],
+                              save_directory, policy)
+
+    @staticmethod
+    def renditions(image, image_name, image_type, renditions,
+                   save_directory, policy=None):
+        """Resize image to every rendition and save them to save_directory.
+
+        The image is decoded once. Renditions are made largest first, each
+        downscaled from the one before it when that one covers its size
+        (from image otherwise), so every step starts from fewer pixels.
+        With more than one rendition, each name ends in '_<width>x<height>'.
+
+        Args:
+            image (PIL): Image object.
+            image_name (str): Name of image.
+            image_type (str): Image postfix (type) of image.
+            renditions (list): Contains (size, image postfix or None to
+                keep image_type) tuples.
+            save_directory (str): Directory to save images to.
+            policy (None; OutputPolicy): How renditions are encoded
+                (default: OutputPolicy()).
+        """
+        policy = policy or OutputPolicy()
+        ImageSizer.draft(image, ImageSizer.cover(renditions))
+        previous = None
+        for size, postfix in sorted(renditions, reverse=True,
+                                    key=lambda x: x[0][0] * x[0][1]):
+            source = image
+            if previous and previous.size[0] >= size[0] and \
+                    previous.size[1] >= size[1]:
+                source = previous
+            previous = ImageSizer.resize(source, size)
+
+            postfix = policy.output_type(image_type, postfix)
+            policy.save(previous, ImageSizer.output_path(
+                image_name, size, postfix, renditions, save_directory),
+                postfix)
+
+    @staticmethod
+    def output_path(image_name, size, image_type, renditions,
+                    save_directory):
+        """Get the path a rendition is saved to.
+
+        Args:
+            image_name (str): Name of image.
+            size (tuple): Size of the rendition.
+            image_type (str): Image postfix (type) it is saved as.
+            renditions (list): Every rendition of the image.
+            save_directory (str): Directory to save images to.
+
+        Returns:
+            str: Path of the rendition.
         """
         image_name = image_name.split(".")[0]
-        image = image.resize(size, Image.ANTIALIAS)
-        directory = "{}/{}.{}".format(save_directory, image_name, image_type)
-        image.save(directory)
+        if len(renditions) > 1:
+            image_name = "{}_{}x{}".format(image_name, *size)
+        return "{}/{}.{}".format(save_directory, image_name, image_type)
+
+    @staticmethod
+    def pass_through(source, header, image_name, renditions, save_directory,
+                     upscale=True, policy=None):
+        """Save the image file itself as every rendition, if it can be.
+
+        It can be if the image already has the size of every rendition (or
+        is smaller and upscale is False), each is saved as the image's own
+        postfix (type) and the policy would not strip anything from it (see
+        OutputPolicy.keeps); the image is then never decoded.
+
+        Args:
+            source (file): The image file.
+            header (None; PIL): Image header (see ImageRetriever.url_data).
+            image_name (str): Name of image.
+            renditions (list): Contains (size, image postfix) tuples.
+            save_directory (str): Directory to save images to.
+            upscale (bool): If False, an image smaller than a rendition is
+                saved as it is rather than enlarged.
+            policy (None; OutputPolicy): Decides the postfix (type) of each
+                rendition, and which metadata may be kept.
+
+        Returns:
+            None; str: Image postfix (type) of the image, or None if a
+                rendition needs resizing (nothing is saved).
+        """
+        if header is None:
+            return None
+        policy = policy or OutputPolicy()
+        image_type = ImageRetriever.url_image_type(header)
+        if IMAGE_TYPES.get(header.format) != image_type:
+            return None
+        width, height = header.size
+        for size, postfix in renditions:
+            if policy.output_type(image_type, postfix) != image_type:
+                return None
+            if header.size != size and (upscale or width > size[0] or
+                                        height > size[1]):
+                return None
+        if not policy.keeps(source, header):
+            return None
+
+        for size, _ in renditions:
+            source.seek(0)
+            path = ImageSizer.output_path(image_name, size, image_type,
+                                          renditions, save_directory)
+            with open(path, "wb") as f:
+                copyfileobj(source, f)
+        return image_type
+
+    @staticmethod
+    def restore(cache, digest, image_name, renditions, save_directory,
+                policy=None):
+        """Save every rendition of an image from cache, if all are cached.
+
+        Files already in save_directory with the same contents are left
+        untouched.
+
+        Args:
+            cache (ImageCache): Cache of renditions.
+            digest (str): Hash of the source image file.
+            image_name (str): Name of image.
+            renditions (list): Contains (size, image postfix) tuples.
+            save_directory (str): Directory to save images to.
+            policy (None; OutputPolicy): Policy the renditions must have
+                been encoded with.
+
+        Returns:
+            bool: True if every rendition was cached (and saved).
+        """
+        variant = (policy or OutputPolicy()).key()
+        outputs = []
+        for size, postfix in renditions:
+            output = cache.output(digest, size, postfix, variant)
+            if output is None:
+                return False
+            outputs.append((size, output))
+
+        for size, (image_type, data) in outputs:
+            path = ImageSizer.output_path(image_name, size, image_type,
+                                          renditions, save_directory)
+            try:
+                with open(path, "rb") as f:
+                    if f.read() == data:
+                        continue
+            except OSError:
+                pass
+            with open(path, "wb") as f:
+                f.write(data)
+        return True
+
+    @staticmethod
+    def store(cache, digest, image_name, image_type, renditions,
+              save_directory, policy=None):
+        """Add the saved renditions of an image to cache.
+
+        Args:
+            cache (ImageCache): Cache of renditions.
+            digest (str): Hash of the source image file.
+            image_name (str): Name of image.
+            image_type (str): Image postfix (type) of the source image.
+            renditions (list): Contains (size, image postfix) tuples.
+            save_directory (str): Directory the images were saved to.
+            policy (None; OutputPolicy): Policy they were encoded with.
+        """
+        policy = policy or OutputPolicy()
+        for size, postfix in renditions:
+            saved = policy.output_type(image_type, postfix)
+            path = ImageSizer.output_path(image_name, size, saved,
+                                          renditions, save_directory)
+            with open(path, "rb") as f:
+                cache.put_output(digest, size, postfix, saved, f.read(),
+                                 policy.key())
+
+    @staticmethod
+    def cover(renditions):
+        """Get the smallest size covering every rendition.
+
+        Args:
+            renditions (list): Contains (size, image postfix) tuples.
+
+        Returns:
+            tuple: (largest width, largest height).
+        """
+        return (max(size[0] for size, _ in renditions),
+                max(size[1] for size, _ in renditions))
+
+    @staticmethod
+    def draft(image, size):
+        """Have a JPEG not yet decoded decode at a reduced scale.
+
+        libjpeg can decode at 1/2, 1/4 or 1/8 scale, skipping most of the
+        work; the smallest scale still covering size is picked. Other
+        formats, and images already decoded, are left alone.
+
+        Args:
+            image (PIL): Image object.
+            size (tuple): Size the image will be resized to.
+        """
+        if image.format == "JPEG":
+            image.draft(image.mode, size)
+
+    @staticmethod
+    def resize(image, size, reducing_gap=3.0):
+        """Downscale image to size quickly, with a high-quality last step.
+
+        JPEGs are decoded in draft mode (see ImageSizer.draft). The image is
+        then reduced by a whole factor with a box filter until it is within
+        reducing_gap times size, and LANCZOS only does the rest.
+
+        Args:
+            image (PIL): Image object.
+            size (tuple): Size to resize image to.
+            reducing_gap (None; float): None for a LANCZOS resize of the
+                full image, as before; 3.0 is indistinguishable from it in
+                practice (see Benchmark.py).
+
+        Returns:
+            PIL: Resized image.
+        """
+        if not reducing_gap:
+            return image.resize(size, LANCZOS)
+        ImageSizer.draft(image, size)
+        try:
+            return image.resize(size, LANCZOS, reducing_gap=reducing_gap)
+        except TypeError:
+            # Pillow before 7.0 has no reducing_gap
+            return image.resize(size, LANCZOS)
+
+
+def worker_context():
+    """Get the multiprocessing context worker processes are started with.
+
+    ProcessPoolExecutor starts its workers lazily, from whichever thread
+    submits first. A worker forked from a download thread inherits every
+    lock the other threads held at that moment and can hang on one, so
+    workers are started by a fork server (or spawned, where there is none)
+    instead.
+
+    Returns:
+        multiprocessing.context.BaseContext: 'forkserver' or 'spawn'.
+    """
+    if "forkserver" in get_all_start_methods():
+        return get_context("forkserver")
+    return get_context("spawn")
+
+
+def resize_source(source, image_name, image_type, renditions, save_directory,
+                  max_pixels, policy=None):
+    """Open one image and save its renditions (run in a worker process).
+
+    Args:
+        source (str): Path of the image (a temporary copy of a download).
+        image_name (str): Name of image.
+        image_type (None; str): Image postfix (type); None to detect it.
+        renditions (list): Contains (size, image postfix) tuples; see
+            ImageSizer.renditions.
+        save_directory (str): Directory to save images to.
+        max_pixels (int): Most pixels (width * height) decoded.
+        policy (None; OutputPolicy): How renditions are encoded.
+
+    Returns:
+        str: Image postfix (type) of the source image.
+    """
+    image = ImageRetriever.open_image(source, max_pixels,
+                                      ImageSizer.cover(renditions))
+    if image_type is None:
+        image_type = ImageRetriever.url_image_type(image)
+    ImageSizer.renditions(image, image_name, image_type, renditions,
+                          save_directory, policy)
+    return image_type
+
+
+class Pipeline(object):
+    """Download images in threads and resize them in worker processes.
+
+    Downloads (I/O bound) run in a pool of threads and hand each file to a
+    pool of processes that decode, resize and encode it (CPU bound), so
+    resizing scales with the number of cores. A download is handed over as
+    the path of a temporary copy on disk, not as bytes, and at most
+    queue_size images are between the two stages at any time, which keeps
+    memory bounded whatever the size of the batch.
+
+    With a cache on the image retriever, URL images whose renditions are
+    all cached are saved from it without being decoded, and new renditions
+    are added to it once resized. URL images already at their renditions'
+    size are saved as downloaded (see ImageSizer.pass_through).
+    """
+
+    def __init__(self, image_retriever, downloads=16, processes=None,
+                 queue_size=None, upscale=True, policy=None):
+        """Initialize class variables.
+
+        Args:
+            image_retriever (ImageRetriever): Downloads the images.
+            downloads (int): Downloads run at once.
+            processes (None; int): Worker processes (default: CPU count).
+            queue_size (None; int): Most images downloaded or queued but
+                not yet resized (default: twice the processes).
+            upscale (bool): See ImageSizer.pass_through.
+            policy (None; OutputPolicy): How images are encoded (default:
+                OutputPolicy()).
+        """
+        self.image_retriever = image_retriever
+        self.upscale = upscale
+        self.policy = policy or OutputPolicy()
+        self.downloads = downloads
+        self.processes = processes or cpu_count() or 1
+        self.queue_size = queue_size or 2 * self.processes
+        self.lock = threading.Lock()
+        self.resized = 0
+        self.cached = 0
+
+    def url_images(self, data, save_directory):
+        """Resize the URL images of data.
+
+        Args:
+            data (list): Contains [url, renditions, image_name] lines, as
+                parsed by DataRetriever.
+            save_directory (str): Directory to save images to.
+
+        Returns:
+            int: Number of images resized (or saved from the cache).
+        """
+        self.resized = self.cached = 0
+        slots = threading.BoundedSemaphore(self.queue_size)
+        with ProcessPoolExecutor(self.processes,
+                                 mp_context=worker_context()) as workers:
+            with ThreadPoolExecutor(self.downloads) as downloads:
+                for url, renditions, image_name in data:
+                    slots.acquire()
+                    downloads.submit(self.download, workers, slots, url,
+                                     image_name, renditions, save_directory)
+        return self.resized
+
+    def local_images(self, paths, size, save_directory):
+        """Resize local images.
+
+        Args:
+            paths (iterable): Contains (path, image name, image postfix)
+                tuples, as yielded by ImageRetriever.scan.
+            size (tuple): Size to resize images to.
+            save_directory (str): Directory to save images to.
+
+        Returns:
+            int: Number of images resized.
+        """
+        self.resized = 0
+        slots = threading.BoundedSemaphore(self.queue_size)
+        with ProcessPoolExecutor(self.processes,
+                                 mp_context=worker_context()) as workers:
+            for path, image_name, image_type in paths:
+                slots.acquire()
+                self.submit(workers, slots, path, path, image_name,
+                            image_type, [(size, None)], save_directory)
+        return self.resized
+
+    def download(self, workers, slots, url, image_name, renditions,
+                 save_directory):
+        """Download url and queue it for resizing (run in a thread).
+
+        Args:
+            workers (ProcessPoolExecutor): Pool resizing the images.
+            slots (BoundedSemaphore): Released once url is done with.
+            url (str): URL to get image from.
+            image_name (str): Name of image.
+            renditions (list): Contains (size, image postfix) tuples.
+            save_directory (str): Directory to save images to.
+        """
+        cache = self.image_retriever.cache
+        try:
+            source, header = self.image_retriever.url_data(url)
+            with source:
+                digest = cache and cache.source_hash(url)
+                if digest and ImageSizer.restore(cache, digest, image_name,
+                                                 renditions, save_directory,
+                                                 self.policy):
+                    self.saved(slots, cached=True)
+                    return
+                image_type = ImageSizer.pass_through(
+                    source, header, image_name, renditions, save_directory,
+                    self.upscale, self.policy)
+                if image_type:
+                    if digest:
+                        ImageSizer.store(cache, digest, image_name,
+                                         image_type, renditions,
+                                         save_directory, self.policy)
+                    self.saved(slots)
+                    return
+                path = self.spool(source)
+
+            store = None
+            if digest:
+                store = partial(ImageSizer.store, cache, digest, image_name,
+                                renditions=renditions,
+                                save_directory=save_directory,
+                                policy=self.policy)
+            self.submit(workers, slots, url, path, image_name, None,
+                        renditions, save_directory, store, temporary=True)
+        except ResponseTooLarge as e:
+            slots.release()
+            print("Too large, skipped: {} ({})".format(url, e))
+        except Exception as e:
+            slots.release()
+            print("Failed: {} ({})".format(url, e))
+
+    @staticmethod
+    def spool(source, chunk_size=65536):
+        """Copy an image file to a temporary file a worker can open.
+
+        Args:
+            source (file): The image file.
+            chunk_size (int): Bytes copied at a time.
+
+        Returns:
+            str: Path of the copy (to be removed once resized).
+        """
+        source.seek(0)
+        with NamedTemporaryFile(delete=False) as f:
+            try:
+                copyfileobj(source, f, chunk_size)
+            except BaseException:
+                f.close()
+                remove(f.name)
+                raise
+        return f.name
+
+    def saved(self, slots, cached=False):
+        """Count an image saved without a worker process.
+
+        Args:
+            slots (BoundedSemaphore): Released for the next image.
+            cached (bool): True if it was saved from the cache.
+        """
+        slots.release()
+        with self.lock:
+            self.resized += 1
+            self.cached += cached
+
+    def submit(self, workers, slots, label, source, image_name, image_type,
+               renditions, save_directory, store=None, temporary=False):
+        """Queue an image for resizing in a worker process.
+
+        Args:
+            workers (ProcessPoolExecutor): Pool resizing the images.
+            slots (BoundedSemaphore): Released once the image is resized.
+            label (str): URL or path of the image, for messages.
+            source (str): Path of the image.
+            image_name (str): Name of image.
+            image_type (None; str): Image postfix (type); None to detect it.
+            renditions (list): Contains (size, image postfix) tuples.
+            save_directory (str): Directory to save images to.
+            store (None; function): Called with the image postfix (type)
+                of the source once resized (adds it to the cache).
+            temporary (bool): If True, source is removed once resized.
+        """
+        temporary = source if temporary else None
+        try:
+            job = workers.submit(resize_source, source, image_name,
+                                 image_type, renditions, save_directory,
+                                 self.image_retriever.max_pixels,
+                                 self.policy)
+        except BaseException:
+            if temporary:
+                remove(temporary)
+            raise
+        job.add_done_callback(partial(self.finished, slots, label, store,
+                                      temporary))
+
+    def finished(self, slots, label, store, temporary, job):
+        """Count a resized image, or report why it failed.
+
+        Args:
+            slots (BoundedSemaphore): Released for the next image.
+            label (str): URL or path of the image.
+            store (None; function): See self.submit.
+            temporary (None; str): Path of a temporary copy to remove.
+            job (Future): Finished resize_source call.
+        """
+        try:
+            error = job.exception()
+            if not error and store:
+                store(image_type=job.result())
+        except Exception as e:
+            error = e
+        finally:
+            slots.release()
+            if temporary:
+                try:
+                    remove(temporary)
+                except OSError:
+                    pass
+        if isinstance(error, ResponseTooLarge):
+            print("Too large, skipped: {} ({})".format(label, error))
+        elif error:
+            print("Failed: {} ({})".format(label, error))
+        else:
+            with self.lock:
+                self.resized += 1
 
 
 class Selector(object):
     """Command prompt selector UI."""
 
-    def __init__(self, csv_filename, open_directory, save_directory):
-        """Initialize class variables and class objects."""
+    def __init__(self, csv_filename, open_directory, save_directory,
+                 pipeline=False, downloads=16, processes=None,
+                 cache_directory=None, cache_size=2 ** 30, upscale=True,
+                 policy=None):
+        """Initialize class variables and class objects.
+
+        Args:
+            csv_filename (str): Name of .csv file of URL images.
+            open_directory (str): Directory of local images.
+            save_directory (str): Directory to save images to.
+            pipeline (bool): If True, images are resized by a Pipeline;
+                otherwise one at a time.
+            downloads (int): Downloads run at once by the pipeline.
+            processes (None; int): Worker processes of the pipeline
+                (default: CPU count).
+            cache_directory (None; str): Directory of an ImageCache for URL
+                images; None for no cache.
+            cache_size (int): Most bytes kept in the cache.
+            upscale (bool): If False, URL images smaller than a rendition
+                are saved as they are rather than enlarged.
+            policy (None; OutputPolicy): How images are encoded (default:
+                OutputPolicy()).
+        """
         self.csv_filename = csv_filename
         self.open_directory = open_directory
         self.save_directory = save_directory
+        self.upscale = upscale
+        self.policy = policy or OutputPolicy()
 
+        self.cache = None
+        if cache_directory:
+            self.cache = ImageCache(cache_directory, cache_size)
         self.data_retriever = DataRetriever()
-        self.image_retriever = ImageRetriever()
+        self.image_retriever = ImageRetriever(cache=self.cache)
         self.image_sizer = ImageSizer()
+        self.pipeline = None
+        if pipeline:
+            self.pipeline = Pipeline(self.image_retriever, downloads,
+                                     processes, upscale=upscale,
+                                     policy=self.policy)
 
     @staticmethod
     def interface():
@@ -143,13 +1038,61 @@ class Selector(object):
         print(options + option1 + option2)
 
     def option1(self):
-        """Resize URL images in a .csv file."""
+        """Resize URL images in a .csv file.
+
+        Each image is downloaded and decoded once, however many renditions
+        its line lists. With a cache, unchanged images whose renditions are
+        cached are not decoded at all.
+        """
         data = self.data_retriever.local_data(self.csv_filename, parse=True)
-        for line in data:
-            url, size, image_name = line
-            image, image_type = self.image_retriever.url_image(url)
-            self.image_sizer.run(image, image_name, image_type, size,
-                                 self.save_directory)
+        try:
+            if self.pipeline:
+                self.pipeline.url_images(data, self.save_directory)
+            else:
+                for line in data:
+                    self.url_image(*line)
+        finally:
+            if self.cache:
+                self.cache.save()
+
+    def url_image(self, url, renditions, image_name):
+        """Save the renditions of one URL image, from the cache if it can.
+
+        Failures are printed and the image is skipped, as by
+        Pipeline.download, so one bad URL does not end the batch.
+
+        Args:
+            url (str): URL to get image from.
+            renditions (list): Contains (size, image postfix) tuples.
+            image_name (str): Name of image.
+        """
+        try:
+            source, header = self.image_retriever.url_data(url)
+            with source:
+                digest = self.cache and self.cache.source_hash(url)
+                if digest and self.image_sizer.restore(
+                        self.cache, digest, image_name, renditions,
+                        self.save_directory, self.policy):
+                    return
+                image_type = self.image_sizer.pass_through(
+                    source, header, image_name, renditions,
+                    self.save_directory, self.upscale, self.policy)
+                if not image_type:
+                    image = self.image_retriever.open_image(
+                        source, self.image_retriever.max_pixels,
+                        self.image_sizer.cover(renditions))
+                    image_type = self.image_retriever.url_image_type(image)
+                    self.image_sizer.renditions(
+                        image, image_name, image_type, renditions,
+                        self.save_directory, self.policy)
+            if digest:
+                self.image_sizer.store(self.cache, digest, image_name,
+                                       image_type, renditions,
+                                       self.save_directory, self.policy)
+        except ResponseTooLarge as e:
+            print("Too large, skipped: {} ({})".format(url, e))
+        except Exception as e:
+            print("Failed: {} ({})".format(url, e))
 
     def option2(self, size):
         """Resize images on a local drive.
@@ -157,12 +1100,15 @@ class Selector(object):
         Args:
             size (tuple): Size to resize image(s) to.
         """
+        if self.pipeline:
+            paths = self.image_retriever.scan(self.open_directory)
+            self.pipeline.local_images(paths, size, self.save_directory)
+            return
         data = self.image_retriever.local_images(self.open_directory)
         for line in data:
-            image, image_filename = line
-            image_name, image_type = image_filename.split(".")
+            image, image_name, image_type = line
             self.image_sizer.run(image, image_name, image_type, size,
-                                 self.save_directory)
+                                 self.save_directory, self.policy)
 
     def run(self, cmd=None):
         """Run command prompt selector."""
@@ -191,8 +1137,31 @@ def main():
     open_directory = input("Enter name of open directory: ")
     save_directory = input("Enter name of save directory: ")
 
+    # Pipeline mode: downloads run in threads and resizing in worker
+    # processes (None for one per CPU); False resizes one image at a time
+    pipeline = True
+    downloads = 16
+    processes = None
+
+    # On-disk cache of URL images and their renditions (None for no
+    # cache): unchanged images are neither downloaded nor resized again
+    cache_directory = "cache"
+    cache_size = 2 ** 30
+
+    # False saves URL images smaller than their size as they are (no
+    # decoding) rather than enlarging them
+    upscale = True
+
+    # Encoding of saved images (see OutputPolicy.py; Benchmark.py --encode
+    # compares encode time against file size)
+    policy = OutputPolicy(jpeg_quality=85, progressive=True, optimize=True,
+                          png_compress_level=6, webp=False,
+                          strip_metadata=True)
+
     # Activates command prompt selector
-    selector = Selector(csv_filename, open_directory, save_directory)
+    selector = Selector(csv_filename, open_directory, save_directory,
+                        pipeline, downloads, processes, cache_directory,
+                        cache_size, upscale, policy)
     selector.run()
 
     # To skip the command prompt selector:
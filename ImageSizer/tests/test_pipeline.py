@@ -0,0 +1,98 @@
+# test_pipeline - Johnathon Kwisses (Kwistech)
+"""Tests for Pipeline: URL images resize without hanging."""
+from functools import partial
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+import os
+from socketserver import ThreadingMixIn
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+from PIL import Image
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS, os.pardir))
+
+# Run in a child process so that a hung pool can be killed
+RUN = """
+import sys
+sys.path.insert(0, sys.argv[1])
+from main import ImageRetriever, Pipeline
+base, save_directory, images, runs = sys.argv[2:]
+data = [["{}/{}.png".format(base, i), [((40, 30), None)],
+         "{}.png".format(i)] for i in range(int(images))]
+for _ in range(int(runs)):
+    pipeline = Pipeline(ImageRetriever(timeout=10), downloads=8,
+                        processes=2)
+    print(pipeline.url_images(data, save_directory))
+"""
+
+
+class Handler(SimpleHTTPRequestHandler):
+    """Class for Handler."""
+
+    def log_message(self, *args):
+        """Keep the test output quiet."""
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    """Class for Server."""
+
+    daemon_threads = True
+
+
+class TestPipeline(unittest.TestCase):
+    """Class for TestPipeline."""
+
+    images = 16
+    runs = 10
+    timeout = 120
+
+    def setUp(self):
+        """Serve a directory of images on a free local port."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.open_directory = os.path.join(self.directory.name, "open")
+        self.save_directory = os.path.join(self.directory.name, "save")
+        os.mkdir(self.open_directory)
+        os.mkdir(self.save_directory)
+        for i in range(self.images):
+            image = Image.new("RGB", (400, 300), (i * 15, 100, 200))
+            image.save(os.path.join(self.open_directory,
+                                    "{}.png".format(i)))
+
+        handler = partial(Handler, directory=self.open_directory)
+        self.server = Server(("127.0.0.1", 0), handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.base = "http://127.0.0.1:{}".format(self.server.server_port)
+
+    def tearDown(self):
+        """Stop the server and remove the images."""
+        self.server.shutdown()
+        self.server.server_close()
+        self.directory.cleanup()
+
+    def test_url_images_do_not_hang(self):
+        """Repeated runs with download threads and workers all finish."""
+        process = subprocess.Popen(
+            [sys.executable, "-c", RUN, os.path.join(TESTS, os.pardir),
+             self.base, self.save_directory, str(self.images),
+             str(self.runs)],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            universal_newlines=True)
+        try:
+            output, _ = process.communicate(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            output, _ = process.communicate()
+            self.fail("Pipeline hung:\n{}".format(output))
+        self.assertEqual(output.split(), [str(self.images)] * self.runs,
+                         output)
+        self.assertEqual(len(os.listdir(self.save_directory)), self.images)
+
+
+if __name__ == "__main__":
+    unittest.main()
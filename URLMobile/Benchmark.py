@@ -0,0 +1,193 @@
+# Benchmark - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""Benchmark viewport detection: BeautifulSoup against the page analyzer.
+
+Both run over a corpus of saved HTML pages (one .html file per page). The
+BeautifulSoup path parses each whole page like URLMobile used to; the
+streaming path feeds each page in chunks to PageAnalyzer.analyze() and
+stops at the end of the head (with only the viewport rule, or with every
+rule in RULES using --all-rules). Results are printed as pages/sec and
+bytes scanned, along with how many pages the two paths disagree on.
+
+Usage:
+    python Benchmark.py corpus [--save Domain_names.csv] [--generate 500]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from urllib.request import urlopen
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, "URLVerifier"))
+from PageAnalyzer import RULES, ViewportRule, analyze
+
+
+def save_corpus(filename, directory, limit=500):
+    """Download pages of the URL's in filename into directory.
+
+    Args:
+        filename (str): Name of file to get URL's from.
+        directory (str): Directory to save pages to.
+        limit (int): Most pages saved.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(filename) as f:
+        urls = [line.split(";")[0].strip() for line in f][1:]
+
+    saved = 0
+    for url in urls:
+        if not url:
+            continue
+        if saved >= limit:
+            break
+        try:
+            with urlopen(url, timeout=10) as response:
+                html = response.read()
+        except (OSError, ValueError):
+            continue
+        saved += 1
+        name = os.path.join(directory, "{:05d}.html".format(saved))
+        with open(name, "wb") as f:
+            f.write(html)
+    print("Saved {} pages to '{}'".format(saved, directory))
+
+
+def generate_corpus(directory, count=500, seed=0):
+    """Write count synthetic pages to directory.
+
+    Pages have heads of 1-20 KB (about 3 in 4 with a viewport tag, placed
+    anywhere in the head) and bodies of 20-500 KB.
+
+    Args:
+        directory (str): Directory to write pages to.
+        count (int): Number of pages.
+        seed (int): Random seed, so the corpus can be regenerated.
+    """
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    rng = random.Random(seed)
+    filler = ('<link rel="stylesheet" href="/static/site.css">'
+              '<script src="/static/app.js"></script>'
+              '<meta property="og:title" content="Example page">')
+    viewport = ('<meta name="viewport" '
+                'content="width=device-width, initial-scale=1">')
+    paragraph = "<p>{}</p>".format("Lorem ipsum dolor sit amet. " * 20)
+
+    for i in range(count):
+        head = [filler] * (rng.randint(1000, 20000) // len(filler))
+        if rng.random() < 0.75:
+            head.insert(rng.randint(0, len(head)), viewport)
+        body = paragraph * (rng.randint(20000, 500000) // len(paragraph))
+        page = ("<!DOCTYPE html><html><head><title>Page {}</title>{}"
+                "</head><body>{}</body></html>").format(i, "".join(head),
+                                                        body)
+        name = os.path.join(directory, "{:05d}.html".format(i))
+        with open(name, "wb") as f:
+            f.write(page.encode("utf-8"))
+    print("Generated {} pages in '{}'".format(count, directory))
+
+
+def soup_viewport(html):
+    """Detect the viewport the way URLMobile did before streaming.
+
+    Args:
+        html (bytes): Whole page.
+
+    Returns:
+        bool: True if any meta tag mentions 'viewport'.
+    """
+    for result in BeautifulSoup(html, "html.parser").find_all("meta"):
+        if "viewport" in str(result):
+            return True
+    return False
+
+
+def stream_viewport(html, chunk_size=4096, rules=(ViewportRule,)):
+    """Detect the viewport by feeding html to analyze() in chunks.
+
+    Args:
+        html (bytes): Whole page.
+        chunk_size (int): Bytes fed at a time, as read from a response.
+        rules (list): Rule classes to run; ViewportRule must be first.
+
+    Returns:
+        tuple: [0] = True if a viewport was found; [1] = bytes read.
+    """
+    chunks = (html[i:i + chunk_size]
+              for i in range(0, len(html), chunk_size))
+    values, read = analyze(chunks, rules)
+    return values[0], read
+
+
+def benchmark(directory, chunk_size=4096, rules=(ViewportRule,)):
+    """Time both paths over every page in directory.
+
+    Args:
+        directory (str): Directory of saved .html pages.
+        chunk_size (int): Bytes fed at a time to the streaming parser.
+        rules (list): Rule classes run by the streaming path.
+
+    Returns:
+        list: Rows of (path, pages/sec, MB scanned, pages found with a
+            viewport); the last row counts the pages the paths disagree on.
+    """
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".html"):
+            with open(os.path.join(directory, name), "rb") as f:
+                pages.append(f.read())
+    if not pages:
+        raise IOError("No .html pages in '{}'".format(directory))
+
+    start = time.time()
+    soup = [soup_viewport(html) for html in pages]
+    soup_time = time.time() - start
+
+    start = time.time()
+    stream = [stream_viewport(html, chunk_size, rules) for html in pages]
+    stream_time = time.time() - start
+
+    total = sum(len(html) for html in pages) / 1e6
+    scanned = sum(read for _, read in stream) / 1e6
+    found = [viewport for viewport, _ in stream]
+    disagree = sum(1 for a, b in zip(soup, found) if a != b)
+    return [("soup", len(pages) / soup_time, total, sum(soup)),
+            ("stream", len(pages) / stream_time, scanned, sum(found)),
+            ("disagree", 0.0, 0.0, disagree)]
+
+
+def main():
+    """Parse arguments and print the benchmark table."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("corpus", help="directory of saved .html pages")
+    parser.add_argument("--save", metavar="FILENAME",
+                        help="first download pages of the URL's in FILENAME")
+    parser.add_argument("--generate", type=int, metavar="COUNT",
+                        help="first write COUNT synthetic pages")
+    parser.add_argument("--limit", type=int, default=500,
+                        help="most pages saved with --save")
+    parser.add_argument("--chunk-size", type=int, default=4096)
+    parser.add_argument("--all-rules", action="store_true",
+                        help="stream with every rule instead of the "
+                             "viewport rule only")
+    args = parser.parse_args()
+
+    if args.save:
+        save_corpus(args.save, args.corpus, args.limit)
+    if args.generate:
+        generate_corpus(args.corpus, args.generate)
+
+    rules = RULES if args.all_rules else [ViewportRule]
+    rows = benchmark(args.corpus, args.chunk_size, rules)
+    print("{:<10}{:>12}{:>16}{:>10}".format("Path", "Pages/sec",
+                                            "MB scanned", "Pages"))
+    for path, rate, scanned, count in rows:
+        print("{:<10}{:>12.1f}{:>16.1f}{:>10}".format(path, rate, scanned,
+                                                      count))
+
+if __name__ == "__main__":
+    main()
@@ -1,145 +1,93 @@
-# URLMobile - Python 2.7 - Johnathon Kwisses (Kwistech)
+# URLMobile - Python 3.5 - Johnathon Kwisses (Kwistech)
 """This script is used to check URL's if they are compatible with
-smartphones or tablets. It does so by checking for 'viewport' in the
-head metadata HTML return of the URL.
+smartphones or tablets. It does so by checking for a 'viewport' meta tag
+in the head of the HTML return of the URL, along with the other checks in
+the rules list (canonical and AMP links, media queries, touch icons).
 
-A boolean value is returned from the search and is then written to
-a .csv file using specified settings defined in main()."""
-from BeautifulSoup import BeautifulSoup
-import csv
-from multiprocessing.pool import ThreadPool
-import requests
+URL's are fetched by URLVerifier's thread engine (its keep-alive
+ConnectionPool, timeouts, host scheduling, DNS and result caches), so each
+URL is checked for existence and mobile readiness in one pass: one GET
+whose page is scanned as it downloads, until the head has been read.
 
+Results are written to a .csv file using specified settings defined in
+main()."""
+import os
+import sys
 
-def get_urls(filename, parsed=True):
-    """Get URL's from filename.
-
-    Args:
-        filename (str): Name of file to get URL's from.
-        parsed (bool): If urls should be parsed.
-
-    Returns:
-        list: Contains URL's as strings.
-    """
-    with open(filename) as urls:
-        urls = urls.readlines()
-    if parsed:
-        parsed_urls = parse_urls(urls)
-        return parsed_urls
-    else:
-        return urls
-
-
-def parse_urls(urls, separator=";"):
-    """Parse urls by splitting them using separator.
-
-    Args:
-        urls (list): Contains urls to be parsed.
-        separator (str): Symbol to use to split urls.
-
-    Returns:
-        list: parsed urls.
-    """
-    parsed_urls = []
-    urls = [url.split(separator) for url in urls]
-    for url in urls:
-        parsed_urls.append(url[0])
-    return parsed_urls
-
-
-def fetch_urls(url, tag="meta", check=b"viewport", count=[0]):
-    """Fetch url and return results in a tuple.
-
-    Args:
-        url (str): URL to be fetched.
-        tag (str): Tag to be searched in HTML.
-        check (str): To be searched in tag.
-        count (list): Used to output url count to console.
-
-    Returns:
-        tuple: [0] = url; [1] = string ('Exist' or 'Don't Exist').
-
-    Raises:
-        ValueError: If url not a valid url.
-        urllib.error.HTTPError: If url not found.
-    """
-    viewport = False
-    try:
-        response = requests.get(url)
-    except:
-        return url, "Don't exist"
-    else:
-        results = response.content
-        soup = BeautifulSoup(results).findAll(tag)
-        for result in soup:
-            if check in str(result):
-                viewport = True
-    finally:
-        count[0] += 1
-        print count[0], "URL's checked"
-        return url, viewport
-
-
-def get_output(results):
-    """Get output from results.
-
-    Args:
-        results (generator): Holds results from URL.
-
-    Returns:
-        list: Contains output from results.
-    """
-    output = []
-    for url, exists in results:
-        output.append([url, exists])
-    output.sort()
-    return output
-
-
-def write_lines_csv(filename, rows, header=None):
-    """Write rows to filename (to a .csv file only).
-
-    header should contain strings with header names for
-    each column.
-
-    Args:
-        filename (str): Name of file to be written to (postfix=.csv).
-        rows (list): Contains items to be written to filename.
-        header (list): Header to be written to filename.
-    """
-    with open(filename, "wb") as f:
-        writer = csv.writer(f)
-        if header:
-            writer.writerow(header)
-        writer.writerows(rows)
-    print("Successfully written rows to '{}'!".format(filename))
+# Shared crawl infrastructure lives with URLVerifier
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, "URLVerifier"))
+from PageAnalyzer import RULES
+from URLVerifier import verify
 
 
 def main():
     """Attempt to fetch URL's and write results to a .csv file.
 
-    Note: A memory error might occur if the number of threads is too high.
-    If this occurs, set the threads variable to a smaller integer.
+    Note: A memory error might occur if the number of workers is too high
+    with the thread engine. If this occurs, set the workers variable to a
+    smaller integer.
     """
-    # Program variables
+    # Program variables; URL's are the first ';' separated column
     filename_in = "Domain_names.csv"
     filename_out = "Parsed-{}".format(filename_in)
-    header = ["URL's", "Responsive for Smartphones / Tablets (viewport)"]
-
-    # Number of threads and chunksize to use. Careful of overload!!!
-    threads = 650
-    chunksize = 25
-
-    # Get URL's and the fetch results
-    urls = get_urls(filename_in)
-    thread = ThreadPool(threads)
-    results = thread.imap_unordered(fetch_urls, urls[1:], chunksize=chunksize)
-
-    # Appends results to output for writing
-    output = get_output(results)
-
-    # Writes output to filename_out; header is optional
-    write_lines_csv(filename_out, output, header=header)
+    separator = ";"
+
+    # Checks run on every page; each adds its own column(s) to the output.
+    # Pages are read in small chunks and cut off after max_page_bytes
+    rules = RULES
+    max_page_bytes = 256 * 1024
+
+    # Engine to fetch with: "thread" (worker threads sharing a keep-alive
+    # connection pool) or "async" (AsyncVerifier, one connection per
+    # request)
+    engine = "thread"
+
+    # Most requests in flight overall (threads for the thread engine)
+    workers = 650
+
+    # Per host: requests per second, and most requests in flight. Each
+    # host's share grows towards max_per_host while it answers quickly and
+    # is halved when it slows down or requests fail
+    rate_per_host = 25
+    max_per_host = 50
+
+    # Seconds allowed per URL
+    timeout = 30
+
+    # Journal results so a rerun after a crash skips URL's already checked
+    checkpoint = True
+
+    # Results are kept across runs: reused for cache_ttl seconds, then
+    # revalidated with a conditional request (ETag / Last-Modified)
+    filename_cache = "Cache-URLMobile.db"
+    cache_ttl = 12 * 60 * 60
+    cache_entries = 1000000
+
+    # Seconds DNS answers are cached, and hosts resolved at once up front
+    dns_ttl = 300
+    dns_workers = 100
+
+    # Seconds between progress lines, and JSON-lines file the progress and
+    # latency per phase are appended to (None for neither)
+    progress_every = 1.0
+    filename_metrics = "Metrics-URLMobile.jsonl"
+
+    # Transient failures (timeouts, resets, 429 / 5xx) are retried up to
+    # attempts times with a jittered, doubling backoff (or Retry-After)
+    attempts = 3
+    retry_delay = 1.0
+    max_retry_delay = 60.0
+
+    verify(filename_in, filename_out, engine=engine, workers=workers,
+           rate_per_host=rate_per_host, max_per_host=max_per_host,
+           timeout=timeout, checkpoint=checkpoint,
+           filename_cache=filename_cache, cache_ttl=cache_ttl,
+           cache_entries=cache_entries, dns_ttl=dns_ttl,
+           dns_workers=dns_workers, separator=separator, rules=rules,
+           max_page_bytes=max_page_bytes, progress_every=progress_every,
+           filename_metrics=filename_metrics, attempts=attempts,
+           retry_delay=retry_delay, max_retry_delay=max_retry_delay)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,647 @@
+# AsyncVerifier - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""AsyncVerifier checks URL's for existence from a single asyncio event loop.
+
+Instead of one OS thread per request in flight (see URLVerifier.main), each
+request is a coroutine on a non-blocking socket. The number of requests in
+flight is capped globally, and HostScheduler interleaves hosts and paces
+each one so that a sheet full of links to one server does not flood it.
+
+Given page rules (see PageAnalyzer), each URL is fetched with a GET and its
+page is scanned as it downloads, so existence and page checks take a single
+request.
+
+Connections are kept alive and reused per (scheme, host, port), like
+ConnectionPool does for the thread engine, so a sheet with thousands of
+links to one host pays for one TCP connection (and TLS handshake) per
+request in flight instead of one per link.
+
+Transient failures are retried as RetryPolicy decides; a URL waiting for
+its retry is parked in the scheduler, not in a coroutine.
+"""
+import asyncio
+import http.client
+import socket
+import ssl
+import time
+from urllib.parse import urljoin, urlsplit
+
+from ConnectionPool import describe_error, get_error_result, get_result, \
+    pushed_back, store_result
+from HostScheduler import Deferred, HostScheduler
+from Metrics import Metrics
+from PageAnalyzer import PageAnalyzer, get_page_result
+from ResultCache import ResultCache
+
+
+class AsyncVerifier:
+    """Class for AsyncVerifier."""
+
+    def __init__(self, limit=500, timeout=30, max_redirects=10, mode="head",
+                 scheduler=None, cache=None, rules=None,
+                 max_page_bytes=262144, metrics=None, retry=None,
+                 idle_timeout=30, drain_limit=8192):
+        """Initialize class variables.
+
+        Args:
+            limit (int): Maximum number of requests in flight.
+            timeout (int; float): Seconds before a request is abandoned.
+            max_redirects (int): Maximum redirects followed per URL.
+            mode (str): 'head' sends HEAD first and falls back to a partial
+                GET; 'get' sends a GET and stops reading after its headers.
+            scheduler (None; HostScheduler): Orders and paces URL's per host
+                (used for one run only).
+            cache (None; ResultCache): Cache to revalidate against and
+                store results in.
+            rules (None; list): Rule classes (see PageAnalyzer) to run on
+                each page; if given, mode is ignored and a GET is sent.
+            max_page_bytes (int): Most bytes of a page read for rules; the
+                download is cut off there.
+            metrics (None; Metrics): Gets every result and the time spent
+                in each phase of every request.
+            retry (None; RetryPolicy): Decides which failures are retried
+                and when (None for no retries).
+            idle_timeout (int; float): Seconds before an idle connection is
+                closed.
+            drain_limit (int): Largest unread body (bytes) drained to keep
+                a connection alive; larger bodies close the connection.
+        """
+        self.limit = limit
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.mode = mode
+        self.scheduler = scheduler or HostScheduler()
+        self.cache = cache
+        self.rules = rules
+        self.max_page_bytes = max_page_bytes
+        self.ssl_context = ssl.create_default_context()
+        self.metrics = metrics or Metrics()
+        self.retry = retry
+        self.idle_timeout = idle_timeout
+        self.drain_limit = drain_limit
+
+        # (scheme, host, port) -> list of [reader, writer, time last used];
+        # only touched from the event loop, so no lock is needed
+        self.idle = {}
+        self.last_sweep = time.monotonic()
+
+    def imap_unordered(self, urls):
+        """Fetch urls and yield results as they complete.
+
+        urls is consumed lazily: the scheduler holds at most its
+        max_pending URL's and at most self.limit are in flight at any time.
+
+        Args:
+            urls (iterable): Contains URL's as strings.
+
+        Yields:
+            tuple: Results as returned by self.fetch_url.
+        """
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        scheduler = self.scheduler
+        urls = iter(urls)
+        pending = set()
+
+        try:
+            while True:
+                # Keeps the scheduler stocked so it can interleave hosts
+                while (not scheduler.closed and
+                       scheduler.pending < scheduler.max_pending):
+                    url = next(urls, None)
+                    if url is None:
+                        scheduler.close()
+                    else:
+                        scheduler.add(url, block=False)
+
+                wait = None
+                while len(pending) < self.limit:
+                    url, wait = scheduler.take()
+                    if url is None:
+                        break
+                    pending.add(loop.create_task(self.scheduled_fetch(url)))
+
+                if not pending:
+                    if scheduler.done():
+                        break
+                    loop.run_until_complete(asyncio.sleep(wait or 0))
+                    continue
+
+                done, pending = loop.run_until_complete(asyncio.wait(
+                    pending, timeout=wait,
+                    return_when=asyncio.FIRST_COMPLETED))
+                for task in done:
+                    result = task.result()
+                    if result is not None:
+                        yield result
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.wait(pending))
+            # Connections belong to this loop, so none outlive it
+            self.close()
+            asyncio.set_event_loop(None)
+            loop.close()
+
+    async def scheduled_fetch(self, url):
+        """Fetch url and report its latency and outcome to the scheduler.
+
+        Args:
+            url (str): URL taken from self.scheduler.
+
+        Returns:
+            None; tuple: Results as returned by self.fetch_url (None if
+                url was handed back to the scheduler for a retry).
+        """
+        start = time.monotonic()
+        try:
+            result = await self.fetch_url(url)
+        except Deferred as e:
+            self.scheduler.defer(url, e.delay)
+            self.scheduler.finish(url, time.monotonic() - start,
+                                  pushed_back(e.result))
+            return None
+        self.scheduler.finish(url, time.monotonic() - start,
+                              pushed_back(result))
+        return result
+
+    async def fetch_url(self, url):
+        """Fetch url and return results in a tuple.
+
+        Mirrors URLVerifier.fetch_url.
+
+        Args:
+            url (str): URL to be fetched.
+
+        Returns:
+            tuple: [0] = url; [1] = string ('Exist' or 'Don't Exist');
+                [2] = status code (int, or '' without a response);
+                [3] = reason for the verdict; [4:] = rule values (if any).
+
+        Raises:
+            Deferred: If the attempt failed and is to be retried.
+        """
+        start = time.monotonic()
+        entry = self.cache.take(url) if self.cache else None
+        headers = ResultCache.validators(entry)
+        values = None
+        status = None
+        response_headers = {}
+
+        try:
+            if self.rules:
+                check = self.analyze(url.strip(), headers=headers)
+            elif self.mode == "head":
+                check = self.check(url.strip(), headers=headers)
+            else:
+                check = self.get(url.strip(), headers=headers)
+            response = await asyncio.wait_for(check, self.timeout)
+        except asyncio.TimeoutError:
+            result = get_error_result(url, "Timed out", self.rules)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Any failure (not only OSError / HTTPException) is reported
+            # rather than raised, so it cannot end the run
+            result = get_error_result(url, describe_error(e), self.rules)
+        else:
+            status, reason, response_headers = response[:3]
+            if self.rules:
+                values = response[3]
+            result = get_result(url, status, reason, entry, self.cache,
+                                values)
+
+        delay = self.retry.delay(url, result, response_headers) \
+            if self.retry else None
+        if delay is None and status not in (None, 304):
+            # Only final results are cached, never an attempt to be retried
+            store_result(self.cache, result, response_headers)
+        self.metrics.record(result, time.monotonic() - start,
+                            retried=delay is not None)
+        if delay is not None:
+            raise Deferred(delay, result)
+        return result
+
+    async def check(self, url, headers=None):
+        """Check if url exists without downloading its body.
+
+        Sends HEAD first and falls back to a GET for the first byte only if
+        the server rejects HEAD (405 / 501).
+
+        Args:
+            url (str): URL to be checked.
+            headers (None; dict): Extra request headers.
+
+        Returns:
+            tuple: [0] = status code (int); [1] = reason for the verdict;
+                [2] = headers (dict, lowercase).
+        """
+        status, reason, response_headers = await self.follow(
+            url, method="HEAD", headers=headers)
+        if status not in (405, 501):
+            reason = "HEAD {} {}".format(status, reason)
+            return status, reason, response_headers
+
+        head_status = status
+        headers = dict(headers or {}, Range="bytes=0-0")
+        status, reason, response_headers = await self.follow(url,
+                                                             headers=headers)
+        reason = "GET {} {} (HEAD {})".format(status, reason, head_status)
+        return status, reason, response_headers
+
+    async def analyze(self, url, headers=None):
+        """Check if url exists and run self.rules on its page in one GET.
+
+        Args:
+            url (str): URL to be checked.
+            headers (None; dict): Extra request headers.
+
+        Returns:
+            tuple: [0] = status code (int); [1] = reason for the verdict;
+                [2] = headers (dict, lowercase); [3] = list of rule values
+                (blank unless the page was fetched).
+        """
+        analyzer = PageAnalyzer(self.rules, self.max_page_bytes)
+        status, reason, response_headers = await self.follow(
+            url, headers=headers, scan=analyzer.scan)
+        reason, values = get_page_result(analyzer, status, reason,
+                                         self.rules)
+        return status, reason, response_headers, values
+
+    async def get(self, url, headers=None):
+        """Send a GET for url, reading only the response headers.
+
+        Args:
+            url (str): URL to be checked.
+            headers (None; dict): Extra request headers.
+
+        Returns:
+            tuple: [0] = status code (int); [1] = reason for the verdict;
+                [2] = headers (dict, lowercase).
+        """
+        status, reason, response_headers = await self.follow(url,
+                                                             headers=headers)
+        return status, "GET {} {}".format(status, reason), response_headers
+
+    async def follow(self, url, method="GET", headers=None, scan=None):
+        """Request url, following redirects up to self.max_redirects.
+
+        Args:
+            url (str): URL to be requested.
+            method (str): HTTP method to use.
+            headers (None; dict): Extra request headers.
+            scan (None; function): Fed the body of the final response if it
+                is a 2xx; see self.request.
+
+        Returns:
+            tuple: [0] = status code (int); [1] = reason phrase;
+                [2] = headers (dict, lowercase).
+
+        Raises:
+            ValueError: If url not a valid url or redirects loop.
+        """
+        for _ in range(self.max_redirects + 1):
+            status, reason, response_headers = await self.request(
+                url, method=method, headers=headers, scan=scan)
+            location = response_headers.get("location")
+            if status not in (301, 302, 303, 307, 308) or not location:
+                return status, reason, response_headers
+            url = urljoin(url, location)
+        raise ValueError("Too many redirects: {}".format(url))
+
+    async def request(self, url, method="GET", headers=None, scan=None):
+        """Send a single request over a pooled connection.
+
+        Only the status line and headers are read, unless scan reads the
+        body of a 2xx response. A body left unread is drained (so the
+        connection can be reused) if it is at most self.drain_limit bytes
+        long; otherwise the connection is closed, as it is when the server
+        answers 'Connection: close'. A reused connection that the server
+        has since closed is retried once on a fresh connection.
+
+        Args:
+            url (str): URL to be requested.
+            method (str): HTTP method to use.
+            headers (None; dict): Extra request headers.
+            scan (None; function): Fed the body of a 2xx response chunk by
+                chunk until it returns True.
+
+        Returns:
+            tuple: [0] = status code (int); [1] = reason phrase;
+                [2] = headers (dict, lowercase).
+
+        Raises:
+            ValueError: If url not a valid url or the response is malformed.
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError("Invalid URL: {}".format(url))
+
+        key = (parts.scheme, parts.hostname,
+               parts.port or (443 if parts.scheme == "https" else 80))
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        lines = [
+            "{} {} HTTP/1.1".format(method, path),
+            "Host: {}".format(parts.netloc.rpartition("@")[2]),
+            "User-Agent: URLVerifier",
+            "Accept: */*",
+        ]
+        for name, value in (headers or {}).items():
+            lines.append("{}: {}".format(name, value))
+        message = ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+        reader, writer, reused = await self.get_connection(key)
+        reusable = False
+        try:
+            try:
+                status, reason, response_headers = await self.send(
+                    reader, writer, message)
+            except (http.client.RemoteDisconnected, ConnectionError):
+                if not reused:
+                    raise
+                writer.close()
+                reader, writer = await self.connect(key)
+                status, reason, response_headers = await self.send(
+                    reader, writer, message)
+
+            start = time.monotonic()
+            if method == "HEAD" or status in (204, 304) or status < 200:
+                complete = True
+            elif scan and 200 <= status < 300:
+                complete = await read_body(reader, response_headers, scan)
+            else:
+                complete = await drain_body(reader, response_headers,
+                                            self.drain_limit)
+            self.metrics.phase("body", time.monotonic() - start)
+            connection = response_headers.get("connection", "").lower()
+            reusable = complete and "close" not in connection
+            return status, reason, response_headers
+        finally:
+            # Also reached when fetch_url's timeout cancels this coroutine
+            if reusable:
+                self.put_connection(key, reader, writer)
+            else:
+                writer.close()
+
+    async def send(self, reader, writer, message):
+        """Send a request on a connection and read its response head.
+
+        The time until the response headers arrive is recorded as the
+        first_byte phase.
+
+        Args:
+            reader (asyncio.StreamReader): Stream of the connection.
+            writer (asyncio.StreamWriter): Stream of the connection.
+            message (bytes): Request line and headers.
+
+        Returns:
+            tuple: As returned by read_head.
+        """
+        start = time.monotonic()
+        writer.write(message)
+        response = await read_head(reader)
+        self.metrics.phase("first_byte", time.monotonic() - start)
+        return response
+
+    async def connect(self, key):
+        """Open a new connection for key, timing TCP connect and TLS.
+
+        Args:
+            key (tuple): (scheme, host, port).
+
+        Returns:
+            tuple: [0] = asyncio.StreamReader; [1] = asyncio.StreamWriter.
+        """
+        scheme, host, port = key
+        https = scheme == "https"
+        start = time.monotonic()
+        sock = await open_socket(host, port)
+        self.metrics.phase("connect", time.monotonic() - start)
+        start = time.monotonic()
+        try:
+            reader, writer = await asyncio.open_connection(
+                sock=sock, ssl=self.ssl_context if https else None,
+                server_hostname=host if https else None)
+        except BaseException:
+            sock.close()
+            raise
+        if https:
+            self.metrics.phase("tls", time.monotonic() - start)
+        return reader, writer
+
+    async def get_connection(self, key):
+        """Take an idle connection for key, or open a new one.
+
+        Args:
+            key (tuple): (scheme, host, port).
+
+        Returns:
+            tuple: [0] = asyncio.StreamReader; [1] = asyncio.StreamWriter;
+                [2] = True if the connection was reused.
+        """
+        now = time.monotonic()
+        idle = self.idle.get(key, [])
+        while idle:
+            reader, writer, last_used = idle.pop()
+            # at_eof: the server closed it while it sat in the pool
+            if now - last_used < self.idle_timeout and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await self.connect(key)
+        return reader, writer, False
+
+    def put_connection(self, key, reader, writer):
+        """Keep a connection whose response was fully read for reuse.
+
+        Args:
+            key (tuple): (scheme, host, port).
+            reader (asyncio.StreamReader): Stream of the connection.
+            writer (asyncio.StreamWriter): Stream of the connection.
+        """
+        now = time.monotonic()
+        self.idle.setdefault(key, []).append([reader, writer, now])
+        if now - self.last_sweep >= self.idle_timeout:
+            self.last_sweep = now
+            self.evict_idle()
+
+    def evict_idle(self):
+        """Close connections that have been idle for self.idle_timeout."""
+        now = time.monotonic()
+        for key, idle in list(self.idle.items()):
+            fresh = []
+            for reader, writer, last_used in idle:
+                if now - last_used < self.idle_timeout:
+                    fresh.append([reader, writer, last_used])
+                else:
+                    writer.close()
+            if fresh:
+                self.idle[key] = fresh
+            else:
+                del self.idle[key]
+
+    def close(self):
+        """Close every idle connection."""
+        idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for _, writer, _ in connections:
+                writer.close()
+
+
+async def open_socket(host, port):
+    """Open a non-blocking TCP socket to host, trying each address in turn.
+
+    The lookup goes through socket.getaddrinfo (so through DNSCache when it
+    is installed, which records the dns phase itself).
+
+    Args:
+        host (str): Host name or address.
+        port (int): Port to connect to.
+
+    Returns:
+        socket.socket: Connected socket.
+
+    Raises:
+        OSError: If the lookup fails or no address accepts the connection.
+    """
+    loop = asyncio.get_event_loop()
+    addresses = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    error = OSError("No addresses for {}".format(host))
+    for family, type_, proto, _, address in addresses:
+        sock = socket.socket(family, type_, proto)
+        try:
+            sock.setblocking(False)
+            await loop.sock_connect(sock, address)
+            return sock
+        except OSError as e:
+            sock.close()
+            error = e
+        except BaseException:
+            sock.close()
+            raise
+    raise error
+
+
+async def read_head(reader, max_headers=100):
+    """Read an HTTP status line and headers from reader.
+
+    Lines are capped by the reader's limit (64 KB by default) and headers
+    by max_headers, like http.client, so a hostile server cannot make the
+    head grow without bound.
+
+    Args:
+        reader (asyncio.StreamReader): Stream positioned at a response.
+        max_headers (int): Most header lines accepted.
+
+    Returns:
+        tuple: [0] = status code (int); [1] = reason phrase;
+            [2] = headers (dict, lowercase).
+
+    Raises:
+        http.client.RemoteDisconnected: If the connection is closed before
+            a status line arrives.
+        ValueError: If the status line is malformed, a line is too long or
+            there are too many headers.
+    """
+    status_line = await reader.readline()
+    if not status_line:
+        # Same as http.client, so both engines report (and retry) it alike
+        raise http.client.RemoteDisconnected(
+            "Remote end closed connection without response")
+    parts = status_line.decode("latin-1").split(None, 2)
+    if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+        raise ValueError("Bad status line: {!r}".format(status_line))
+
+    headers = {}
+    for _ in range(max_headers + 1):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        if len(headers) >= max_headers:
+            raise ValueError("Got more than {} headers".format(max_headers))
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    reason = parts[2].strip() if len(parts) > 2 else ""
+    return int(parts[1]), reason, headers
+
+
+async def read_body(reader, headers, scan, chunk_size=4096):
+    """Feed the body of a response to scan until it returns True.
+
+    Handles chunked transfer coding, Content-Length and bodies delimited
+    by the end of the connection.
+
+    Args:
+        reader (asyncio.StreamReader): Stream positioned after the headers.
+        headers (dict): Response headers (lowercase).
+        scan (function): Called with each piece of the body; returns True
+            to stop reading.
+
+    Returns:
+        bool: True if the body was read to its end and the connection can
+            carry another request.
+
+    Raises:
+        ValueError: If a chunk size is malformed.
+    """
+    try:
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            while True:
+                size_line = await reader.readline()
+                size = int(size_line.split(b";")[0].strip() or b"0", 16)
+                if not size:
+                    # Trailers (if any) end with a blank line
+                    while await reader.readline() not in (b"\r\n", b"\n",
+                                                          b""):
+                        pass
+                    return True
+                while size:
+                    chunk = await reader.readexactly(min(size, chunk_size))
+                    size -= len(chunk)
+                    if scan(chunk):
+                        return False
+                await reader.readexactly(2)
+        else:
+            length = headers.get("content-length", "")
+            remaining = int(length) if length.isdigit() else None
+            while remaining is None or remaining > 0:
+                amount = chunk_size if remaining is None else \
+                    min(chunk_size, remaining)
+                chunk = await reader.read(amount)
+                if not chunk:
+                    return False
+                if remaining is not None:
+                    remaining -= len(chunk)
+                if scan(chunk):
+                    return remaining == 0
+            return True
+    except asyncio.IncompleteReadError:
+        return False
+
+
+async def drain_body(reader, headers, limit):
+    """Read and discard the body of a response if it is small.
+
+    Args:
+        reader (asyncio.StreamReader): Stream positioned after the headers.
+        headers (dict): Response headers (lowercase).
+        limit (int): Most bytes read; a longer body is left unread.
+
+    Returns:
+        bool: True if the body was read to its end and the connection can
+            carry another request.
+    """
+    length = headers.get("content-length", "")
+    chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+    if not chunked and not (length.isdigit() and int(length) <= limit):
+        # Too long, or delimited by the end of the connection
+        return False
+    seen = [0]
+
+    def scan(chunk):
+        seen[0] += len(chunk)
+        return seen[0] > limit
+
+    return await read_body(reader, headers, scan)
@@ -0,0 +1,444 @@
+# Benchmark - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""Benchmark the URLVerifier engines against a local stand-in HTTP server.
+
+The server simulates latency (with jitter), a mix of status codes, body
+sizes, slow-loris responses (trickled out over slow_seconds) and pages
+with or without a viewport tag. Every response is derived from a hash of
+its path, so runs with the same options see exactly the same responses.
+URL's can be spread over several loopback hosts (127.0.0.1 to 127.0.0.N,
+one server each; Linux only for N > 1) so per-host limits apply as they
+would on a real sheet.
+
+Each engine runs in its own child process so that its peak resident memory
+(RSS) and thread count can be measured without interference from the
+server or from the other engines. The 'verifier' workload checks existence
+as URLVerifier does; the 'mobile' workload also scans every page with the
+URLMobile rules. Results are printed as URL's/sec, p50 / p99 latency, peak
+RSS and peak threads per run, can be saved to a JSON file and compared
+against a saved baseline (exit status 1 on a regression).
+
+Usage:
+    python Benchmark.py [--count 5000] [--latency 0.05]
+        [--engines async thread]
+    python Benchmark.py --count 100000 --hosts 20 --save baseline.json
+    python Benchmark.py --count 100000 --hosts 20 --compare baseline.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from HostScheduler import HostScheduler
+from Metrics import Metrics
+from PageAnalyzer import RULES
+from URLVerifier import get_results
+
+
+def parse_mix(text):
+    """Parse a status mix such as '200:90,404:5,503:5'.
+
+    Args:
+        text (str): Comma separated status:weight pairs.
+
+    Returns:
+        list: Contains (status, weight) tuples.
+
+    Raises:
+        ValueError: If text is not a valid status mix.
+    """
+    mix = []
+    for part in text.split(","):
+        status, _, weight = part.partition(":")
+        mix.append((int(status), float(weight or 1)))
+    if sum(weight for _, weight in mix) <= 0:
+        raise ValueError("Invalid status mix '{}'".format(text))
+    return mix
+
+
+class Profile:
+    """Responses of the benchmark server, decided by path."""
+
+    def __init__(self, latency=0.0, jitter=0.0, mix="200", body_min=64,
+                 body_max=64, slow=0.0, slow_seconds=5.0, viewport=0.75):
+        """Initialize class variables.
+
+        Args:
+            latency (float): Seconds the server waits before answering.
+            jitter (float): Up to this many seconds are added at random.
+            mix (str): Status mix for ordinary paths; see parse_mix.
+            body_min (int): Smallest body in bytes.
+            body_max (int): Largest body in bytes.
+            slow (float): Fraction of responses trickled out slowly.
+            slow_seconds (float): Seconds a slow response takes to send.
+            viewport (float): Fraction of pages with a viewport tag.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.mix = parse_mix(mix)
+        self.body_min = body_min
+        self.body_max = max(body_min, body_max)
+        self.slow = slow
+        self.slow_seconds = slow_seconds
+        self.viewport = viewport
+
+    def response(self, path):
+        """Get the response to path.
+
+        Paths ending in '/missing' are 404; every other path gets a status
+        from self.mix.
+
+        Args:
+            path (str): Requested path.
+
+        Returns:
+            tuple: [0] = status; [1] = body (bytes); [2] = seconds to wait
+                before answering; [3] = True if trickled out slowly.
+        """
+        rng = random.Random(zlib.crc32(path.encode("utf-8")))
+        pick = rng.uniform(0, sum(weight for _, weight in self.mix))
+        for status, weight in self.mix:
+            pick -= weight
+            if pick <= 0:
+                break
+        if path.endswith("/missing"):
+            status = 404
+
+        head = "<title>Benchmark</title>"
+        if rng.random() < self.viewport:
+            head += ('<meta name="viewport" '
+                     'content="width=device-width, initial-scale=1">')
+        page = "<html><head>{}</head><body>".format(head)
+        size = rng.randint(self.body_min, self.body_max)
+        filler = "x" * max(0, size - len(page) - len("</body></html>"))
+        body = (page + filler + "</body></html>").encode("utf-8")
+
+        delay = self.latency + rng.uniform(0, self.jitter)
+        return status, body, delay, rng.random() < self.slow
+
+
+class BenchmarkHandler(BaseHTTPRequestHandler):
+    """Answer as the server's Profile says.
+
+    Paths ending in '/nohead' reject HEAD with 405 like some real servers.
+    Every response carries the same ETag, so conditional requests get 304.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # Buffer the response so headers and body go out in one segment;
+    # otherwise Nagle's algorithm delays every body by ~40 ms
+    wbufsize = -1
+
+    def do_GET(self):
+        """Send the response after the profile's latency."""
+        profile = self.server.profile
+        status, body, delay, slow = profile.response(self.path)
+        if delay:
+            time.sleep(delay)
+        if self.command == "HEAD" and self.path.endswith("/nohead"):
+            status = 405
+        if status == 200 and self.headers.get("If-None-Match") == '"v1"':
+            status, body = 304, b""
+
+        if not slow:
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if self.command != "HEAD":
+                self.wfile.write(body)
+            return
+
+        # Slow loris: the whole response dribbles out in ten pieces
+        head = ("HTTP/1.1 {} {}\r\nContent-Type: text/html\r\n"
+                "ETag: \"v1\"\r\nContent-Length: {}\r\n\r\n").format(
+            status, self.responses.get(status, ("",))[0], len(body))
+        data = head.encode("latin-1")
+        if self.command != "HEAD":
+            data += body
+        step = len(data) // 10 + 1
+        for i in range(0, len(data), step):
+            self.wfile.write(data[i:i + step])
+            self.wfile.flush()
+            time.sleep(profile.slow_seconds / 10.0)
+
+    do_HEAD = do_GET
+
+    def log_message(self, format, *args):
+        """Silence per-request logging."""
+
+
+class BenchmarkServer(ThreadingMixIn, HTTPServer):
+    """Threaded HTTP server with a deep listen backlog."""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, latency=0.0, profile=None):
+        """Initialize class variables."""
+        super().__init__(address, BenchmarkHandler)
+        self.profile = profile or Profile(latency=latency)
+
+    def handle_error(self, request, client_address):
+        """Ignore clients hanging up early, as the engines do by design."""
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def get_benchmark_urls(port, count, ports=None):
+    """Get count URL's pointing at the local server(s).
+
+    1 in 10 URL's is missing and 1 in 10 rejects HEAD. With ports, URL i
+    goes to host 127.0.0.(i % len(ports) + 1) on that host's port.
+
+    Args:
+        port (int): Port of the local server.
+        count (int): Number of URL's.
+        ports (None; list): Port of the server of each host.
+
+    Returns:
+        list: Contains URL's as strings.
+    """
+    ports = ports or [port]
+    urls = []
+    for i in range(count):
+        postfix = {8: "nohead", 9: "missing"}.get(i % 10, "kitas")
+        host = i % len(ports)
+        urls.append("http://127.0.0.{}:{}/traeger/{:06d}/{}".format(
+            host + 1, ports[host], i, postfix))
+    return urls
+
+
+def peak_rss_mb():
+    """Get the peak resident memory of this process in MB.
+
+    Returns:
+        float: Peak RSS in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return peak / divisor
+
+
+def run_engine(engine, ports, count, workers=650, workload="verifier",
+               timeout=30):
+    """Run engine against the local server(s) and print its measurements.
+
+    Called in the child process; stdout of the engine itself is discarded
+    and the measurements are printed as one JSON object.
+
+    Args:
+        engine (str): Engine name passed to URLVerifier.get_results.
+        ports (list): Port of the server of each host.
+        count (int): Number of URL's to check.
+        workers (int): Most requests in flight overall.
+        workload (str): 'verifier' (existence) or 'mobile' (page rules).
+        timeout (int; float): Seconds before a URL check is abandoned.
+    """
+    urls = get_benchmark_urls(ports[0], count, ports)
+    # Lift the rate limit; per-host windows still apply as in a real run
+    scheduler = HostScheduler(rate_per_host=10 ** 6)
+    metrics = Metrics(progress_every=None)
+    rules = RULES if workload == "mobile" else None
+
+    # Samples the thread count (less the sampler) while the engine runs
+    threads = [threading.active_count()]
+    running = threading.Event()
+    running.set()
+
+    def sample():
+        while running.is_set():
+            threads.append(threading.active_count() - 1)
+            time.sleep(0.05)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+
+    stdout = sys.stdout
+    start = time.perf_counter()
+    with open(os.devnull, "w") as sys.stdout:
+        checked = sum(1 for _ in get_results(urls, engine=engine,
+                                             workers=workers,
+                                             timeout=timeout,
+                                             scheduler=scheduler,
+                                             rules=rules, metrics=metrics))
+    sys.stdout = stdout
+    elapsed = time.perf_counter() - start
+    running.clear()
+    sampler.join()
+
+    total = metrics.phases["total"]
+    print(json.dumps({"checked": checked, "seconds": elapsed,
+                      "p50_ms": round(total.percentile(50) * 1000, 1),
+                      "p99_ms": round(total.percentile(99) * 1000, 1),
+                      "rss_mb": peak_rss_mb(), "threads": max(threads),
+                      "classes": dict(metrics.classes)}))
+
+
+def benchmark(engines, count, latency, workers=(650,), workload="verifier",
+              hosts=1, timeout=30, profile=None):
+    """Start the local server(s) and run every engine in a child process.
+
+    Args:
+        engines (list): Engine names to benchmark.
+        count (int): Number of URL's to check per engine.
+        latency (float): Seconds the server waits before answering (if no
+            profile is given).
+        workers (list): Worker counts to run every engine with.
+        workload (str): 'verifier' or 'mobile'; see run_engine.
+        hosts (int): Number of loopback hosts to spread URL's over.
+        timeout (int; float): Seconds before a URL check is abandoned.
+        profile (None; Profile): Responses of the server.
+
+    Returns:
+        list: Contains a dict per engine and worker count: rate (URL's/sec),
+            p50_ms, p99_ms, rss_mb, threads and the result classes.
+    """
+    profile = profile or Profile(latency=latency)
+    servers = [BenchmarkServer(("127.0.0.{}".format(host + 1), 0),
+                               profile=profile) for host in range(hosts)]
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    ports = ",".join(str(server.server_address[1]) for server in servers)
+
+    rows = []
+    try:
+        for engine in engines:
+            for worker_count in workers:
+                args = [sys.executable, os.path.abspath(__file__),
+                        "--child", engine, "--ports", ports,
+                        "--count", str(count), "--workers", str(worker_count),
+                        "--workload", workload, "--timeout", str(timeout)]
+                output = subprocess.check_output(args, cwd=os.path.dirname(
+                    os.path.abspath(__file__)))
+                row = json.loads(output.decode().splitlines()[-1])
+                row.update(engine=engine, workers=worker_count,
+                           workload=workload,
+                           rate=row["checked"] / row["seconds"])
+                rows.append(row)
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+    return rows
+
+
+def compare(rows, baseline, tolerance=0.1):
+    """Compare rows with the rows of a saved run.
+
+    Rows are matched by workload, engine and workers. A row regressed if
+    its rate fell, or its p99 latency rose, by more than tolerance.
+
+    Args:
+        rows (list): Rows as returned by benchmark().
+        baseline (list): Rows of the saved run.
+        tolerance (float): Allowed relative change (0.1 = 10%).
+
+    Returns:
+        list: Contains [engine, workers, rate change, p99 change, regressed]
+            per matched row; changes are fractions.
+    """
+    saved = {(row["workload"], row["engine"], row["workers"]): row
+             for row in baseline}
+    changes = []
+    for row in rows:
+        old = saved.get((row["workload"], row["engine"], row["workers"]))
+        if not old:
+            continue
+        rate = row["rate"] / old["rate"] - 1 if old["rate"] else 0.0
+        p99 = row["p99_ms"] / old["p99_ms"] - 1 if old["p99_ms"] else 0.0
+        changes.append([row["engine"], row["workers"], rate, p99,
+                        rate < -tolerance or p99 > tolerance])
+    return changes
+
+
+def main():
+    """Parse arguments and print the benchmark table."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="extra random latency, up to this many seconds")
+    parser.add_argument("--mix", default="200",
+                        help="status mix, e.g. 200:90,404:5,503:5")
+    parser.add_argument("--body", type=int, nargs=2, default=[64, 64],
+                        metavar=("MIN", "MAX"), help="body size in bytes")
+    parser.add_argument("--slow", type=float, default=0.0,
+                        help="fraction of slow-loris responses")
+    parser.add_argument("--slow-seconds", type=float, default=5.0)
+    parser.add_argument("--viewport", type=float, default=0.75,
+                        help="fraction of pages with a viewport tag")
+    parser.add_argument("--hosts", type=int, default=1,
+                        help="loopback hosts to spread URL's over")
+    parser.add_argument("--engines", nargs="+", default=["async", "thread"])
+    parser.add_argument("--workers", type=int, nargs="+", default=[650])
+    parser.add_argument("--workload", choices=["verifier", "mobile"],
+                        default="verifier")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--save", metavar="FILENAME",
+                        help="save the results as JSON")
+    parser.add_argument("--compare", metavar="FILENAME",
+                        help="compare with results saved by --save")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="relative change counted as a regression")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--ports", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        ports = [int(port) for port in args.ports.split(",")]
+        run_engine(args.child, ports, args.count, args.workers[0],
+                   args.workload, args.timeout)
+        return
+
+    profile = Profile(latency=args.latency, jitter=args.jitter, mix=args.mix,
+                      body_min=args.body[0], body_max=args.body[1],
+                      slow=args.slow, slow_seconds=args.slow_seconds,
+                      viewport=args.viewport)
+    rows = benchmark(args.engines, args.count, args.latency, args.workers,
+                     args.workload, args.hosts, args.timeout, profile)
+    print("{:<8}{:>8}{:>12}{:>10}{:>10}{:>10}{:>9}".format(
+        "Engine", "Workers", "URL's/sec", "p50 ms", "p99 ms", "RSS MB",
+        "Threads"))
+    for row in rows:
+        print("{:<8}{:>8}{:>12.1f}{:>10}{:>10}{:>10.1f}{:>9}".format(
+            row["engine"], row["workers"], row["rate"], row["p50_ms"],
+            row["p99_ms"], row["rss_mb"], row["threads"]))
+
+    if args.save:
+        options = {name: value for name, value in vars(args).items()
+                   if name not in ("child", "ports", "save", "compare")}
+        with open(args.save, "w") as f:
+            json.dump({"time": time.time(), "python": sys.version,
+                       "platform": sys.platform, "options": options,
+                       "rows": rows}, f, indent=2)
+        print("Successfully saved results to '{}'!".format(args.save))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["rows"]
+        changes = compare(rows, baseline, args.tolerance)
+        if not changes:
+            print("No runs in common with '{}'".format(args.compare))
+            return
+        print("{:<8}{:>8}{:>12}{:>10}".format("Engine", "Workers", "Rate",
+                                              "p99"))
+        for engine, workers, rate, p99, regressed in changes:
+            print("{:<8}{:>8}{:>+12.1%}{:>+10.1%}{}".format(
+                engine, workers, rate, p99,
+                "  REGRESSION" if regressed else ""))
+        if any(change[4] for change in changes):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
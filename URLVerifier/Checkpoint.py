@@ -0,0 +1,145 @@
+# Checkpoint - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""Checkpoint journals checked URL's to a SQLite file so runs can resume.
+
+Every result is recorded as soon as it arrives. If a run dies partway, the
+next run skips the rows already in the journal and only checks the rest.
+A URL on several rows of the sheet has one result per row, so only as many
+of its rows are skipped as it has results journaled. The final .csv file is
+then written from the journal, sorted by URL.
+"""
+import json
+import sqlite3
+import threading
+
+
+class Checkpoint:
+    """Class for Checkpoint."""
+
+    def __init__(self, filename, commit_every=1000):
+        """Initialize class variables and open (or create) the journal.
+
+        Args:
+            filename (str): Name of the SQLite journal file.
+            commit_every (int): Results recorded between commits; a crash
+                loses (and re-checks) at most this many results.
+        """
+        self.filename = filename
+        self.commit_every = commit_every
+        self.uncommitted = 0
+        self.skipped = 0
+        # URL -> journaled rows of earlier runs not yet skipped by pending()
+        self.remaining = {}
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        # url is not unique: duplicate rows of a sheet each get a result
+        self.connection.execute("CREATE TABLE IF NOT EXISTS results "
+                                "(url TEXT NOT NULL, row TEXT NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_url "
+                                "ON results (url)")
+        self.connection.commit()
+        # Rows journaled by earlier runs; those of this run are not skipped
+        self.resumed = self.connection.execute(
+            "SELECT COALESCE(MAX(rowid), 0) FROM results").fetchone()[0]
+
+    def __len__(self):
+        """Get the number of results in the journal."""
+        with self.lock:
+            cursor = self.connection.execute("SELECT COUNT(*) FROM results")
+            return cursor.fetchone()[0]
+
+    def is_done(self, url):
+        """Get whether url is already in the journal.
+
+        Args:
+            url (str): URL to look up.
+
+        Returns:
+            bool: True if url has been checked.
+        """
+        with self.lock:
+            cursor = self.connection.execute(
+                "SELECT 1 FROM results WHERE url = ?", (url,))
+            return cursor.fetchone() is not None
+
+    def pending(self, urls):
+        """Filter out rows whose result is already in the journal.
+
+        For each URL, as many rows are skipped as it has results journaled
+        by earlier runs; its other rows are passed on.
+
+        Args:
+            urls (iterable): Contains the URL of each row as a string.
+
+        Yields:
+            str: URL's of the rows that still need to be checked.
+        """
+        for url in urls:
+            with self.lock:
+                left = self.remaining.get(url)
+                if left is None:
+                    left = self.connection.execute(
+                        "SELECT COUNT(*) FROM results WHERE url = ? AND "
+                        "rowid <= ?", (url, self.resumed)).fetchone()[0]
+                skip = left > 0
+                if skip:
+                    self.remaining[url] = left - 1
+            if skip:
+                self.skipped += 1
+            else:
+                yield url
+
+    def record(self, row):
+        """Record a result row; row[0] must be the URL.
+
+        Args:
+            row (tuple; list): Result to be journaled.
+        """
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO results (url, row) VALUES (?, ?)",
+                (row[0], json.dumps(list(row))))
+            self.uncommitted += 1
+            if self.uncommitted >= self.commit_every:
+                self.connection.commit()
+                self.uncommitted = 0
+
+    def record_all(self, rows):
+        """Record every result row in rows as it arrives.
+
+        Args:
+            rows (iterable): Results to be journaled.
+        """
+        for row in rows:
+            self.record(row)
+        self.commit()
+
+    def rows(self, sort=True):
+        """Get every journaled result row.
+
+        Args:
+            sort (bool): If True, rows are ordered by URL.
+
+        Yields:
+            list: Result rows.
+        """
+        query = "SELECT row FROM results"
+        if sort:
+            query += " ORDER BY url"
+        # A separate cursor streams rows without holding them all in memory
+        cursor = self.connection.cursor()
+        for (row,) in cursor.execute(query):
+            yield json.loads(row)
+
+    def commit(self):
+        """Commit recorded results to disk."""
+        with self.lock:
+            self.connection.commit()
+            self.uncommitted = 0
+
+    def close(self):
+        """Commit and close the journal."""
+        self.commit()
+        self.connection.close()
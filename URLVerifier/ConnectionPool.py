@@ -0,0 +1,452 @@
+# ConnectionPool - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""ConnectionPool keeps persistent HTTP connections per host.
+
+Worker threads borrow a connection for one request and hand it back, so a
+sheet with thousands of links to the same host pays for one TCP connection
+(and TLS handshake) per worker instead of one per link. The number of
+connections per host is capped and idle connections are closed after a
+while.
+"""
+import http.client
+import socket
+import ssl
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+from Metrics import Metrics
+from PageAnalyzer import PageAnalyzer, get_blank, get_page_result
+
+
+class ConnectionPool:
+    """Class for ConnectionPool."""
+
+    def __init__(self, maxsize_per_host=50, idle_timeout=30, timeout=30,
+                 max_redirects=10, drain_limit=8192, max_page_bytes=262144,
+                 metrics=None):
+        """Initialize class variables.
+
+        Args:
+            maxsize_per_host (int): Maximum connections open per host.
+            idle_timeout (int; float): Seconds before an idle connection is
+                closed.
+            timeout (int; float): Socket timeout for each connection.
+            max_redirects (int): Maximum redirects followed per URL.
+            drain_limit (int): Largest body (bytes) read to keep a
+                connection alive; larger bodies close the connection.
+            max_page_bytes (int): Most bytes of a page read by analyze();
+                the download is cut off there.
+            metrics (None; Metrics): Gets the time spent in each phase of
+                every request.
+        """
+        self.maxsize_per_host = maxsize_per_host
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.drain_limit = drain_limit
+        self.max_page_bytes = max_page_bytes
+        self.metrics = metrics or Metrics(progress_every=None)
+        self.ssl_context = ssl.create_default_context()
+
+        self.lock = threading.Lock()
+        # (scheme, host, port) -> list of [connection, time last used]
+        self.idle = {}
+        # (scheme, host, port) -> semaphore limiting connections to host
+        self.slots = {}
+        self.last_sweep = time.monotonic()
+
+    def check(self, url, headers=None):
+        """Check if url exists without downloading its body.
+
+        Sends HEAD first. If the server rejects HEAD (405 / 501) a GET for
+        the first byte only is sent instead, and the connection is closed as
+        soon as its headers arrive unless the body is tiny.
+
+        Args:
+            url (str): URL to be checked.
+            headers (None; dict): Extra request headers.
+
+        Returns:
+            tuple: [0] = status code (int); [1] = reason for the verdict;
+                [2] = headers (dict, lowercase).
+        """
+        status, reason, response_headers = self.urlopen(
+            url, method="HEAD", headers=headers)
+        if status not in (405, 501):
+            reason = "HEAD {} {}".format(status, reason)
+            return status, reason, response_headers
+
+        head_status = status
+        headers = dict(headers or {}, Range="bytes=0-0")
+        status, reason, response_headers = self.urlopen(url, headers=headers)
+        reason = "GET {} {} (HEAD {})".format(status, reason, head_status)
+        return status, reason, response_headers
+
+    def analyze(self, url, rules, headers=None):
+        """Check if url exists and run rules on its page in the same GET.
+
+        The page is read only until every rule is settled (see
+        PageAnalyzer), and never past self.max_page_bytes; the connection
+        is kept only if the whole body was read.
+
+        Args:
+            url (str): URL to be checked.
+            rules (list): Rule classes (see PageAnalyzer) to run.
+            headers (None; dict): Extra request headers.
+
+        Returns:
+            tuple: [0] = status code (int); [1] = reason for the verdict;
+                [2] = headers (dict, lowercase); [3] = list of rule values
+                (blank unless the page was fetched).
+        """
+        analyzer = PageAnalyzer(rules, self.max_page_bytes)
+        status, reason, response_headers = self.urlopen(
+            url, headers=headers, reader=analyzer.read_response)
+        reason, values = get_page_result(analyzer, status, reason, rules)
+        return status, reason, response_headers, values
+
+    def urlopen(self, url, method="GET", headers=None, reader=None):
+        """Request url, following redirects up to self.max_redirects.
+
+        Args:
+            url (str): URL to be requested.
+            method (str): HTTP method to use.
+            headers (None; dict): Extra request headers.
+            reader (None; function): Called with the final response if it
+                is a 2xx, to read (some of) its body.
+
+        Returns:
+            tuple: [0] = status code (int); [1] = reason phrase;
+                [2] = headers (dict, lowercase).
+
+        Raises:
+            ValueError: If url not a valid url or redirects loop.
+            OSError: If the connection fails.
+            http.client.HTTPException: If the response is malformed.
+        """
+        for _ in range(self.max_redirects + 1):
+            status, reason, response_headers = self.request(
+                url, method=method, headers=headers, reader=reader)
+            location = response_headers.get("location")
+            if status not in (301, 302, 303, 307, 308) or not location:
+                return status, reason, response_headers
+            url = urljoin(url, location)
+        raise ValueError("Too many redirects: {}".format(url))
+
+    def request(self, url, method="GET", headers=None, reader=None):
+        """Send a single request over a pooled connection.
+
+        Only the status line and headers are read, unless reader reads the
+        body of a 2xx response. A body left unread is drained (so the
+        connection can be reused) if it is at most self.drain_limit bytes
+        long; otherwise the connection is closed. A reused connection that
+        the server has since closed is retried once on a fresh connection.
+
+        Args:
+            url (str): URL to be requested.
+            method (str): HTTP method to use.
+            headers (None; dict): Extra request headers.
+            reader (None; function): Called with a 2xx response to read
+                (some of) its body.
+
+        Returns:
+            tuple: [0] = status code (int); [1] = reason phrase;
+                [2] = headers (dict, lowercase).
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError("Invalid URL: {}".format(url))
+
+        key = (parts.scheme, parts.hostname,
+               parts.port or (443 if parts.scheme == "https" else 80))
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        request_headers = {"Host": parts.netloc.rpartition("@")[2],
+                           "User-Agent": "URLVerifier",
+                           "Accept": "*/*"}
+        request_headers.update(headers or {})
+
+        connection, reused = self.get(key)
+        try:
+            try:
+                if not reused:
+                    self.open(connection, key)
+                response = self.send(connection, method, path,
+                                     request_headers)
+            except (http.client.RemoteDisconnected, ConnectionError):
+                if not reused:
+                    raise
+                connection.close()
+                connection = self.connect(key)
+                self.open(connection, key)
+                response = self.send(connection, method, path,
+                                     request_headers)
+
+            start = time.monotonic()
+            if reader and 200 <= response.status < 300:
+                reader(response)
+                # The response closes itself once its body is fully read
+                reusable = response.isclosed() and not response.will_close
+            else:
+                # http.client sets length to 0 for HEAD, None for chunked
+                reusable = (response.length is not None and
+                            response.length <= self.drain_limit)
+                if reusable:
+                    response.read()
+                    reusable = not response.will_close
+            self.metrics.phase("body", time.monotonic() - start)
+            response_headers = {name.lower(): value
+                                for name, value in response.getheaders()}
+        except BaseException:
+            connection.close()
+            self.put(key, None)
+            raise
+
+        if not reusable:
+            connection.close()
+        self.put(key, connection if reusable else None)
+        return response.status, response.reason, response_headers
+
+    def send(self, connection, method, path, headers):
+        """Send a request on connection and return its response.
+
+        The time until the response headers arrive is recorded as the
+        first_byte phase.
+
+        Args:
+            connection (http.client.HTTPConnection): Connection to use.
+            method (str): HTTP method to use.
+            path (str): Path and query to request.
+            headers (dict): Request headers.
+
+        Returns:
+            http.client.HTTPResponse: Response with unread body.
+        """
+        start = time.monotonic()
+        connection.request(method, path, headers=headers)
+        response = connection.getresponse()
+        self.metrics.phase("first_byte", time.monotonic() - start)
+        return response
+
+    def open(self, connection, key):
+        """Connect a new connection, timing TCP connect and TLS separately.
+
+        Args:
+            connection (http.client.HTTPConnection): Connection made by
+                self.connect().
+            key (tuple): (scheme, host, port).
+        """
+        scheme, host, port = key
+        start = time.monotonic()
+        http.client.HTTPConnection.connect(connection)
+        self.metrics.phase("connect", time.monotonic() - start)
+        if scheme == "https":
+            start = time.monotonic()
+            connection.sock = self.ssl_context.wrap_socket(
+                connection.sock, server_hostname=host)
+            self.metrics.phase("tls", time.monotonic() - start)
+
+    def connect(self, key):
+        """Make a new (not yet connected) connection for key.
+
+        Args:
+            key (tuple): (scheme, host, port).
+
+        Returns:
+            http.client.HTTPConnection: New connection.
+        """
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(
+                host, port, timeout=self.timeout, context=self.ssl_context)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def get(self, key):
+        """Borrow a connection for key, waiting for a free slot if needed.
+
+        Args:
+            key (tuple): (scheme, host, port).
+
+        Returns:
+            tuple: [0] = connection; [1] = True if it was reused.
+        """
+        with self.lock:
+            slots = self.slots.get(key)
+            if slots is None:
+                slots = threading.BoundedSemaphore(self.maxsize_per_host)
+                self.slots[key] = slots
+        slots.acquire()
+
+        now = time.monotonic()
+        with self.lock:
+            idle = self.idle.get(key, [])
+            while idle:
+                connection, last_used = idle.pop()
+                if now - last_used < self.idle_timeout:
+                    return connection, True
+                connection.close()
+        return self.connect(key), False
+
+    def put(self, key, connection):
+        """Return a borrowed connection to the pool and free its slot.
+
+        Args:
+            key (tuple): (scheme, host, port).
+            connection (None; http.client.HTTPConnection): Connection to
+                keep for reuse, or None if it was closed.
+        """
+        now = time.monotonic()
+        with self.lock:
+            if connection is not None:
+                self.idle.setdefault(key, []).append([connection, now])
+            sweep = now - self.last_sweep >= self.idle_timeout
+            if sweep:
+                self.last_sweep = now
+        self.slots[key].release()
+
+        if sweep:
+            self.evict_idle()
+
+    def evict_idle(self):
+        """Close connections that have been idle for self.idle_timeout."""
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            for key, idle in list(self.idle.items()):
+                fresh = []
+                for connection, last_used in idle:
+                    if now - last_used < self.idle_timeout:
+                        fresh.append([connection, last_used])
+                    else:
+                        expired.append(connection)
+                if fresh:
+                    self.idle[key] = fresh
+                else:
+                    del self.idle[key]
+        for connection in expired:
+            connection.close()
+
+    def close(self):
+        """Close every idle connection."""
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                connection.close()
+
+
+def exists(status):
+    """Get whether status means the checked URL exists.
+
+    416 (Range Not Satisfiable) answers a ranged GET for an empty resource.
+
+    Args:
+        status (int): Status code of the final response.
+
+    Returns:
+        bool: True if the URL exists.
+    """
+    return 200 <= status < 300 or status == 416
+
+
+def describe_error(error):
+    """Get a short reason for a failed check from error.
+
+    Args:
+        error (Exception): Error raised while checking a URL.
+
+    Returns:
+        str: Reason for the verdict.
+    """
+    if isinstance(error, (socket.timeout, TimeoutError)):
+        return "Timed out"
+    if isinstance(error, socket.gaierror):
+        if error.errno == socket.EAI_AGAIN:
+            return "DNS lookup failed temporarily"
+        return "DNS lookup failed"
+    if isinstance(error, ssl.SSLError):
+        return "TLS error: {}".format(error)
+    if isinstance(error, OSError):
+        return "Connection failed: {}".format(error)
+    if isinstance(error, http.client.HTTPException):
+        return "Bad response: {!r}".format(error)
+    return str(error)
+
+
+def pushed_back(result):
+    """Get whether a check result shows its host pushing back.
+
+    Used by HostScheduler to shrink the host's concurrency window.
+
+    Args:
+        result (tuple): Result as returned by URLVerifier.fetch_url.
+
+    Returns:
+        bool: True for 429 / 503, timeouts and failed connections.
+    """
+    status, reason = result[2], result[3]
+    return (status in (429, 503) or reason == "Timed out" or
+            reason.startswith("Connection failed"))
+
+
+def get_result(url, status, reason, entry=None, cache=None, values=None):
+    """Get the result tuple of a check.
+
+    A 304 answer to a conditional request reuses the cached result (and
+    marks it as just checked). Other results are kept in the cache by
+    store_result, once it is known they are not retried.
+
+    Args:
+        url (str): URL that was checked.
+        status (int): Status code of the final response.
+        reason (str): Reason for the verdict.
+        entry (None; dict): Cached result the request was conditional on.
+        cache (None; ResultCache): Cache entry was taken from.
+        values (None; list): Values of page rules (see PageAnalyzer).
+
+    Returns:
+        tuple: [0] = url; [1] = string ('Exist' or 'Don't Exist');
+            [2] = status code; [3] = reason for the verdict;
+            [4:] = values (if any).
+    """
+    if status == 304 and entry:
+        cache.refresh(url)
+        verdict = entry["verdict"]
+        reason = "{} (304 Not Modified)".format(verdict[2])
+        return (url, verdict[0], verdict[1], reason) + tuple(verdict[3:])
+
+    exist = "Exist" if exists(status) else "Don't Exist"
+    return (url, exist, status, reason) + tuple(values or [])
+
+
+def store_result(cache, result, headers):
+    """Keep the final result of a check in cache, unless it may change soon.
+
+    Only answers that are not transient are kept: 2xx, 3xx and 4xx other
+    than 408 / 429. Failures without a response and 5xx answers are checked
+    again by the next run.
+
+    Args:
+        cache (None; ResultCache): Cache to store the result in.
+        result (tuple): Result as returned by get_result (not after a 304).
+        headers (dict): Response headers (lowercase names).
+    """
+    status = result[2]
+    if (cache and status != "" and 200 <= status < 500 and
+            status not in (408, 429)):
+        cache.put(result[0], result[1:], status, headers)
+
+
+def get_error_result(url, reason, rules=None):
+    """Get the result tuple of a check that got no response.
+
+    Args:
+        url (str): URL that was checked.
+        reason (str): Reason for the verdict.
+        rules (None; list): Page rules run by the check, if any.
+
+    Returns:
+        tuple: As returned by get_result, with blank rule values.
+    """
+    return (url, "Don't Exist", "", reason) + tuple(get_blank(rules or []))
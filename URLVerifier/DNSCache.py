@@ -0,0 +1,199 @@
+# DNSCache - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""DNSCache resolves each host once and serves the answer from memory.
+
+prefetch() resolves all hosts of a sheet concurrently before any URL is
+fetched; hosts that fail to resolve can then be reported as dead without
+spending a fetch on them. install() puts the cache in front of
+socket.getaddrinfo, which every fetcher (http.client, asyncio, requests)
+ends up calling, so fetches hit the cache instead of the system resolver.
+
+The system resolver does not expose record TTL's, so answers are kept for
+a configured ttl (and failures for negative_ttl) before being resolved
+again. Only names that do not exist (EAI_NONAME / EAI_NODATA) count as
+dead; a temporary failure (EAI_AGAIN) is neither cached nor dead, so its
+URL's are fetched and retried as usual.
+"""
+from multiprocessing.pool import ThreadPool
+import socket
+import threading
+import time
+
+# getaddrinfo errors meaning the name has no address (not a passing failure)
+DEAD_ERRORS = (socket.EAI_NONAME, getattr(socket, "EAI_NODATA",
+                                          socket.EAI_NONAME))
+
+
+class DNSCache:
+    """Class for DNSCache."""
+
+    def __init__(self, ttl=300, negative_ttl=60, metrics=None):
+        """Initialize class variables.
+
+        Args:
+            ttl (int; float): Seconds an answer is kept.
+            negative_ttl (int; float): Seconds a failed lookup is kept.
+            metrics (None; Metrics): Gets the time of each lookup that
+                reaches the system resolver (the dns phase).
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        # host -> [expiry time, addresses or None, error or None]
+        self.entries = {}
+        self.system_getaddrinfo = socket.getaddrinfo
+
+    def resolve(self, host):
+        """Get the addresses of host, from the cache if still fresh.
+
+        Args:
+            host (str): Host name to resolve.
+
+        Returns:
+            list: getaddrinfo() results for host (port 0, SOCK_STREAM).
+
+        Raises:
+            socket.gaierror: If host does not resolve or is not a valid host
+                name (cached as well, unless the failure is temporary).
+        """
+        host = host.lower()
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(host)
+        if entry is None or entry[0] <= now:
+            try:
+                addresses = self.system_getaddrinfo(host, 0, 0,
+                                                    socket.SOCK_STREAM)
+            except socket.gaierror as e:
+                if e.errno not in DEAD_ERRORS:
+                    # Temporary (EAI_AGAIN) or resolver trouble: ask again
+                    # next time rather than failing every fetch of host
+                    raise
+                entry = [now + self.negative_ttl, None, e]
+            except ValueError as e:
+                # The idna codec rejects malformed names (e.g. 'a..b', or a
+                # label over 63 characters) with UnicodeError
+                error = socket.gaierror(socket.EAI_NONAME,
+                                        "Invalid host name: {}".format(e))
+                entry = [now + self.negative_ttl, None, error]
+            else:
+                entry = [now + self.ttl, addresses, None]
+            if self.metrics:
+                self.metrics.phase("dns", time.monotonic() - now)
+            with self.lock:
+                self.entries[host] = entry
+
+        if entry[2] is not None:
+            raise entry[2]
+        return entry[1]
+
+    def is_dead(self, host):
+        """Get whether host failed to resolve.
+
+        Args:
+            host (str): Host name to look up.
+
+        Returns:
+            bool: True if host has no address or is not a valid name; False
+                if it resolves or the lookup failed only temporarily.
+        """
+        try:
+            self.resolve(host)
+        except socket.gaierror as e:
+            return e.errno in DEAD_ERRORS
+        except ValueError:
+            return True
+        return False
+
+    def prefetch(self, hosts, workers=100):
+        """Resolve hosts concurrently and cache the answers.
+
+        Args:
+            hosts (iterable): Host names to resolve.
+            workers (int): Number of lookups in flight.
+
+        Returns:
+            set: Hosts that failed to resolve.
+        """
+        hosts = [host for host in set(hosts) if host]
+        if not hosts:
+            return set()
+
+        thread = ThreadPool(min(workers, len(hosts)))
+        try:
+            dead = thread.map(self.is_dead, hosts)
+        finally:
+            thread.close()
+        return set(host for host, is_dead in zip(hosts, dead) if is_dead)
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        """Drop-in replacement for socket.getaddrinfo backed by the cache.
+
+        Only plain TCP lookups of host names are cached; anything else goes
+        straight to the system resolver.
+
+        Args:
+            host (str): Host name to resolve.
+            port (None; int; str): Port (or service name) to connect to.
+            family (int): Address family to filter by (0 for any).
+            type (int): Socket type.
+            proto (int): Protocol.
+            flags (int): getaddrinfo flags.
+
+        Returns:
+            list: getaddrinfo() results.
+        """
+        cacheable = (host and not proto and not flags and
+                     type in (0, socket.SOCK_STREAM) and not is_ip(host))
+        if not cacheable:
+            return self.system_getaddrinfo(host, port, family, type, proto,
+                                           flags)
+
+        if isinstance(host, bytes):
+            host = host.decode("idna")
+        if port is None:
+            port = 0
+        elif not isinstance(port, int):
+            if port.isdigit():
+                port = int(port)
+            else:
+                port = socket.getservbyname(port, "tcp")
+
+        addresses = []
+        for af, socktype, protocol, canonname, sockaddr in self.resolve(host):
+            if family and af != family:
+                continue
+            sockaddr = (sockaddr[0], port) + tuple(sockaddr[2:])
+            addresses.append((af, socktype, protocol, canonname, sockaddr))
+        if not addresses:
+            raise socket.gaierror(socket.EAI_FAMILY,
+                                  "No address of the requested family")
+        return addresses
+
+    def install(self):
+        """Route socket.getaddrinfo (and every fetcher) through the cache."""
+        socket.getaddrinfo = self.getaddrinfo
+
+    def uninstall(self):
+        """Restore the system socket.getaddrinfo."""
+        socket.getaddrinfo = self.system_getaddrinfo
+
+
+def is_ip(host):
+    """Get whether host is an IPv4 or IPv6 address rather than a name.
+
+    Args:
+        host (str): Host to check.
+
+    Returns:
+        bool: True for IP addresses.
+    """
+    if isinstance(host, bytes):
+        host = host.decode("ascii", "replace")
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(family, host)
+        except (socket.error, ValueError):
+            continue
+        return True
+    return False
@@ -0,0 +1,72 @@
+# ExternalSort - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""ExternalSort sorts .csv files that are too large to sort in memory.
+
+Rows are read in runs of at most run_size rows. Each run is sorted in memory
+and written to a temporary file, then all runs are merged with a k-way merge
+into the output file. Memory use is bounded by run_size, not by the size of
+the file.
+"""
+import csv
+import heapq
+import os
+import tempfile
+from itertools import islice
+from operator import itemgetter
+
+
+def sort_csv(filename_in, filename_out, column=0, header=True,
+             run_size=100000, directory=None):
+    """Sort the rows of filename_in by column and write them to filename_out.
+
+    Args:
+        filename_in (str): Name of .csv file to sort.
+        filename_out (str): Name of .csv file to write sorted rows to.
+        column (int): Index of the column to sort by.
+        header (bool): If True, the first row is kept first, unsorted.
+        run_size (int): Maximum number of rows sorted in memory at once.
+        directory (None; str): Directory for temporary run files.
+    """
+    key = itemgetter(column)
+    runs = []
+
+    try:
+        with open(filename_in, newline='') as f:
+            reader = csv.reader(f)
+            first_row = next(reader, None) if header else None
+            while True:
+                rows = sorted(islice(reader, run_size), key=key)
+                if not rows:
+                    break
+                runs.append(write_run(rows, directory))
+
+        files = [open(run, newline='') for run in runs]
+        try:
+            with open(filename_out, "w", newline='') as f:
+                writer = csv.writer(f)
+                if first_row:
+                    writer.writerow(first_row)
+                readers = [csv.reader(run_f) for run_f in files]
+                writer.writerows(heapq.merge(*readers, key=key))
+        finally:
+            for run_f in files:
+                run_f.close()
+    finally:
+        for run in runs:
+            os.remove(run)
+
+
+def write_run(rows, directory=None):
+    """Write sorted rows to a temporary .csv file.
+
+    Args:
+        rows (list): Sorted rows to be written.
+        directory (None; str): Directory for the temporary file.
+
+    Returns:
+        str: Name of the temporary file.
+    """
+    fd, filename = tempfile.mkstemp(suffix=".csv", prefix="run-",
+                                    dir=directory)
+    with open(fd, "w", newline='') as f:
+        csv.writer(f).writerows(rows)
+    return filename
@@ -0,0 +1,366 @@
+# HostScheduler - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""HostScheduler decides which URL is fetched next, and when.
+
+URL's are queued per host and handed out round-robin across hosts, so a
+sheet dominated by one host does not starve the others. Each host has:
+
+- a token bucket that caps its request rate (rate_per_host, burst), and
+- a concurrency window that grows while the host answers quickly and is
+  halved when it pushes back (429 / 503, timeouts, resets) or its latency
+  climbs well above its usual latency (AIMD, with a slow start like TCP).
+
+The scheduler itself never blocks: take() returns an item or the time to
+wait. imap_unordered() drives it with worker threads; AsyncVerifier drives
+it from its event loop.
+
+An item can be handed back with defer() to be retried after a delay. It
+waits in a heap rather than in a worker, and rejoins its host's queue
+(still subject to the host's rate and window) once the delay is over.
+"""
+from collections import deque
+import heapq
+from itertools import count
+from queue import Queue
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def get_host(url):
+    """Get the host of url, used to group URL's.
+
+    Args:
+        url (str): URL to get host from.
+
+    Returns:
+        str: Lowercase host name ('' for invalid URL's).
+    """
+    try:
+        return (urlsplit(url.strip()).hostname or "").lower()
+    except ValueError:
+        return ""
+
+
+class Deferred(Exception):
+    """Raised by a fetch function to have its item retried later."""
+
+    def __init__(self, delay, result=None):
+        """Initialize class variables.
+
+        Args:
+            delay (float): Seconds before the item is retried.
+            result: Result of the failed attempt (for congestion checks).
+        """
+        super(Deferred, self).__init__(delay)
+        self.delay = delay
+        self.result = result
+
+
+class TokenBucket:
+    """Allow rate requests per second on average, up to burst at once."""
+
+    def __init__(self, rate, burst):
+        """Initialize class variables.
+
+        Args:
+            rate (int; float): Tokens added per second.
+            burst (int; float): Maximum tokens held.
+        """
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+
+    def delay(self, now):
+        """Get seconds until a token is available (0 if one is now).
+
+        Args:
+            now (float): Current monotonic time.
+
+        Returns:
+            float: Seconds to wait.
+        """
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        """Take one token; call only after delay() returned 0."""
+        self.tokens -= 1
+
+
+class HostState:
+    """Queue, token bucket and concurrency window of one host."""
+
+    def __init__(self, rate, burst, initial_window, slow_start):
+        """Initialize class variables."""
+        self.queue = deque()
+        self.bucket = TokenBucket(rate, burst)
+        self.in_flight = 0
+        self.window = float(initial_window)
+        self.slow_start = float(slow_start)
+        self.latency = None
+        self.base_latency = None
+        self.last_decrease = 0.0
+
+
+class HostScheduler:
+    """Class for HostScheduler."""
+
+    def __init__(self, rate_per_host=25, burst=None, initial_window=4,
+                 max_window=50, latency_factor=3.0, max_pending=10000,
+                 key=get_host):
+        """Initialize class variables.
+
+        Args:
+            rate_per_host (int; float): Requests per second allowed per host.
+            burst (None; int): Requests a host may get at once
+                (default rate_per_host).
+            initial_window (int): Requests in flight per host to start with.
+            max_window (int): Most requests in flight per host.
+            latency_factor (float): A host whose recent latency exceeds its
+                usual latency by this factor is treated as congested.
+            max_pending (int): Most items queued; add() blocks beyond it.
+            key (function): Gets the host of an item.
+        """
+        self.rate_per_host = rate_per_host
+        self.burst = burst or rate_per_host
+        self.initial_window = initial_window
+        self.max_window = max_window
+        self.latency_factor = latency_factor
+        self.max_pending = max_pending
+        self.key = key
+
+        # Workers wait on self.condition, add() waits on self.room
+        lock = threading.RLock()
+        self.condition = threading.Condition(lock)
+        self.room = threading.Condition(lock)
+        self.hosts = {}
+        # Hosts that have queued items, in round-robin order
+        self.ready = deque()
+        # (due time, sequence, item) of deferred items
+        self.deferred = []
+        self.sequence = count()
+        self.pending = 0
+        self.in_flight = 0
+        self.closed = False
+
+    def add(self, item, block=True):
+        """Queue item, waiting while self.max_pending items are queued.
+
+        Args:
+            item: Item to be scheduled (URL, or anything self.key accepts).
+            block (bool): If False, never wait for room.
+        """
+        with self.condition:
+            while block and self.pending >= self.max_pending:
+                self.room.wait()
+            self.queue(item)
+            self.pending += 1
+            self.condition.notify()
+
+    def queue(self, item):
+        """Append item to its host's queue; call with the lock held.
+
+        Args:
+            item: Item to be queued.
+        """
+        host = self.key(item)
+        state = self.hosts.get(host)
+        if state is None:
+            state = HostState(self.rate_per_host, self.burst,
+                              self.initial_window, self.max_window)
+            self.hosts[host] = state
+        if not state.queue:
+            self.ready.append(host)
+        state.queue.append(item)
+
+    def defer(self, item, delay):
+        """Queue item again once delay seconds have passed.
+
+        Call before self.finish() of the failed attempt, so the scheduler
+        never looks done in between; the item holds no slot while it
+        waits. Never blocks, even if self.max_pending items are queued.
+
+        Args:
+            item: Item returned by self.take().
+            delay (float): Seconds to wait before item may be taken.
+        """
+        with self.condition:
+            heapq.heappush(self.deferred, (time.monotonic() + delay,
+                                           next(self.sequence), item))
+            self.pending += 1
+            self.condition.notify()
+
+    def close(self):
+        """Mark the input as finished; workers exit once it drains."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def done(self):
+        """Get whether every item has been added, taken and finished.
+
+        Returns:
+            bool: True if there is nothing left to schedule.
+        """
+        return self.closed and not self.pending and not self.in_flight
+
+    def take(self):
+        """Take the next item whose host has a free slot and a token.
+
+        Returns:
+            tuple: [0] = item (None if none is ready);
+                [1] = seconds until one may be (None if unknown).
+        """
+        with self.condition:
+            now = time.monotonic()
+            while self.deferred and self.deferred[0][0] <= now:
+                self.queue(heapq.heappop(self.deferred)[2])
+            wait = None
+            if self.deferred:
+                wait = self.deferred[0][0] - now
+            for _ in range(len(self.ready)):
+                host = self.ready[0]
+                self.ready.rotate(-1)
+                state = self.hosts[host]
+                if state.in_flight >= int(state.window):
+                    continue
+                delay = state.bucket.delay(now)
+                if delay:
+                    wait = delay if wait is None else min(wait, delay)
+                    continue
+
+                state.bucket.take()
+                state.in_flight += 1
+                self.in_flight += 1
+                self.pending -= 1
+                item = state.queue.popleft()
+                if not state.queue:
+                    self.ready.remove(host)
+                self.room.notify()
+                return item, 0.0
+            return None, wait
+
+    def finish(self, item, latency, congested=False):
+        """Report that item finished and adapt its host's window.
+
+        Args:
+            item: Item returned by self.take().
+            latency (float): Seconds the item took.
+            congested (bool): True if the host pushed back (429 / 503,
+                timeout, connection reset).
+        """
+        with self.condition:
+            state = self.hosts[self.key(item)]
+            state.in_flight -= 1
+            self.in_flight -= 1
+
+            # Recent latency (fast average) against the usual (slow average)
+            if state.latency is None:
+                state.latency = state.base_latency = latency
+            else:
+                state.latency += 0.3 * (latency - state.latency)
+                state.base_latency += 0.02 * (latency - state.base_latency)
+            slow = state.latency > self.latency_factor * state.base_latency
+
+            now = time.monotonic()
+            if congested or slow:
+                # Multiplicative decrease, at most once per round trip
+                if now - state.last_decrease >= state.latency:
+                    state.window = max(1.0, state.window / 2)
+                    state.slow_start = state.window
+                    state.last_decrease = now
+            elif state.window < state.slow_start:
+                state.window = min(self.max_window, state.window + 1)
+            else:
+                state.window = min(self.max_window,
+                                   state.window + 1 / state.window)
+
+            # A freed slot (or a grown window) may let another worker go
+            if self.done():
+                self.condition.notify_all()
+            else:
+                self.condition.notify(2)
+
+    def get(self):
+        """Wait for and take the next item (used by worker threads).
+
+        Returns:
+            The next item, or None once every item has finished.
+        """
+        with self.condition:
+            while True:
+                item, wait = self.take()
+                if item is not None:
+                    return item
+                if self.done():
+                    return None
+                self.condition.wait(wait)
+
+    def imap_unordered(self, func, items, workers, congested=None):
+        """Call func on every item from worker threads; yield the results.
+
+        items is read lazily by a feeder thread, at most self.max_pending
+        at a time. func may raise Deferred to have an item retried later.
+
+        Args:
+            func (function): Function to call with each item.
+            items (iterable): Items to be scheduled.
+            workers (int): Number of worker threads (most requests in
+                flight overall).
+            congested (None; function): Gets whether a result shows its
+                host pushing back.
+
+        Yields:
+            Results of func as they complete.
+        """
+        results = Queue()
+        finished = object()
+
+        def feed():
+            try:
+                for item in items:
+                    self.add(item)
+            finally:
+                self.close()
+
+        def work():
+            try:
+                while True:
+                    item = self.get()
+                    if item is None:
+                        break
+                    start = time.monotonic()
+                    try:
+                        result = func(item)
+                    except Deferred as e:
+                        self.defer(item, e.delay)
+                        self.finish(item, time.monotonic() - start,
+                                    bool(congested and congested(e.result)))
+                        continue
+                    except BaseException:
+                        self.finish(item, time.monotonic() - start, True)
+                        raise
+                    self.finish(item, time.monotonic() - start,
+                                bool(congested and congested(result)))
+                    results.put(result)
+            finally:
+                results.put(finished)
+
+        threads = [threading.Thread(target=feed)]
+        threads.extend(threading.Thread(target=work) for _ in range(workers))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        running = workers
+        while running:
+            result = results.get()
+            if result is finished:
+                running -= 1
+            else:
+                yield result
@@ -0,0 +1,274 @@
+# Metrics - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""Metrics counts what a crawl does and where its time goes.
+
+Fetchers report each finished URL (with its result) and the time spent in
+each phase of a request: DNS lookup, TCP connect, TLS handshake, waiting
+for the first byte and reading the body. Metrics keeps latency histograms
+per phase, counts results by class (ok, http_4xx, timeout, dns, ...) in
+total and per host, counts attempts that are retried, and prints a
+progress line at most once every progress_every seconds. With a
+filename, the same numbers are appended to a JSON-lines file on every
+progress tick and once more at the end.
+
+All methods are safe to call from worker threads and from the event loop.
+The lock is held only briefly, and for file writes at most once a tick.
+"""
+from bisect import bisect_left
+from collections import Counter, defaultdict
+import json
+import threading
+import time
+
+from HostScheduler import get_host
+
+PHASES = ["dns", "connect", "tls", "first_byte", "body", "total"]
+
+
+def classify(result):
+    """Get the class of a check result.
+
+    Args:
+        result (tuple): Result as returned by URLVerifier.fetch_url.
+
+    Returns:
+        str: 'ok', 'http_4xx' / 'http_5xx' / ..., or the kind of error
+            ('timeout', 'dns_temporary', 'dns', 'tls', 'connection',
+            'bad_response', 'other').
+    """
+    exist, status, reason = result[1], result[2], result[3]
+    if status != "":
+        if exist == "Exist":
+            return "ok"
+        return "http_{}xx".format(status // 100)
+
+    for prefix, error_class in (("Timed out", "timeout"),
+                                ("DNS lookup failed temporarily",
+                                 "dns_temporary"),
+                                ("DNS lookup failed", "dns"),
+                                ("TLS error", "tls"),
+                                ("Connection failed", "connection"),
+                                ("Bad response", "bad_response")):
+        if reason.startswith(prefix):
+            return error_class
+    return "other"
+
+
+class Histogram:
+    """Latency histogram with exponential buckets (1 ms to ~130 s).
+
+    Four buckets per doubling keep percentiles within ~19% of the truth,
+    fine enough to compare benchmark runs.
+    """
+
+    bounds = [0.001 * 2 ** (i / 4.0) for i in range(69)]
+
+    def __init__(self):
+        """Initialize class variables."""
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        """Count one measurement.
+
+        Args:
+            seconds (float): Measured time.
+        """
+        self.buckets[bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p):
+        """Get the upper bound of the bucket holding percentile p.
+
+        Args:
+            p (float): Percentile, 0 to 100.
+
+        Returns:
+            float: Seconds (0.0 without measurements).
+        """
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(self.bounds[i], self.max) \
+                    if i < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self):
+        """Get count, p50 / p90 / p99 (ms) and total seconds.
+
+        Returns:
+            dict: Summary of the histogram.
+        """
+        return {"count": self.count,
+                "p50_ms": round(self.percentile(50) * 1000, 1),
+                "p90_ms": round(self.percentile(90) * 1000, 1),
+                "p99_ms": round(self.percentile(99) * 1000, 1),
+                "total_s": round(self.total, 3)}
+
+
+class Metrics:
+    """Class for Metrics."""
+
+    def __init__(self, progress_every=1.0, filename=None):
+        """Initialize class variables.
+
+        Args:
+            progress_every (None; int; float): Seconds between progress
+                lines (None for no progress output).
+            filename (None; str): JSON-lines file to append snapshots to.
+        """
+        self.progress_every = progress_every
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.phases = {phase: Histogram() for phase in PHASES}
+        self.classes = Counter()
+        self.retries = Counter()
+        self.hosts = defaultdict(Counter)
+        self.done = 0
+        self.start = time.monotonic()
+        self.last_progress = self.start
+        self.file = open(filename, "a") if filename else None
+
+    def phase(self, name, seconds):
+        """Record the time spent in one phase of a request.
+
+        Args:
+            name (str): One of PHASES.
+            seconds (float): Time spent.
+        """
+        with self.lock:
+            self.phases[name].add(seconds)
+
+    def record(self, result, seconds, retried=False):
+        """Record a finished URL and print progress if it is due.
+
+        Args:
+            result (tuple): Result as returned by URLVerifier.fetch_url.
+            seconds (float): Time the whole check took.
+            retried (bool): If True, result is of an attempt that will be
+                retried; it is counted as a retry instead.
+        """
+        result_class = classify(result)
+        host = get_host(result[0])
+        now = time.monotonic()
+        with self.lock:
+            self.phases["total"].add(seconds)
+            if retried:
+                self.retries[result_class] += 1
+                return
+            self.done += 1
+            self.classes[result_class] += 1
+            self.hosts[host][result_class] += 1
+            due = (self.progress_every is not None and
+                   now - self.last_progress >= self.progress_every)
+            if due:
+                self.last_progress = now
+                snapshot = self.snapshot(now)
+        if due:
+            self.progress(snapshot)
+
+    def snapshot(self, now=None, hosts=False):
+        """Get the current numbers; call with self.lock held.
+
+        Args:
+            now (None; float): Current monotonic time.
+            hosts (bool): If True, per-host counters are included.
+
+        Returns:
+            dict: Elapsed time, URL's done and rate, result classes,
+                retried attempts by class and phase summaries.
+        """
+        elapsed = (now or time.monotonic()) - self.start
+        snapshot = {"time": time.time(), "elapsed_s": round(elapsed, 3),
+                    "done": self.done,
+                    "rate": round(self.done / elapsed, 1) if elapsed else 0.0,
+                    "classes": dict(self.classes),
+                    "retries": dict(self.retries),
+                    "phases": {name: histogram.summary()
+                               for name, histogram in self.phases.items()
+                               if histogram.count}}
+        if hosts:
+            snapshot["hosts"] = {host: dict(counts)
+                                 for host, counts in self.hosts.items()}
+        return snapshot
+
+    def progress(self, snapshot):
+        """Print a progress line and append snapshot to the metrics file.
+
+        Args:
+            snapshot (dict): Numbers as returned by self.snapshot().
+        """
+        errors = snapshot["done"] - snapshot["classes"].get("ok", 0)
+        total = snapshot["phases"].get("total", {})
+        print("{} URL's tested ({}/s), {} not ok; p50 {} ms, p99 {} ms".format(
+            snapshot["done"], snapshot["rate"], errors,
+            total.get("p50_ms", 0), total.get("p99_ms", 0)))
+        self.write(snapshot)
+
+    def write(self, snapshot):
+        """Append snapshot to the metrics file, if there is one.
+
+        Args:
+            snapshot (dict): Numbers as returned by self.snapshot().
+        """
+        if self.file:
+            with self.lock:
+                self.file.write(json.dumps(snapshot) + "\n")
+                self.file.flush()
+
+    def report(self, top_hosts=5):
+        """Get a summary of the run for the console.
+
+        Args:
+            top_hosts (int): Number of hosts with the most failures shown.
+
+        Returns:
+            str: Multi-line summary.
+        """
+        with self.lock:
+            snapshot = self.snapshot()
+            failures = Counter({host: sum(counts.values()) - counts["ok"]
+                                for host, counts in self.hosts.items()})
+
+        lines = ["{} URL's tested in {}s ({}/s)".format(
+            snapshot["done"], snapshot["elapsed_s"], snapshot["rate"])]
+        lines.append("Results: " + ", ".join(
+            "{} {}".format(name, count)
+            for name, count in Counter(snapshot["classes"]).most_common()))
+        if snapshot["retries"]:
+            lines.append("Retried: " + ", ".join(
+                "{} {}".format(name, count) for name, count in
+                Counter(snapshot["retries"]).most_common()))
+        lines.append("{:<12}{:>8}{:>10}{:>10}{:>10}{:>12}".format(
+            "Phase", "Count", "p50 ms", "p90 ms", "p99 ms", "Total s"))
+        for name in PHASES:
+            summary = snapshot["phases"].get(name)
+            if summary:
+                lines.append("{:<12}{:>8}{:>10}{:>10}{:>10}{:>12}".format(
+                    name, summary["count"], summary["p50_ms"],
+                    summary["p90_ms"], summary["p99_ms"],
+                    summary["total_s"]))
+        worst = [(host, count) for host, count in
+                 failures.most_common(top_hosts) if count]
+        if worst:
+            lines.append("Hosts with most failures: " + ", ".join(
+                "{} {}".format(host or "(none)", count)
+                for host, count in worst))
+        return "\n".join(lines)
+
+    def close(self):
+        """Write a final snapshot (with per-host counters) and close."""
+        if self.file:
+            with self.lock:
+                snapshot = self.snapshot(hosts=True)
+            snapshot["final"] = True
+            self.write(snapshot)
+            self.file.close()
+            self.file = None
@@ -0,0 +1,330 @@
+# PageAnalyzer - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""PageAnalyzer runs every check on a page in one pass over its HTML.
+
+Checks are rules: small classes that look at the tags (and text) of a page
+as it is fed in chunks and fill in one or more output columns. All rules
+share one parser, so N rules cost one download and one parse per URL.
+Scanning stops as soon as every rule is settled; rules that only look at the
+head are settled at </head> or <body>, so most pages are read only up to
+their first few KB and no document tree is built.
+
+A new check is a Rule subclass added to the rules passed to analyze()
+(RULES by default). The fetch cores of URLVerifier (ConnectionPool and
+AsyncVerifier) feed pages to PageAnalyzer.scan() as they download.
+"""
+from html.parser import HTMLParser
+
+
+def get_rel(attrs):
+    """Get the link types of a tag's rel attribute.
+
+    Args:
+        attrs (dict): Attributes of the tag.
+
+    Returns:
+        list: Lowercase link types.
+    """
+    return (attrs.get("rel") or "").lower().split()
+
+
+class Rule:
+    """Base class for a check made while a page is scanned.
+
+    A fresh instance is made for every page. Set self.done once the rule
+    has its answer so scanning can stop early.
+    """
+
+    # Output columns filled by the rule
+    headers = []
+    # True if the rule is settled once the head ends
+    head_only = True
+
+    def __init__(self):
+        """Initialize class variables."""
+        self.done = False
+
+    def start(self, tag, attrs):
+        """Look at a start tag.
+
+        Args:
+            tag (str): Lowercase tag name.
+            attrs (dict): Attributes of the tag (lowercase names).
+        """
+
+    def text(self, tag, data):
+        """Look at text (including <style> and <script> contents).
+
+        Args:
+            tag (str): Tag the text is in (the last start tag seen).
+            data (str): The text.
+        """
+
+    def values(self):
+        """Get the rule's columns for the page.
+
+        Returns:
+            list: One value per header.
+        """
+        return []
+
+
+class ViewportRule(Rule):
+    """Find <meta name="viewport"> and its content."""
+
+    headers = ["Responsive for Smartphones / Tablets (viewport)",
+               "Viewport Content"]
+
+    def __init__(self):
+        """Initialize class variables."""
+        Rule.__init__(self)
+        self.content = None
+
+    def start(self, tag, attrs):
+        """Look for the viewport meta tag."""
+        if tag == "meta" and \
+                (attrs.get("name") or "").strip().lower() == "viewport":
+            self.content = attrs.get("content") or ""
+            self.done = True
+
+    def values(self):
+        """Get whether a viewport was found, and its content."""
+        return [self.content is not None, self.content or ""]
+
+
+class LinkRule(Rule):
+    """Find the first <link> with rel (one of) self.rels; return its href."""
+
+    headers = ["Link"]
+    rels = []
+
+    def __init__(self):
+        """Initialize class variables."""
+        Rule.__init__(self)
+        self.href = ""
+
+    def start(self, tag, attrs):
+        """Look for a matching link tag."""
+        if tag == "link" and set(get_rel(attrs)) & set(self.rels):
+            self.href = attrs.get("href") or ""
+            self.done = True
+
+    def values(self):
+        """Get the href of the link ('' if none)."""
+        return [self.href]
+
+
+class CanonicalRule(LinkRule):
+    """Find <link rel="canonical">."""
+
+    headers = ["Canonical URL"]
+    rels = ["canonical"]
+
+
+class AMPRule(LinkRule):
+    """Find <link rel="amphtml">, the AMP version of the page."""
+
+    headers = ["AMP URL"]
+    rels = ["amphtml"]
+
+
+class AppleTouchIconRule(LinkRule):
+    """Find <link rel="apple-touch-icon">."""
+
+    headers = ["Apple Touch Icon"]
+    rels = ["apple-touch-icon", "apple-touch-icon-precomposed"]
+
+
+class MediaQueryRule(Rule):
+    """Count media queries in the head (media attributes and @media)."""
+
+    headers = ["Media Queries"]
+
+    def __init__(self):
+        """Initialize class variables."""
+        Rule.__init__(self)
+        self.count = 0
+
+    def start(self, tag, attrs):
+        """Count media attributes other than the catch-all ones."""
+        media = (attrs.get("media") or "").strip().lower()
+        if media and media not in ("all", "screen", "print"):
+            self.count += 1
+
+    def text(self, tag, data):
+        """Count @media blocks in inline styles."""
+        if tag == "style":
+            self.count += data.lower().count("@media")
+
+    def values(self):
+        """Get the number of media queries found."""
+        return [self.count]
+
+
+# Rules run by default, in output column order
+RULES = [ViewportRule, CanonicalRule, AMPRule, MediaQueryRule,
+         AppleTouchIconRule]
+
+
+def get_blank(rules=RULES):
+    """Get empty values for a page that could not be scanned.
+
+    Args:
+        rules (list): Rule classes.
+
+    Returns:
+        list: '' for each header of rules.
+    """
+    return [""] * len(get_headers(rules))
+
+
+def get_headers(rules=RULES):
+    """Get the output column headers of rules.
+
+    Args:
+        rules (list): Rule classes.
+
+    Returns:
+        list: Headers, in order.
+    """
+    headers = []
+    for rule in rules:
+        headers.extend(rule.headers)
+    return headers
+
+
+class PageAnalyzer(HTMLParser):
+    """Class for PageAnalyzer."""
+
+    def __init__(self, rules=RULES, max_bytes=262144):
+        """Initialize class variables.
+
+        Args:
+            rules (list): Rule classes to run on the page.
+            max_bytes (int): Most bytes scanned before giving up.
+        """
+        HTMLParser.__init__(self)
+        self.rules = [rule() for rule in rules]
+        self.max_bytes = max_bytes
+        self.read = 0
+        self.broken = False
+        self.tag = None
+        self.head_ended = False
+
+    def scan(self, chunk):
+        """Feed the next chunk of the page.
+
+        Args:
+            chunk (bytes): Next piece of the page as downloaded.
+
+        Returns:
+            bool: True once scanning can stop.
+        """
+        self.read += len(chunk)
+        # Tags are ASCII; latin-1 decodes any byte without failing
+        try:
+            self.feed(chunk.decode("latin-1"))
+        except Exception:
+            self.broken = True
+        return self.broken or self.done or self.read >= self.max_bytes
+
+    def read_response(self, response, chunk_size=4096):
+        """Scan the body of response until scanning can stop.
+
+        Args:
+            response (http.client.HTTPResponse): Response with unread body.
+            chunk_size (int): Bytes read at a time.
+        """
+        while True:
+            chunk = response.read(chunk_size)
+            if not chunk or self.scan(chunk):
+                break
+
+    @property
+    def over_budget(self):
+        """Get whether scanning stopped at self.max_bytes, unsettled."""
+        return not self.done and self.read >= self.max_bytes
+
+    @property
+    def done(self):
+        """Get whether every rule is settled, so scanning can stop."""
+        for rule in self.rules:
+            if not rule.done and not (self.head_ended and rule.head_only):
+                return False
+        return True
+
+    def handle_starttag(self, tag, attrs):
+        """Pass each start tag on to the rules still looking."""
+        if tag == "body":
+            self.head_ended = True
+        self.tag = tag
+        attrs = dict(attrs)
+        for rule in self.rules:
+            if not rule.done:
+                rule.start(tag, attrs)
+
+    def handle_endtag(self, tag):
+        """Note the end of the head."""
+        if tag == "head":
+            self.head_ended = True
+
+    def handle_data(self, data):
+        """Pass text on to the rules still looking."""
+        for rule in self.rules:
+            if not rule.done:
+                rule.text(self.tag, data)
+
+    def values(self):
+        """Get the columns of every rule.
+
+        Returns:
+            list: Values, in the order of get_headers(rules).
+        """
+        values = []
+        for rule in self.rules:
+            values.extend(rule.values())
+        return values
+
+
+def get_page_result(analyzer, status, reason, rules=RULES):
+    """Get the reason and rule values of a GET scanned by analyzer.
+
+    A page still unsettled after analyzer.max_bytes was cut off there; its
+    reason says so, and its values are those found up to that point.
+
+    Args:
+        analyzer (PageAnalyzer): Parser the body was fed to.
+        status (int): Status code of the final response.
+        reason (str): Reason phrase of the final response.
+        rules (list): Rule classes analyzer was made with.
+
+    Returns:
+        tuple: [0] = reason for the verdict; [1] = list of rule values
+            (blank unless the page was fetched).
+    """
+    reason = "GET {} {}".format(status, reason)
+    if not 200 <= status < 300:
+        return reason, get_blank(rules)
+    if analyzer.over_budget:
+        reason += " (page over {} bytes, not fully scanned)".format(
+            analyzer.max_bytes)
+    return reason, analyzer.values()
+
+
+def analyze(chunks, rules=RULES, max_bytes=262144):
+    """Scan chunks of HTML until every rule is settled.
+
+    Args:
+        chunks (iterable): Pieces of an HTML document as bytes, e.g.
+            response.iter_content().
+        rules (list): Rule classes to run.
+        max_bytes (int): Most bytes scanned before giving up.
+
+    Returns:
+        tuple: [0] = list of values, in the order of get_headers(rules);
+            [1] = number of bytes read.
+    """
+    parser = PageAnalyzer(rules, max_bytes)
+    for chunk in chunks:
+        if parser.scan(chunk):
+            break
+    return parser.values(), parser.read
@@ -0,0 +1,310 @@
+# ResultCache - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""ResultCache keeps check results on disk between runs.
+
+Results are stored in a SQLite file keyed by normalized URL, with the
+response status, its ETag / Last-Modified validators and the time of the
+check. A result younger than ttl is reused without any request; an older one
+is revalidated with a conditional request (If-None-Match /
+If-Modified-Since) and reused if the server answers 304 Not Modified. The
+least recently checked results are evicted once the cache holds more than
+max_entries. Results are only shared between caches opened with the same
+scope (e.g. the same set of checks).
+
+Shards in other processes may share the file. They commit every write, so
+the write lock is only held briefly; a lookup or write that still finds the
+file locked after timeout seconds counts as a miss (or is dropped) instead
+of failing the check.
+
+Each URL is looked up once: skip_fresh() keeps the entry of every URL it
+passes on for the fetcher to take(), and lookups never write. Fresh results
+waiting to be written spill to disk (SpillQueue) beyond max_ready.
+"""
+from collections import OrderedDict
+import json
+import sqlite3
+import threading
+import time
+
+from SpillQueue import SpillQueue
+from URLNormalizer import normalize_url
+
+
+class ResultCache:
+    """Class for ResultCache."""
+
+    def __init__(self, filename, ttl=86400, max_entries=1000000,
+                 commit_every=500, evict_every=1000, timeout=10, scope="",
+                 max_ready=10000, max_stale=20000):
+        """Initialize class variables and open (or create) the cache.
+
+        Args:
+            filename (str): Name of the SQLite cache file.
+            ttl (int; float): Seconds a result is reused without a request.
+            max_entries (int): Most results kept; least recently checked
+                ones are evicted beyond it.
+            commit_every (int): Writes between commits (1 when other
+                processes share the file).
+            evict_every (int): Writes between checks for results to evict.
+            timeout (int; float): Seconds to wait for a lock held by
+                another process.
+            scope (str): Keeps results apart from those of other scopes
+                in the same file.
+            max_ready (int): Most fresh results held in memory until they
+                are written; the rest spill to disk.
+            max_stale (int): Most entries kept for URL's passed on by
+                skip_fresh() until they are fetched.
+        """
+        self.filename = filename
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.commit_every = commit_every
+        self.evict_every = evict_every
+        self.scope = scope
+        self.max_stale = max_stale
+        self.uncommitted = 0
+        self.unevicted = 0
+        self.hits = 0
+        self.revalidated = 0
+        # Lookups and writes given up on because the file stayed locked
+        self.errors = 0
+        # Fresh results found by skip_fresh(), waiting for with_hits()
+        self.ready = SpillQueue(max_ready)
+        # Key -> entry (or None) of URL's passed on by skip_fresh(), until
+        # the fetcher takes it
+        self.stale = OrderedDict()
+
+        self.lock = threading.Lock()
+        # Shards in other processes may share the file; wait for their locks
+        self.connection = sqlite3.connect(filename, timeout=timeout,
+                                          check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache (url TEXT PRIMARY KEY, "
+            "verdict TEXT NOT NULL, status INTEGER, etag TEXT, "
+            "last_modified TEXT, checked_at REAL NOT NULL, "
+            "used_at REAL NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS cache_used_at "
+                                "ON cache (used_at)")
+        self.connection.commit()
+
+    def key(self, url):
+        """Get the key url is stored under.
+
+        Args:
+            url (str): URL to be stored.
+
+        Returns:
+            str: Normalized url, prefixed by the scope (if any).
+        """
+        if self.scope:
+            return "{} {}".format(self.scope, normalize_url(url))
+        return normalize_url(url)
+
+    def get(self, url):
+        """Get the cached result of url, fresh or not.
+
+        Args:
+            url (str): URL to look up.
+
+        Returns:
+            dict: Keys verdict (list of result columns after the URL),
+                status, etag, last_modified and fresh; None if not cached.
+        """
+        now = time.time()
+        with self.lock:
+            try:
+                row = self.connection.execute(
+                    "SELECT verdict, status, etag, last_modified, checked_at "
+                    "FROM cache WHERE url = ?", (self.key(url),)).fetchone()
+            except sqlite3.OperationalError:
+                # Locked by another process for too long: a miss
+                self.errors += 1
+                return None
+        if row is None:
+            return None
+
+        verdict, status, etag, last_modified, checked_at = row
+        return {"verdict": json.loads(verdict), "status": status,
+                "etag": etag, "last_modified": last_modified,
+                "fresh": now - checked_at < self.ttl}
+
+    def take(self, url):
+        """Get the cached result of url for fetching it.
+
+        Uses the entry skip_fresh() found, if it is still kept, instead of
+        looking url up again.
+
+        Args:
+            url (str): URL about to be fetched.
+
+        Returns:
+            dict: As returned by self.get(); None if not cached.
+        """
+        key = self.key(url)
+        with self.lock:
+            if key in self.stale:
+                return self.stale.pop(key)
+        return self.get(url)
+
+    def put(self, url, verdict, status=None, headers=None):
+        """Store the result of url.
+
+        Args:
+            url (str): URL that was checked.
+            verdict (list): Result columns after the URL.
+            status (None; int): Status code of the response.
+            headers (None; dict): Response headers (lowercase names) to
+                take the ETag / Last-Modified validators from.
+        """
+        headers = headers or {}
+        now = time.time()
+        with self.lock:
+            self.write(
+                "INSERT OR REPLACE INTO cache (url, verdict, status, etag, "
+                "last_modified, checked_at, used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.key(url), json.dumps(list(verdict)), status,
+                 headers.get("etag"), headers.get("last-modified"), now, now))
+
+    def refresh(self, url):
+        """Mark the cached result of url as just checked (after a 304).
+
+        Args:
+            url (str): URL that was revalidated.
+        """
+        now = time.time()
+        with self.lock:
+            self.write(
+                "UPDATE cache SET checked_at = ?, used_at = ? WHERE url = ?",
+                (now, now, self.key(url)))
+            self.revalidated += 1
+
+    @staticmethod
+    def validators(entry):
+        """Get conditional request headers for a cached result.
+
+        Args:
+            entry (None; dict): Cached result as returned by self.get().
+
+        Returns:
+            dict: If-None-Match / If-Modified-Since headers (may be empty).
+        """
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def skip_fresh(self, urls):
+        """Pass on URL's without a fresh cached result.
+
+        Fresh results are held for self.with_hits() instead, so they take
+        no fetch slot at all.
+
+        Args:
+            urls (iterable): Contains URL's as strings.
+
+        Yields:
+            str: URL's that need a (possibly conditional) request.
+        """
+        for url in urls:
+            entry = self.get(url)
+            if entry and entry["fresh"]:
+                self.hits += 1
+                self.ready.append((url,) + tuple(entry["verdict"]))
+                continue
+            with self.lock:
+                self.stale[self.key(url)] = entry
+                if len(self.stale) > self.max_stale:
+                    self.stale.popitem(last=False)
+            yield url
+
+    def with_hits(self, results):
+        """Yield results along with the fresh cached results.
+
+        Args:
+            results (iterable): Results of the URL's fetched.
+
+        Yields:
+            tuple: Results, fetched or cached.
+        """
+        for result in results:
+            yield result
+            while self.ready:
+                yield self.ready.popleft()
+        while self.ready:
+            yield self.ready.popleft()
+
+    def write(self, sql, parameters):
+        """Run a write; commit every self.commit_every writes.
+
+        A write that finds the file locked for too long is dropped.
+        Must be called with self.lock held.
+
+        Args:
+            sql (str): Statement to run.
+            parameters (tuple): Parameters of sql.
+        """
+        try:
+            self.connection.execute(sql, parameters)
+        except sqlite3.OperationalError:
+            self.errors += 1
+            return
+        self.uncommitted += 1
+        self.unevicted += 1
+        if self.uncommitted >= self.commit_every:
+            self.commit()
+
+    def commit(self, evict=False):
+        """Commit, evicting least recently checked results now and then.
+
+        Writes that cannot be committed (the file stayed locked) are
+        dropped. Must be called with self.lock held.
+
+        Args:
+            evict (bool): If True, results are evicted whatever the number
+                of writes since the last check.
+        """
+        self.uncommitted = 0
+        try:
+            if evict or self.unevicted >= self.evict_every:
+                self.unevicted = 0
+                self.evict()
+            self.connection.commit()
+        except sqlite3.OperationalError:
+            self.errors += 1
+            self.connection.rollback()
+
+    def evict(self):
+        """Delete least recently checked results beyond self.max_entries.
+
+        Must be called with self.lock held.
+        """
+        count = self.connection.execute(
+            "SELECT COUNT(*) FROM cache").fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM cache WHERE url IN (SELECT url FROM cache "
+                "ORDER BY used_at LIMIT ?)", (count - self.max_entries,))
+
+    def report(self):
+        """Get how many results were reused.
+
+        Returns:
+            str: Summary line for the console.
+        """
+        report = "{} results reused from cache, {} revalidated (304)".format(
+            self.hits, self.revalidated)
+        if self.errors:
+            report += ", {} lookups / writes skipped (locked)".format(
+                self.errors)
+        return report
+
+    def close(self):
+        """Commit and close the cache."""
+        with self.lock:
+            self.commit(evict=True)
+            self.connection.close()
+        self.ready.close()
@@ -0,0 +1,147 @@
+# RetryPolicy - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""RetryPolicy decides whether a failed URL check is tried again, and when.
+
+Results are classified (see Metrics.classify). Only failures that may be
+transient are retried: timeouts, failed or reset connections, temporary DNS
+failures (EAI_AGAIN) and the statuses in retry_statuses (408, 429, 500,
+502, 503, 504 by default). Names that do not resolve, TLS errors and other
+4xx answers are final at once.
+
+Retries wait a jittered exponential backoff ('full jitter': a random delay
+between 0 and base_delay * 2 ** (n - 1) for retry n, capped at max_delay), or
+longer if the server sent a Retry-After header. A Retry-After beyond
+max_retry_after ends the retries instead.
+
+The engines raise HostScheduler.Deferred with the delay, so a URL waiting
+for its retry holds no worker or connection.
+"""
+from email.utils import mktime_tz, parsedate_tz
+import random
+import threading
+import time
+
+from Metrics import classify
+
+
+def get_retry_after(headers, now=None):
+    """Get the seconds a response asks the client to wait.
+
+    Args:
+        headers (dict): Response headers (lowercase names).
+        now (None; float): Current time (time.time()).
+
+    Returns:
+        None; float: Seconds to wait (None without a valid Retry-After).
+    """
+    value = (headers or {}).get("retry-after", "").strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    return max(0.0, mktime_tz(date) - (now or time.time()))
+
+
+class RetryPolicy:
+    """Class for RetryPolicy."""
+
+    def __init__(self, attempts=3, base_delay=1.0, max_delay=60.0,
+                 max_retry_after=300.0,
+                 retry_statuses=(408, 429, 500, 502, 503, 504),
+                 retry_classes=("timeout", "connection", "dns_temporary")):
+        """Initialize class variables.
+
+        Args:
+            attempts (int): Most attempts per URL (1 for no retries).
+            base_delay (int; float): Seconds of backoff before jitter for
+                the first retry; doubled for every further retry.
+            max_delay (int; float): Most seconds of backoff.
+            max_retry_after (int; float): Most seconds a Retry-After is
+                honored; asking for longer makes the failure final.
+            retry_statuses (tuple): Status codes worth retrying.
+            retry_classes (tuple): Error classes (see Metrics.classify)
+                worth retrying.
+        """
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.retry_statuses = retry_statuses
+        self.retry_classes = retry_classes
+
+        self.lock = threading.Lock()
+        # URL -> attempts made so far, for URL's that have been retried
+        self.tries = {}
+        self.retried = 0
+        # URL's answered on a retry, and URL's failing after the last try
+        self.recovered = 0
+        self.exhausted = 0
+
+    def retryable(self, result):
+        """Get whether result is a failure worth retrying.
+
+        Args:
+            result (tuple): Result as returned by URLVerifier.fetch_url.
+
+        Returns:
+            bool: True for transient failures.
+        """
+        if result[2] != "":
+            return result[2] in self.retry_statuses
+        return classify(result) in self.retry_classes
+
+    def backoff(self, attempt):
+        """Get a jittered backoff delay before attempt.
+
+        Args:
+            attempt (int): Number of the attempt to come (2 or more).
+
+        Returns:
+            float: Seconds to wait.
+        """
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 2))
+        return random.uniform(0, ceiling)
+
+    def delay(self, url, result, headers=None):
+        """Get the seconds to wait before retrying url, if it is retried.
+
+        Every call is one finished attempt; once None is returned, url is
+        forgotten.
+
+        Args:
+            url (str): URL that was checked.
+            result (tuple): Result of the attempt.
+            headers (None; dict): Response headers (lowercase names).
+
+        Returns:
+            None; float: Seconds to wait, or None if result is final.
+        """
+        with self.lock:
+            made = self.tries.pop(url, 1)
+            if not self.retryable(result):
+                if made > 1:
+                    self.recovered += 1
+                return None
+
+            retry_after = get_retry_after(headers)
+            if made >= self.attempts or (retry_after is not None and
+                                         retry_after > self.max_retry_after):
+                if made > 1 or self.attempts > 1:
+                    self.exhausted += 1
+                return None
+
+            self.tries[url] = made + 1
+            self.retried += 1
+            return max(retry_after or 0.0, self.backoff(made + 1))
+
+    def report(self):
+        """Get a summary of the retries made.
+
+        Returns:
+            str: Retries, URL's answered on a retry and URL's still failing.
+        """
+        return ("{} retries; {} URL's answered on a retry, {} still failing "
+                "after retries".format(self.retried, self.recovered,
+                                       self.exhausted))
@@ -0,0 +1,226 @@
+# Sharder - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""Sharder splits a sheet of URL's into shards by host and merges results.
+
+A URL's shard is a stable hash of its host, so every URL of a host lands in
+the same shard and per-host rate limits still hold when shards run in
+separate processes or on separate machines. A shard is written as 'i/n'
+(shard i of n, counting from 0).
+
+Shards can be run by one process each on this machine (run_shards) or
+split into files for other machines, checked there with URLVerifier and
+merged back afterwards:
+
+Usage:
+    python Sharder.py split Links-Sheet.csv 8
+    (check Shard-0-of-8-Links-Sheet.csv ... on each machine)
+    python Sharder.py merge Links-Sheet.csv 8
+"""
+import argparse
+import csv
+import heapq
+import multiprocessing
+import os
+import zlib
+from contextlib import ExitStack
+from itertools import chain
+from operator import itemgetter
+
+from HostScheduler import get_host
+
+
+def get_shard(url, count):
+    """Get the shard of url.
+
+    zlib.crc32 is used rather than hash(), which differs between processes.
+
+    Args:
+        url (str): URL to be placed.
+        count (int): Number of shards.
+
+    Returns:
+        int: Shard index (0 to count - 1).
+    """
+    return (zlib.crc32(get_host(url).encode("utf-8")) & 0xffffffff) % count
+
+
+def parse_shard(spec):
+    """Parse a shard spec such as '2/8'.
+
+    Args:
+        spec (str): Shard index and shard count separated by '/'.
+
+    Returns:
+        tuple: [0] = shard index; [1] = shard count.
+
+    Raises:
+        ValueError: If spec is not a valid shard spec.
+    """
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError("Invalid shard '{}' (expected 'i/n')".format(spec))
+    if not 0 <= index < count:
+        raise ValueError("Invalid shard '{}' (i must be 0 to n - 1)".format(
+            spec))
+    return index, count
+
+
+def get_shard_filename(filename, index, count):
+    """Get the name of shard index of filename.
+
+    Args:
+        filename (str): Name of the whole file.
+        index (int): Shard index.
+        count (int): Number of shards.
+
+    Returns:
+        str: Name of the shard's file, next to filename.
+    """
+    directory, name = os.path.split(filename)
+    return os.path.join(directory,
+                        "Shard-{}-of-{}-{}".format(index, count, name))
+
+
+def in_shard(urls, index, count):
+    """Filter urls down to those of one shard.
+
+    Args:
+        urls (iterable): Contains URL's as strings.
+        index (int): Shard index to keep.
+        count (int): Number of shards.
+
+    Yields:
+        str: URL's of shard index.
+    """
+    for url in urls:
+        if get_shard(url, count) == index:
+            yield url
+
+
+def split_csv(filename, count, header=True):
+    """Split the rows of filename into count shard files by host.
+
+    Args:
+        filename (str): Name of .csv file to split; URL's in column 0.
+        count (int): Number of shards.
+        header (bool): If True, the first row is copied to every shard.
+
+    Returns:
+        list: Names of the shard files.
+    """
+    filenames = [get_shard_filename(filename, index, count)
+                 for index in range(count)]
+    with ExitStack() as stack:
+        f = stack.enter_context(open(filename, newline=''))
+        reader = csv.reader(f)
+        writers = [csv.writer(stack.enter_context(open(name, "w",
+                                                       newline='')))
+                   for name in filenames]
+        first_row = next(reader, None) if header else None
+        if first_row:
+            for writer in writers:
+                writer.writerow(first_row)
+        for row in reader:
+            if row and row[0].strip():
+                writers[get_shard(row[0], count)].writerow(row)
+
+    print("Successfully split '{}' into {} shards!".format(filename, count))
+    return filenames
+
+
+def merge_csv(filenames, filename_out, sort=True, header=True):
+    """Merge shard result files into filename_out.
+
+    Args:
+        filenames (list): Names of the shard result files.
+        filename_out (str): Name of .csv file to write merged rows to.
+        sort (bool): If True, the shard files are sorted by column 0 and
+            are merged in order; otherwise they are concatenated.
+        header (bool): If True, each file starts with the same header row,
+            which is written once.
+
+    Raises:
+        IOError: If a shard result file is missing.
+    """
+    missing = [name for name in filenames if not os.path.exists(name)]
+    if missing:
+        raise IOError("Missing shard results: {}".format(", ".join(missing)))
+
+    with ExitStack() as stack:
+        readers = [csv.reader(stack.enter_context(open(name, newline='')))
+                   for name in filenames]
+        first_rows = [next(reader, None) if header else None
+                      for reader in readers]
+        if sort:
+            rows = heapq.merge(*readers, key=itemgetter(0))
+        else:
+            rows = chain.from_iterable(readers)
+        with open(filename_out, "w", newline='') as f:
+            writer = csv.writer(f)
+            if first_rows and first_rows[0]:
+                writer.writerow(first_rows[0])
+            writer.writerows(rows)
+
+    print("Successfully merged {} shards to '{}'!".format(len(filenames),
+                                                          filename_out))
+
+
+def run_shards(func, filename_in, filename_out, count, processes=None,
+               **kwargs):
+    """Run func on every shard in a pool of processes, then merge results.
+
+    func is called as func(filename_in, shard_filename_out, shard=(i, n),
+    **kwargs) and must write the results of shard i to shard_filename_out.
+    Each shard gets a fresh process.
+
+    Args:
+        func (function): Module-level function checking one shard.
+        filename_in (str): Name of .csv file with every URL.
+        filename_out (str): Name of .csv file to write merged results to.
+        count (int): Number of shards.
+        processes (None; int): Shards run at once (default: CPU count).
+        kwargs: Passed on to func; sort_output (default True) also tells
+            how to merge.
+    """
+    filenames = [get_shard_filename(filename_out, index, count)
+                 for index in range(count)]
+    pool = multiprocessing.Pool(processes, maxtasksperchild=1)
+    try:
+        jobs = [pool.apply_async(func, (filename_in, name),
+                                 dict(kwargs, shard=(index, count)))
+                for index, name in enumerate(filenames)]
+        for job in jobs:
+            job.get()
+    finally:
+        pool.close()
+        pool.join()
+
+    merge_csv(filenames, filename_out, sort=kwargs.get("sort_output", True))
+    for name in filenames:
+        os.remove(name)
+
+
+def main():
+    """Parse arguments and split a sheet or merge shard results."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("action", choices=["split", "merge"])
+    parser.add_argument("filename", help="sheet of URL's, e.g. "
+                                         "Links-Sheet.csv")
+    parser.add_argument("count", type=int, help="number of shards")
+    parser.add_argument("--unsorted", action="store_true",
+                        help="merge: shard results are not sorted")
+    args = parser.parse_args()
+
+    if args.action == "split":
+        split_csv(args.filename, args.count)
+    else:
+        # Each shard file was checked on its own, giving Parsed-<shard file>
+        directory, name = os.path.split(args.filename)
+        filename_out = os.path.join(directory, "Parsed-{}".format(name))
+        filenames = [os.path.join(directory, "Parsed-{}".format(
+            os.path.basename(get_shard_filename(name, index, args.count))))
+            for index in range(args.count)]
+        merge_csv(filenames, filename_out, sort=not args.unsorted)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# SpillQueue - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""SpillQueue is a FIFO of result rows that spills to disk when it is full.
+
+Results found while URL's are read (cache hits, duplicates of a URL already
+checked) wait in a queue until the output side yields them. A long run of
+such URL's would otherwise fill memory, so beyond max_items rows are
+appended as JSON lines to a temporary file and read back from it in order.
+"""
+from collections import deque
+import json
+import tempfile
+import threading
+
+
+class SpillQueue:
+    """Class for SpillQueue."""
+
+    def __init__(self, max_items=10000, directory=None):
+        """Initialize class variables.
+
+        Args:
+            max_items (int): Most rows held in memory.
+            directory (None; str): Directory for the temporary file.
+        """
+        self.max_items = max_items
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.items = deque()
+        # Temporary file of rows beyond max_items, the offset of the next
+        # row to read from it, and the number of rows left in it
+        self.file = None
+        self.offset = 0
+        self.spilled = 0
+
+    def __len__(self):
+        """Get the number of rows queued.
+
+        Returns:
+            int: Rows in memory and on disk.
+        """
+        return len(self.items) + self.spilled
+
+    def append(self, row):
+        """Queue row at the end.
+
+        Args:
+            row (tuple): Row of JSON serializable values.
+        """
+        with self.lock:
+            if not self.spilled and len(self.items) < self.max_items:
+                self.items.append(row)
+                return
+            if self.file is None:
+                self.file = tempfile.TemporaryFile(
+                    "w+", encoding="utf-8", dir=self.directory)
+            self.file.seek(0, 2)
+            self.file.write(json.dumps(list(row)) + "\n")
+            self.spilled += 1
+
+    def popleft(self):
+        """Take the row at the front.
+
+        Returns:
+            tuple: Row queued first.
+
+        Raises:
+            IndexError: If the queue is empty.
+        """
+        with self.lock:
+            if self.items:
+                return self.items.popleft()
+            if not self.spilled:
+                raise IndexError("pop from an empty SpillQueue")
+            self.file.seek(self.offset)
+            row = tuple(json.loads(self.file.readline()))
+            self.offset = self.file.tell()
+            self.spilled -= 1
+            if not self.spilled:
+                self.file.seek(0)
+                self.file.truncate()
+                self.offset = 0
+            return row
+
+    def close(self):
+        """Remove the temporary file (if any)."""
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
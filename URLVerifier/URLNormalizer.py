@@ -0,0 +1,167 @@
+# URLNormalizer - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""URLNormalizer canonicalizes URL's so each target is fetched only once.
+
+normalize_url() treats URL's that differ only in surrounding whitespace,
+scheme / host case, a default port, a trailing slash or a fragment as the
+same URL. Deduplicator passes each canonical URL on for fetching once and
+fans its result back out to every original row that maps to it.
+
+Only the results of the last max_verdicts canonical URL's are remembered;
+a duplicate of an older one is passed on again. Duplicates waiting to be
+written spill to disk (SpillQueue), so memory stays bounded however large
+the sheet.
+"""
+from collections import OrderedDict
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+from SpillQueue import SpillQueue
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url):
+    """Get the canonical form of url.
+
+    Args:
+        url (str): URL to be normalized.
+
+    Returns:
+        str: Canonical URL (url stripped of whitespace if it can't be
+            parsed).
+    """
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    if not parts.hostname:
+        return url
+
+    scheme = parts.scheme.lower()
+    netloc = parts.hostname.lower()
+    if ":" in netloc:
+        netloc = "[{}]".format(netloc)
+    if port and port != DEFAULT_PORTS.get(scheme):
+        netloc = "{}:{}".format(netloc, port)
+    if parts.username is not None:
+        userinfo = parts.netloc.rpartition("@")[0]
+        netloc = "{}@{}".format(userinfo, netloc)
+
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/") or "/"
+
+    return urlunsplit((scheme, netloc, path, parts.query, ""))
+
+
+class Deduplicator:
+    """Class for Deduplicator."""
+
+    def __init__(self, key=normalize_url, max_verdicts=100000,
+                 max_ready=10000):
+        """Initialize class variables.
+
+        Args:
+            key (function): Gets the canonical form of a URL.
+            max_verdicts (int): Most results of canonical URL's remembered;
+                least recently used ones are forgotten beyond it.
+            max_ready (int): Most duplicates held in memory until they are
+                written; the rest spill to disk.
+        """
+        self.key = key
+        self.max_verdicts = max_verdicts
+        self.lock = threading.Lock()
+        # canonical URL -> original URL's waiting for its result (only
+        # URL's being fetched)
+        self.waiting = {}
+        # canonical URL -> result columns after the URL, least recently
+        # used first
+        self.verdicts = OrderedDict()
+        # Results of duplicates ready to be fanned out
+        self.ready = SpillQueue(max_ready)
+        self.total = 0
+        self.unique_count = 0
+        self.start = None
+
+    def unique(self, urls):
+        """Pass on each canonical URL the first time it is seen.
+
+        Args:
+            urls (iterable): Contains original URL's as strings.
+
+        Yields:
+            str: Canonical URL's to be fetched.
+        """
+        self.start = time.time()
+        for url in urls:
+            canonical = self.key(url)
+            with self.lock:
+                self.total += 1
+                verdict = self.verdicts.get(canonical)
+                if verdict is not None:
+                    self.verdicts.move_to_end(canonical)
+                    self.ready.append((url,) + verdict)
+                    continue
+                waiting = self.waiting.get(canonical)
+                if waiting is not None:
+                    waiting.append(url)
+                    continue
+                self.waiting[canonical] = [url]
+                self.unique_count += 1
+            yield canonical
+
+    def fan_out(self, results):
+        """Copy each result to every original URL of its canonical URL.
+
+        Args:
+            results (iterable): Results whose [0] is a canonical URL from
+                self.unique().
+
+        Yields:
+            tuple: Results with [0] replaced by an original URL.
+        """
+        for result in results:
+            canonical, verdict = result[0], tuple(result[1:])
+            with self.lock:
+                self.verdicts[canonical] = verdict
+                self.verdicts.move_to_end(canonical)
+                if len(self.verdicts) > self.max_verdicts:
+                    self.verdicts.popitem(last=False)
+                originals = self.waiting.pop(canonical, [])
+            for url in originals:
+                yield (url,) + verdict
+            for row in self.drain():
+                yield row
+        for row in self.drain():
+            yield row
+        self.ready.close()
+
+    def drain(self):
+        """Get duplicates that arrived after their result did.
+
+        Yields:
+            tuple: Results for duplicate original URL's.
+        """
+        while self.ready:
+            yield self.ready.popleft()
+
+    def report(self):
+        """Get the dedup ratio and an estimate of the fetch time saved.
+
+        Time saved assumes each duplicate would have cost the average time
+        per unique URL of this run.
+
+        Returns:
+            str: Summary line for the console.
+        """
+        duplicates = self.total - self.unique_count
+        ratio = float(duplicates) / self.total if self.total else 0.0
+        elapsed = time.time() - self.start if self.start else 0.0
+        per_url = elapsed / self.unique_count if self.unique_count else 0.0
+        return ("{} URL's, {} unique, {} duplicates ({:.1%}); "
+                "~{:.0f}s of fetching saved".format(
+                    self.total, self.unique_count, duplicates, ratio,
+                    duplicates * per_url))
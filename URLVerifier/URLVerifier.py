@@ -1,98 +1,430 @@
 # URLVerifier - Python 3.5 - Johnathon Kwisses (Kwistech)
 import csv
-from multiprocessing.pool import ThreadPool
-from urllib.request import urlopen
+from functools import partial
+from itertools import chain
+import os
+import time
 
+from AsyncVerifier import AsyncVerifier
+from Checkpoint import Checkpoint
+from ConnectionPool import ConnectionPool, describe_error, \
+    get_error_result, get_result, pushed_back, store_result
+from DNSCache import DNSCache
+from ExternalSort import sort_csv
+from HostScheduler import Deferred, HostScheduler, get_host
+from Metrics import Metrics
+from PageAnalyzer import get_headers
+from ResultCache import ResultCache
+from RetryPolicy import RetryPolicy
+from Sharder import get_shard_filename, in_shard, parse_shard, run_shards
+from URLNormalizer import Deduplicator
 
-def get_urls(filename):
-    """Get URL's from filename.
+# Persistent connections shared by every fetch_url thread
+connection_pool = ConnectionPool()
+
+
+def get_urls(filename, header=True, separator=None):
+    """Get URL's from filename one line at a time.
 
     Args:
         filename (str): Name of file to get URL's from.
+        header (bool): If True, the first line is skipped.
+        separator (None; str): If given, only the part of each line before
+            the first separator is the URL.
 
-    Returns:
-        list: Contains URL's as strings.
+    Yields:
+        str: URL's as strings, stripped of whitespace (blank lines are
+            skipped).
     """
     with open(filename) as urls:
-        urls = urls.readlines()
-    return urls
+        if header:
+            next(urls, None)
+        for url in urls:
+            if separator:
+                url = url.split(separator)[0]
+            url = url.strip()
+            if url:
+                yield url
 
 
-def fetch_url(url, count=[0]):
+def fetch_url(url, pool=connection_pool, mode="head", cache=None, rules=None,
+              metrics=None, retry=None):
     """Fetch url and return results in a tuple.
 
     Args:
         url (str): URL to be fetched.
+        pool (ConnectionPool): Pool to borrow a connection from.
+        mode (str): 'head' sends HEAD first and falls back to a partial GET;
+            'get' sends a GET and stops reading after its headers.
+        cache (None; ResultCache): Cache to revalidate against and store
+            the final result in.
+        rules (None; list): Rule classes (see PageAnalyzer) to run on the
+            page; if given, mode is ignored and a GET is sent.
+        metrics (None; Metrics): Gets the result and the time taken.
+        retry (None; RetryPolicy): Decides if a failure is retried.
 
     Returns:
-        tuple: [0] = url; [1] = string ('Exist' or 'Don't Exist').
+        tuple: [0] = url; [1] = string ('Exist' or 'Don't Exist');
+            [2] = status code (int, or '' without a response);
+            [3] = reason for the verdict; [4:] = rule values (if any).
 
     Raises:
-        ValueError: If url not a valid url.
-        urllib.error.HTTPError: If url not found.
+        Deferred: If the attempt failed and is to be retried (handled by
+            HostScheduler.imap_unordered).
     """
-    exist = ""
+    start = time.monotonic()
+    entry = cache.take(url) if cache else None
+    headers = ResultCache.validators(entry)
+    values = None
+    status = None
+    response_headers = {}
 
     try:
-        urlopen(url)
-    except:
-        exist = "Don't Exist"
+        if rules:
+            status, reason, response_headers, values = pool.analyze(
+                url.strip(), rules, headers=headers)
+        elif mode == "head":
+            status, reason, response_headers = pool.check(url.strip(),
+                                                           headers=headers)
+        else:
+            status, reason, response_headers = pool.urlopen(url.strip(),
+                                                            headers=headers)
+            reason = "GET {} {}".format(status, reason)
+    except Exception as e:
+        # Any failure (not only OSError / HTTPException) is reported rather
+        # than raised, so it cannot stop a worker thread
+        result = get_error_result(url, describe_error(e), rules)
     else:
-        exist = "Exist"
-    finally:
-        count[0] += 1
-        print(count[0], "URL's tested")
-        return url, exist
+        result = get_result(url, status, reason, entry, cache, values)
+
+    delay = retry.delay(url, result, response_headers) if retry else None
+    if delay is None and status not in (None, 304):
+        # Only final results are cached, never an attempt to be retried
+        store_result(cache, result, response_headers)
+    if metrics:
+        metrics.record(result, time.monotonic() - start,
+                       retried=delay is not None)
+    if delay is not None:
+        raise Deferred(delay, result)
+    return result
+
+
+def get_results(urls, engine="async", workers=650, mode="head", timeout=30,
+                scheduler=None, cache=None, rules=None, max_page_bytes=262144,
+                metrics=None, retry=None):
+    """Fetch urls with engine and return the results as they complete.
+
+    URL's are read from urls lazily; the scheduler holds a bounded number
+    of them, decides which host goes next and paces every host.
+
+    Args:
+        urls (iterable): Contains URL's as strings.
+        engine (str): 'async' (AsyncVerifier) or 'thread' (worker threads).
+        workers (int): Most requests in flight overall (threads for the
+            thread engine).
+        mode (str): 'head' (HEAD first) or 'get'; see fetch_url.
+        timeout (int; float): Seconds before a URL check is abandoned.
+        scheduler (None; HostScheduler): Scheduler for this run.
+        cache (None; ResultCache): Cache to revalidate against and store
+            results in.
+        rules (None; list): Rule classes (see PageAnalyzer) to run on each
+            page in the same request.
+        max_page_bytes (int): Most bytes of a page read for rules; larger
+            pages are cut off and their reason says so.
+        metrics (None; Metrics): Gets every result and the time spent in
+            each phase of every request (prints progress by default).
+        retry (None; RetryPolicy): Decides which failures are retried and
+            when; a URL waiting for its retry holds no worker.
+
+    Returns:
+        iterator: Yields result tuples as returned by fetch_url.
+    """
+    scheduler = scheduler or HostScheduler()
+    metrics = metrics or Metrics()
+
+    if engine == "async":
+        verifier = AsyncVerifier(limit=workers, timeout=timeout, mode=mode,
+                                 scheduler=scheduler, cache=cache,
+                                 rules=rules, max_page_bytes=max_page_bytes,
+                                 metrics=metrics, retry=retry)
+        return verifier.imap_unordered(urls)
+
+    pool = ConnectionPool(maxsize_per_host=scheduler.max_window,
+                          timeout=timeout, max_page_bytes=max_page_bytes,
+                          metrics=metrics)
+    fetch = partial(fetch_url, pool=pool, mode=mode, cache=cache, rules=rules,
+                    metrics=metrics, retry=retry)
+    return scheduler.imap_unordered(fetch, urls, workers,
+                                    congested=pushed_back)
+
+
+def get_dead_results(urls, dead_hosts, rules=None):
+    """Get results for URL's whose host does not resolve, without fetching.
 
+    Args:
+        urls (iterable): Contains URL's as strings.
+        dead_hosts (set): Hosts that failed to resolve.
+        rules (None; list): Page rules of the run (left blank).
+
+    Yields:
+        tuple: Result tuples as returned by fetch_url.
+    """
+    for url in urls:
+        if get_host(url) in dead_hosts:
+            yield get_error_result(url, "DNS lookup failed", rules)
 
-def write_lines_csv(filename, rows, header=None):
+
+def write_lines_csv(filename, rows, header=None, flush_every=1000):
     """Write rows to filename (to a .csv file only).
 
     header should contain strings with header names for
-    each column.
+    each column. rows may be any iterable (e.g. results as they complete);
+    they are written one at a time and flushed to disk every flush_every
+    rows so that a crash loses at most that many rows.
 
     Args:
         filename (str): Name of file to be written to (postfix=.csv).
-        rows (list): Contains items to be written to filename.
+        rows (iterable): Contains items to be written to filename.
         header (list): Header to be written to filename.
+        flush_every (int): Number of rows between flushes to disk.
     """
     with open(filename, "w", newline='') as f:
         writer = csv.writer(f)
         if header:
             writer.writerow(header)
-        writer.writerows(rows)
+        for i, row in enumerate(rows, 1):
+            writer.writerow(row)
+            if not i % flush_every:
+                f.flush()
 
     print("Successfully written rows to '{}'!".format(filename))
 
 
+def verify(filename_in, filename_out, shard=None, engine="async",
+           workers=650, rate_per_host=25, max_per_host=50, mode="head",
+           timeout=30, sort_output=True, checkpoint=True,
+           filename_cache="Cache-URLVerifier.db", cache_ttl=12 * 60 * 60,
+           cache_entries=1000000, dns_ttl=300, dns_workers=100,
+           separator=None, rules=None, max_page_bytes=262144,
+           progress_every=1.0, filename_metrics=None, attempts=3,
+           retry_delay=1.0, max_retry_delay=60.0):
+    """Check the URL's of filename_in and write results to filename_out.
+
+    See main() for what each setting does.
+
+    Args:
+        filename_in (str): Name of .csv file to get URL's from.
+        filename_out (str): Name of .csv file to write results to.
+        shard (None; tuple): (index, count) to check only the URL's of one
+            shard (see Sharder).
+        engine (str): 'async' or 'thread'; see get_results.
+        workers (int): Most requests in flight overall.
+        rate_per_host (int; float): Requests per second per host.
+        max_per_host (int): Most requests in flight per host.
+        mode (str): 'head' (HEAD first) or 'get'; see fetch_url.
+        timeout (int; float): Seconds before a URL check is abandoned.
+        sort_output (bool): If True, results are sorted by URL.
+        checkpoint (bool): If True, results are journaled for resuming.
+        filename_cache (str): Name of the result cache file.
+        cache_ttl (int; float): Seconds a cached result is reused.
+        cache_entries (int): Most results kept in the cache.
+        dns_ttl (int; float): Seconds DNS answers are cached.
+        dns_workers (int): Hosts resolved at once up front.
+        separator (None; str): Separator of the columns of filename_in, if
+            it has more than the URL; see get_urls.
+        rules (None; list): Rule classes (see PageAnalyzer) run on each
+            page in the same request, one or more columns each.
+        max_page_bytes (int): Most bytes of a page read for rules.
+        progress_every (None; int; float): Seconds between progress lines.
+        filename_metrics (None; str): Name of the JSON-lines file metrics
+            snapshots are appended to.
+        attempts (int): Most attempts per URL for transient failures.
+        retry_delay (int; float): Backoff before the first retry.
+        max_retry_delay (int; float): Most backoff before a retry.
+    """
+    def read_urls():
+        urls = get_urls(filename_in, separator=separator)
+        if shard:
+            urls = in_shard(urls, *shard)
+        return urls
+
+    name_in = get_shard_filename(filename_in, *shard) if shard else \
+        filename_in
+    filename_checkpoint = "Checkpoint-{}.db".format(name_in)
+    if shard and filename_metrics:
+        filename_metrics = get_shard_filename(filename_metrics, *shard)
+    metrics = Metrics(progress_every=progress_every,
+                      filename=filename_metrics)
+
+    # Resolves every host once before fetching; URL's on hosts that do not
+    # resolve are reported straight away instead of being fetched
+    dns_cache = DNSCache(ttl=dns_ttl, metrics=metrics)
+    dns_cache.install()
+    try:
+        hosts = set(get_host(url) for url in read_urls())
+        dead_hosts = dns_cache.prefetch(hosts, workers=dns_workers)
+        print(len(hosts), "hosts resolved,", len(dead_hosts), "failed")
+
+        # Get URL's and the fetch results
+        urls = (url for url in read_urls() if get_host(url) not in dead_hosts)
+        dead_urls = (url for url in read_urls() if get_host(url) in dead_hosts)
+        if checkpoint:
+            journal = Checkpoint(filename_checkpoint)
+            urls = journal.pending(urls)
+            dead_urls = journal.pending(dead_urls)
+
+        # Header of the output; page rules add their own columns
+        header = ["HTML-Address", "Exist / Don't Exist", "Status", "Reason"]
+        if rules:
+            header += get_headers(rules)
+
+        # Rows with a fresh cached result skip fetching (and deduplication);
+        # each other canonical URL is fetched once and its result copied to
+        # every row. Cached results are only reused for the same page rules
+        dedup = Deduplicator()
+        scope = "|".join(get_headers(rules)) if rules else ""
+        # Shards share the cache file, so each write is committed at once to
+        # hold its lock only briefly
+        cache = ResultCache(filename_cache, ttl=cache_ttl,
+                            max_entries=cache_entries,
+                            commit_every=1 if shard else 500, scope=scope)
+        scheduler = HostScheduler(rate_per_host=rate_per_host,
+                                  max_window=max_per_host)
+        retry = RetryPolicy(attempts=attempts, base_delay=retry_delay,
+                            max_delay=max_retry_delay)
+        results = get_results(dedup.unique(cache.skip_fresh(urls)),
+                              engine=engine, workers=workers, mode=mode,
+                              timeout=timeout, scheduler=scheduler,
+                              cache=cache, rules=rules,
+                              max_page_bytes=max_page_bytes,
+                              metrics=metrics, retry=retry)
+        results = chain(get_dead_results(dead_urls, dead_hosts, rules),
+                        cache.with_hits(dedup.fan_out(results)))
+
+        # Writes results to filename_out as they complete
+        if checkpoint:
+            journal.record_all(results)
+            print(journal.skipped, "URL's skipped (already in checkpoint)")
+            write_lines_csv(filename_out, journal.rows(sort=sort_output),
+                            header=header)
+            journal.close()
+            os.remove(filename_checkpoint)
+        elif sort_output:
+            filename_unsorted = "Unsorted-{}".format(filename_out)
+            write_lines_csv(filename_unsorted, results, header=header)
+            sort_csv(filename_unsorted, filename_out)
+            os.remove(filename_unsorted)
+            print("Successfully sorted rows to '{}'!".format(filename_out))
+        else:
+            write_lines_csv(filename_out, results, header=header)
+
+        cache.close()
+    finally:
+        # Never leave socket.getaddrinfo patched, even if the run fails
+        dns_cache.uninstall()
+    metrics.close()
+    print(dedup.report())
+    print(cache.report())
+    print(retry.report())
+    print(metrics.report())
+
+
 def main():
     """Attempt to fetch URL's and write results to a .csv file.
 
-    Note: A memory error might occur if the number of threads is too high.
-    If this occurs, set the threads variable to a smaller integer.
+    Note: A memory error might occur if the number of workers is too high
+    with the thread engine. If this occurs, set the workers variable to a
+    smaller integer.
     """
     # String variables
     filename_in = "Links-Sheet.csv"
     filename_out = "Parsed-{}".format(filename_in)
 
-    # Number of threads and chunksize to use. Careful of overload!!!
-    threads = 650
-    chunksize = 25
+    # Engine to fetch with: "async" (AsyncVerifier) or "thread"
+    engine = "async"
+
+    # Most requests in flight overall (threads for the thread engine)
+    workers = 650
+
+    # Per host: requests per second, and most requests in flight. Each
+    # host's share grows towards max_per_host while it answers quickly and
+    # is halved when it slows down or pushes back (429 / 503, timeouts)
+    rate_per_host = 25
+    max_per_host = 50
+
+    # Check mode ("head" first or full "get") and seconds allowed per URL
+    mode = "head"
+    timeout = 30
+
+    # Checks run on each page in the same request, e.g. PageAnalyzer.RULES
+    # (as URLMobile does); None checks existence only. Pages are read in
+    # small chunks and cut off after max_page_bytes, so memory stays
+    # bounded whatever the servers send
+    rules = None
+    max_page_bytes = 256 * 1024
+
+    # Sort the output by URL once all URL's are checked (done on disk)
+    sort_output = True
 
-    # Get URL's and the fetch results
-    urls = get_urls(filename_in)
-    thread = ThreadPool(threads)
-    results = thread.imap_unordered(fetch_url, urls[1:], chunksize=chunksize)
+    # Journal results so a rerun after a crash skips URL's already checked
+    checkpoint = True
 
-    # Appends results to output for writing
-    output = []
-    for url, exists in results:
-        output.append([url, exists])
-    output.sort()
+    # Results younger than cache_ttl seconds are reused without a request;
+    # older ones are revalidated with a conditional request
+    filename_cache = "Cache-URLVerifier.db"
+    cache_ttl = 12 * 60 * 60
+    cache_entries = 1000000
 
-    # Writes output to filename_out; header is optional
-    header = ["HTML-Address", "Exist / Don't Exist"]
-    write_lines_csv(filename_out, output, header=header)
+    # Seconds DNS answers are cached, and hosts resolved at once up front
+    dns_ttl = 300
+    dns_workers = 100
+
+    # Seconds between progress lines (None for none). Progress and latency
+    # per phase (dns, connect, tls, first_byte, body) are also appended as
+    # JSON lines to filename_metrics (None for no file)
+    progress_every = 1.0
+    filename_metrics = "Metrics-{}.jsonl".format(filename_in)
+
+    # Timeouts, failed connections and 408 / 429 / 5xx answers are tried up
+    # to attempts times, after a random backoff of up to retry_delay
+    # seconds doubled per retry (at most max_retry_delay), or as long as
+    # the server's Retry-After asks. Waiting URL's hold no worker
+    attempts = 3
+    retry_delay = 1.0
+    max_retry_delay = 60.0
+
+    # Split the sheet by host into shards, each checked by its own process
+    # (at most processes at once; None for one per CPU). workers is shared
+    # between the processes running at once
+    shards = 1
+    processes = None
+
+    # Check only one shard on this machine, e.g. "2/8"; the results of each
+    # machine are merged with 'python Sharder.py merge Links-Sheet.csv 8'
+    shard = None
+
+    settings = dict(engine=engine, workers=workers,
+                    rate_per_host=rate_per_host, max_per_host=max_per_host,
+                    mode=mode, timeout=timeout, sort_output=sort_output,
+                    checkpoint=checkpoint, filename_cache=filename_cache,
+                    cache_ttl=cache_ttl, cache_entries=cache_entries,
+                    dns_ttl=dns_ttl, dns_workers=dns_workers, rules=rules,
+                    max_page_bytes=max_page_bytes,
+                    progress_every=progress_every,
+                    filename_metrics=filename_metrics, attempts=attempts,
+                    retry_delay=retry_delay, max_retry_delay=max_retry_delay)
+    if shard:
+        shard = parse_shard(shard)
+        filename_out = "Parsed-{}".format(get_shard_filename(filename_in,
+                                                             *shard))
+        verify(filename_in, filename_out, shard=shard, **settings)
+    elif shards > 1:
+        running = min(shards, processes or os.cpu_count() or 1)
+        settings["workers"] = max(1, workers // running)
+        run_shards(verify, filename_in, filename_out, shards,
+                   processes=processes, **settings)
+    else:
+        verify(filename_in, filename_out, **settings)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,101 @@
+# test_asyncverifier - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""Tests for AsyncVerifier: connections are kept alive and reused."""
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import os
+from socketserver import ThreadingMixIn
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from AsyncVerifier import AsyncVerifier
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Class for Handler."""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        """Count each connection the server accepts."""
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_HEAD(self):
+        """Answer /close/ paths with 'Connection: close', others 200."""
+        self.send_response(200)
+        self.send_header("Content-Length", "5")
+        if self.path.startswith("/close/"):
+            self.send_header("Connection", "close")
+        self.end_headers()
+
+    def do_GET(self):
+        """Send a small body, chunked for /chunked/ paths."""
+        if self.path.startswith("/chunked/"):
+            self.send_response(200)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.wfile.write(b"5\r\nhello\r\n0\r\n\r\n")
+            return
+        self.do_HEAD()
+        self.wfile.write(b"hello")
+
+    def log_message(self, *args):
+        """Keep the test output quiet."""
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    """Class for Server."""
+
+    daemon_threads = True
+
+
+class TestAsyncVerifier(unittest.TestCase):
+    """Class for TestAsyncVerifier."""
+
+    def setUp(self):
+        """Serve Handler on a free local port."""
+        self.server = Server(("127.0.0.1", 0), Handler)
+        self.server.lock = threading.Lock()
+        self.server.connections = 0
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.base = "http://127.0.0.1:{}".format(self.server.server_port)
+
+    def tearDown(self):
+        """Stop the server."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def verify(self, paths, mode="head"):
+        """Check base + each path with one request in flight at a time."""
+        verifier = AsyncVerifier(limit=1, timeout=5, mode=mode)
+        urls = [self.base + path for path in paths]
+        return list(verifier.imap_unordered(urls))
+
+    def test_connection_is_reused(self):
+        """Ten HEADs to one host take one connection."""
+        results = self.verify(["/{}".format(i) for i in range(10)])
+        self.assertEqual([result[1] for result in results], ["Exist"] * 10)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_small_bodies_are_drained(self):
+        """GETs whose bodies are drained (chunked or not) reuse it too."""
+        paths = ["/{}".format(i) for i in range(5)]
+        paths += ["/chunked/{}".format(i) for i in range(5)]
+        results = self.verify(paths, mode="get")
+        self.assertEqual([result[1] for result in results], ["Exist"] * 10)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_connection_close_is_honoured(self):
+        """A 'Connection: close' response is never reused."""
+        results = self.verify(["/close/{}".format(i) for i in range(3)])
+        self.assertEqual([result[1] for result in results], ["Exist"] * 3)
+        self.assertEqual(self.server.connections, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+# test_checkpoint - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""Tests for Checkpoint: resuming a sheet with duplicate URL's."""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from Checkpoint import Checkpoint
+
+
+class TestCheckpoint(unittest.TestCase):
+    """Class for TestCheckpoint."""
+
+    def setUp(self):
+        """Make a directory for the journal."""
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "Checkpoint.db")
+
+    def tearDown(self):
+        """Remove the journal."""
+        shutil.rmtree(self.directory)
+
+    @staticmethod
+    def check(journal, urls):
+        """Check the pending rows of urls and journal their results.
+
+        Args:
+            journal (Checkpoint): Journal to resume from.
+            urls (list): URL of each row of the sheet.
+
+        Returns:
+            list: URL's that were checked.
+        """
+        checked = list(journal.pending(urls))
+        journal.record_all((url, "Exist", 200, "OK") for url in checked)
+        return checked
+
+    def test_resume_keeps_duplicate_rows(self):
+        """A resumed run writes as many rows as an uninterrupted one."""
+        sheet = ["http://a.com", "http://b.com", "http://a.com",
+                 "http://c.com", "http://a.com", "http://b.com"]
+
+        # The first run dies after journaling three of the six rows
+        journal = Checkpoint(self.filename)
+        self.check(journal, sheet[:3])
+        journal.close()
+
+        journal = Checkpoint(self.filename)
+        checked = self.check(journal, sheet)
+        rows = [row[0] for row in journal.rows()]
+        journal.close()
+
+        self.assertEqual(sorted(checked), ["http://a.com", "http://b.com",
+                                           "http://c.com"])
+        self.assertEqual(rows, sorted(sheet))
+
+    def test_rows_of_this_run_are_not_skipped(self):
+        """Duplicates of a URL journaled during the run are still checked."""
+        sheet = ["http://a.com", "http://a.com", "http://a.com"]
+        journal = Checkpoint(self.filename)
+        checked = []
+        for url in journal.pending(sheet):
+            journal.record((url, "Exist", 200, "OK"))
+            checked.append(url)
+        journal.close()
+        self.assertEqual(checked, sheet)
+
+    def test_finished_run_skips_every_row(self):
+        """Resuming a finished run checks nothing again."""
+        sheet = ["http://a.com", "http://a.com", "http://b.com"]
+        journal = Checkpoint(self.filename)
+        self.check(journal, sheet)
+        journal.close()
+
+        journal = Checkpoint(self.filename)
+        self.assertEqual(self.check(journal, sheet), [])
+        self.assertEqual(journal.skipped, 3)
+        journal.close()
+
+if __name__ == "__main__":
+    unittest.main()
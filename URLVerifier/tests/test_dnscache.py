@@ -0,0 +1,52 @@
+# test_dnscache - Python 3.5 - Johnathon Kwisses (Kwistech)
+"""Tests for DNSCache: which lookup failures make a host dead."""
+import os
+import socket
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+from ConnectionPool import describe_error, get_error_result
+from DNSCache import DNSCache
+from RetryPolicy import RetryPolicy
+
+
+def fake_getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+    """Resolve 'ok.test' and fail other names by their first label."""
+    # Like the real one, which encodes host with the idna codec first
+    host.encode("idna")
+    if host == "ok.test":
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "",
+                 ("127.0.0.1", port))]
+    errors = {"gone": socket.EAI_NONAME, "busy": socket.EAI_AGAIN}
+    raise socket.gaierror(errors[host.split(".")[0]], host)
+
+
+class TestDNSCache(unittest.TestCase):
+    """Class for TestDNSCache."""
+
+    def setUp(self):
+        """Make a cache in front of the fake resolver."""
+        self.dns_cache = DNSCache()
+        self.dns_cache.system_getaddrinfo = fake_getaddrinfo
+
+    def test_only_missing_names_are_dead(self):
+        """EAI_NONAME and bad names are dead; EAI_AGAIN is not."""
+        dead = self.dns_cache.prefetch(["ok.test", "gone.test", "busy.test",
+                                        "a..b"])
+        self.assertEqual(dead, {"gone.test", "a..b"})
+
+    def test_temporary_failure_is_retried(self):
+        """EAI_AGAIN is not cached, and its result is retried."""
+        with self.assertRaises(socket.gaierror) as context:
+            self.dns_cache.resolve("busy.test")
+        self.assertNotIn("busy.test", self.dns_cache.entries)
+
+        reason = describe_error(context.exception)
+        result = get_error_result("http://busy.test/", reason)
+        self.assertIsNotNone(RetryPolicy().delay("http://busy.test/",
+                                                 result))
+
+if __name__ == "__main__":
+    unittest.main()